@@ -25,9 +25,13 @@ AUTO_UPDATE_BASELINE_AFTER_COMPARE = True  # 比較後自動更新基準線
 SCAN_ALL_MODE = True
 # 指定啟動掃描要建立基準線的子集資料夾（留空則使用 WATCH_FOLDERS 全部）
 SCAN_TARGET_FOLDERS = []
+DISCOVERY_WORKERS = 8                   # 啟動掃描並行走訪資料夾的執行緒數（網路磁碟上 I/O 往返可重疊）
+DISCOVERY_DIR_CACHE = True              # 資料夾 mtime 未變時沿用上次掃描的清單（LOG_FOLDER/discovery_cache.json）
 MAX_CHANGES_TO_DISPLAY = 20 # 限制顯示的變更數量，0 表示不限制
 USE_LOCAL_CACHE = True
 CACHE_FOLDER = r"C:\Users\user\Desktop\watchdog\cache_folder"
+CACHE_MAX_SIZE_MB = 10240               # 本地快取容量上限，超過時依「閒置時間 × 大小」淘汰副本（0 = 不限制）
+CACHE_DEDUP = True                      # 內容相同的快取副本以硬連結共用一份
 # 嚴格模式：永不開原檔（copy 失敗則跳過處理）
 STRICT_NO_ORIGINAL_READ = True
 # 複製重試次數與退避（秒）
@@ -35,6 +39,9 @@ COPY_RETRY_COUNT = 10
 COPY_RETRY_BACKOFF_SEC = 1.0
 # （可選）分塊複製的塊大小（MB），0 表示不用分塊特別處理
 COPY_CHUNK_SIZE_MB = 4
+# 複製排程：同時複製的執行緒數（0 表示在呼叫端執行緒內直接複製）、每個伺服器/共享同時傳輸上限
+COPY_WORKERS = 4
+COPY_MAX_PER_SHARE = 2
 # 複製完成後的短暫等待（秒），給檔案系統穩定
 COPY_POST_SLEEP_SEC = 0.2
 # 複製前穩定性預檢：連續 N 次 mtime 不變才開始複製
@@ -44,25 +51,40 @@ COPY_STABILITY_MAX_WAIT_SEC = 12.0
 ENABLE_FAST_MODE = True
 # Phase 1 new controls
 QUICK_SKIP_BY_STAT = True           # 若 mtime/size 與基準線一致則直接跳過讀取
+SKIP_UNCHANGED_SHEETS_BY_CRC = True # 比較時只重新解析 zip CRC 有變動的工作表，其餘沿用基準線
 MTIME_TOLERANCE_SEC = 2.0           # mtime 容差（秒）
 POLLING_STABLE_CHECKS = 3           # 輪巡：連續多少次「無變化」才算穩定
 POLLING_COOLDOWN_SEC = 20           # 每檔案成功比較後的冷靜期（秒）
 SKIP_WHEN_TEMP_LOCK_PRESENT = True  # 偵測到 ~$ 鎖檔時延後觸碰
 # Phase 2: 複製引擎選擇
-COPY_ENGINE = 'python'              # 'python' | 'powershell' | 'robocopy'
+COPY_ENGINE = 'python'              # 'python' | 'powershell' | 'robocopy' | 'delta'（只傳輸變動的 zip 成員）| 'kernel'（copy_file_range/sendfile/reflink）
 PREFER_SUBPROCESS_FOR_XLSM = True   # 對 .xlsm 檔優先使用子程序複製
 SUBPROCESS_ENGINE_FOR_XLSM = 'robocopy'  # 'powershell' | 'robocopy'
 ENABLE_TIMEOUT = True
 FILE_TIMEOUT_SECONDS = 120
+ISOLATE_PARSE_PROCESS = True        # 在常駐子行程解析 Excel（重複使用），逾時或停止時可強制終止
 ENABLE_MEMORY_MONITOR = True
 MEMORY_LIMIT_MB = 2048
 ENABLE_RESUME = True
+STARTUP_SKIP_BY_STAT = True             # 啟動建立基準線時，mtime/size 與基準線清單一致的檔案直接略過
+# 並行建立基準線：BASELINE_BUILD_WORKERS > 1 時，複製與解析重疊進行、大檔優先
+BASELINE_BUILD_WORKERS = 1              # 同時解析的檔案數（1 = 逐一處理）
+BASELINE_COPY_WORKERS = 4               # 同時複製到本地快取的檔案數
+BASELINE_MEMORY_BUDGET_MB = 0           # 並行解析的記憶體預算（0 = 沿用 MEMORY_LIMIT_MB）
+BASELINE_MEMORY_PER_FILE_FACTOR = 6     # 估計每個檔案解析時的記憶體 = 檔案大小 × 此倍數
 FORMULA_ONLY_MODE = True
 DEBOUNCE_INTERVAL_SEC = 4
+EVENT_WORKERS = 2                       # 事件管線工作執行緒數（複製/解析/比對不佔用 watchdog 的 observer 執行緒）
+EVENT_QUEUE_MAX = 1000                  # 事件佇列上限（不同檔案數）；滿了時 observer 等待，不丟棄事件
+PIPELINE_STATS_INTERVAL_SEC = 300       # 每隔多少秒輸出一次事件管線統計（0 = 只在停止時輸出）
 
 # =========== Compression Config ============
 # 預設壓縮格式：'lz4' 用於頻繁讀寫, 'zstd' 用於長期存儲, 'gzip' 用於兼容性
 DEFAULT_COMPRESSION_FORMAT = 'lz4'  # 'lz4', 'zstd', 'gzip'
+# 基準線儲存格式：'json'（整份 JSON 後壓縮）或 'columnar'（.wdc：每張工作表一個獨立壓縮的欄式區塊，附檔頭索引）
+BASELINE_STORAGE_FORMAT = 'json'
+# columnar 基準線延遲載入：只讀檔頭（表名、digest、metadata），各工作表在第一次存取時才解碼
+LAZY_BASELINE_LOADING = True
 
 # 壓縮級別設定
 LZ4_COMPRESSION_LEVEL = 1       # LZ4: 0-16, 越高壓縮率越好但越慢
@@ -136,10 +158,19 @@ SPARSE_POLLING_DURATION_SEC = 15
 VALUE_ENGINE = 'polars_xml'
 # CSV 是否落地保存（polars 模式下除錯用；預設 False，使用 BytesIO in-memory）
 CSV_PERSIST = True  # 預設開啟（合併 CSV：<CACHE_FOLDER>/values/<baseline_key>.values.csv）
-# 公式讀取引擎：暫保留 openpyxl；之後可提供 'xml'
+# 公式讀取引擎：'openpyxl'（公式由 openpyxl 讀取，值由 VALUE_ENGINE 另讀）
+# 或 'xml'（單次串流解析每張 worksheet XML，公式與 cached 值一次取得，不需 VALUE_ENGINE）
 FORMULA_ENGINE = 'openpyxl'
+# openpyxl 公式引擎：只走訪 XML 中實際存在的儲存格（稀疏），不做 max_row × max_column 的矩形掃描
+SPARSE_CELL_ITERATION = True
+# 儲存格以整數陣列 + 共用公式/值池保存（utils/cell_store.SheetCells），取代每格一個 dict，大幅降低記憶體
+COMPACT_CELL_STORAGE = True
 # 允許的最大並發 sheet 讀取數
 MAX_SHEET_WORKERS = 4
+# 逐表平行解析（行程池，每個 worker 獨立開啟快取副本）；FORMULA_ENGINE='openpyxl' 與 'xml' 皆適用
+PARALLEL_SHEET_PARSING = True
+# 檔案小於此大小（MB）時維持單行程解析，避免行程池啟動成本
+PARALLEL_SHEET_MIN_FILE_MB = 5
 
 # =========== 歷史快照與時間線（Git/SQLite） ============
 ENABLE_HISTORY_SNAPSHOT = True
@@ -173,6 +204,8 @@ OPEN_TIMELINE_ON_START = True
 SHOW_EXTERNAL_REFRESH_CHANGES = True                 # 公式不變但外部 refresh 令結果變，是否顯示
 SUPPRESS_INTERNAL_FORMULA_CHANGE_WITH_SAME_VALUE = False  # 內部公式改變但結果相同時，是否抑制顯示
 ALWAYS_SHOW_EXTERNAL_REFRESH_UPDATE_WHEN_FORMULA_ONLY = True  # 即使 FORMULA_ONLY_MODE=True 也顯示外部 refresh
+DIFF_ENGINE = 'python'          # 'python'：逐格比對；'polars'：大型工作表以 Polars 向量化比對（未安裝 polars 時自動退回 python）
+VECTOR_DIFF_MIN_CELLS = 50000   # 新舊兩邊儲存格合計達此數量才使用向量化比對（小表逐格比對較快）
 
 # =========== 輸出清潔 ============
 REMOVE_EMOJI = True  # 移除 console/日誌輸出中的 emoji
@@ -7,11 +7,12 @@ import gzip
 import shutil
 import time
 import gc
-import threading
+import itertools
+import sqlite3
 from datetime import datetime, timedelta
 import logging
 import config.settings as settings
-from utils.helpers import save_progress, load_progress
+from utils.helpers import load_completed_files, mark_file_completed, clear_completed_files
 from utils.memory import check_memory_limit, get_memory_usage
 from utils.compression import (
     CompressionFormat, 
@@ -20,7 +21,12 @@ from utils.compression import (
     get_compression_stats,
     migrate_baseline_format
 )
-from core.excel_parser import dump_excel_cells_with_timeout, hash_excel_content, get_excel_last_author
+from core.excel_parser import build_excel_content_tree, get_excel_last_author, get_workbook_fingerprints
+from core.parse_worker import dump_excel_cells_isolated, ParseTimeout
+from utils.cache import CacheLease
+from utils.cell_store import compact_workbook, to_plain_cells
+from utils.columnar_baseline import COLUMNAR_EXTENSION, COLUMNAR_FORMAT, save_columnar_baseline
+from utils.baseline_manifest import load_manifest, stat_matches, upsert_entry, record_storage, get_entry
 
 def baseline_file_path(base_name):
     """
@@ -28,15 +34,57 @@ def baseline_file_path(base_name):
     """
     return os.path.join(settings.LOG_FOLDER, f"{base_name}.baseline.json")
 
+def _storage_format(path):
+    if path.endswith(COLUMNAR_EXTENSION):
+        return COLUMNAR_FORMAT
+    return CompressionFormat.detect_format(path)
+
+def _record_storage(base_key, path):
+    # 記錄基準線檔案的實際路徑/格式/大小/修改時間；path 為 None 表示已不存在
+    try:
+        if path:
+            st = os.stat(path)
+            record_storage(base_key, path, _storage_format(path), st.st_size, st.st_mtime)
+        else:
+            record_storage(base_key, None)
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"更新基準線清單失敗: {base_key}: {e}")
+
+def _stored_baseline_file(base_name):
+    """基準線清單記錄的實際路徑（須位於目前 LOG_FOLDER 的對應位置）；沒有記錄時返回 None"""
+    try:
+        entry = get_entry(base_name)
+    except sqlite3.Error as e:
+        logging.warning(f"讀取基準線清單失敗: {e}")
+        return None
+    stored = (entry or {}).get('storage_path')
+    if stored and stored.startswith(baseline_file_path(base_name)):
+        return stored
+    return None
+
 def get_baseline_file_with_extension(base_name):
     """
     獲取實際存在的基準線檔案路徑（包含副檔名）
+    優先使用基準線清單記錄的路徑；清單沒有記錄時才逐一探測各格式，找到後補記到清單
     """
+    stored = _stored_baseline_file(base_name)
+    if stored:
+        return stored
+    found = _probe_baseline_file(base_name)
+    if found:
+        _record_storage(base_name, found)
+    return found
+
+def _probe_baseline_file(base_name):
     base_path = baseline_file_path(base_name)
     
-    # 按優先順序檢查不同格式的檔案
-    for format_type in [settings.DEFAULT_COMPRESSION_FORMAT, 'lz4', 'zstd', 'gzip']:
-        ext = CompressionFormat.get_extension(format_type)
+    # 按優先順序檢查不同格式的檔案（columnar 為設定格式時優先）
+    exts = [CompressionFormat.get_extension(f) for f in [settings.DEFAULT_COMPRESSION_FORMAT, 'lz4', 'zstd', 'gzip']]
+    if getattr(settings, 'BASELINE_STORAGE_FORMAT', 'json') == 'columnar':
+        exts.insert(0, COLUMNAR_EXTENSION)
+    else:
+        exts.append(COLUMNAR_EXTENSION)
+    for ext in exts:
         test_path = base_path + ext
         if os.path.exists(test_path):
             return test_path
@@ -48,26 +96,50 @@ def load_baseline(baseline_file_or_base_name):
     載入基準線檔案，支援多種壓縮格式
     """
     try:
-        # 如果是基準名稱，轉換為檔案路徑
+        # 如果是基準名稱，以基準線清單取得實際檔案（不逐一探測各副檔名）
+        from utils.compression import load_compressed_file
         if not os.path.sep in baseline_file_or_base_name and not baseline_file_or_base_name.endswith('.json'):
-            base_path = baseline_file_path(baseline_file_or_base_name)
+            stored = _stored_baseline_file(baseline_file_or_base_name)
+            data = load_compressed_file(stored) if stored else None
+            if data is None:
+                # 清單沒有記錄或記錄的檔案已不存在：退回逐一探測並更正清單
+                found = _probe_baseline_file(baseline_file_or_base_name)
+                if found != stored:
+                    _record_storage(baseline_file_or_base_name, found)
+                data = load_compressed_file(found) if found else None
         else:
             base_path = baseline_file_or_base_name
-            if base_path.endswith('.gz') or base_path.endswith('.lz4') or base_path.endswith('.zst'):
+            if base_path.endswith(('.gz', '.lz4', '.zst', COLUMNAR_EXTENSION)):
                 base_path = base_path.rsplit('.', 1)[0]
-        
-        # 使用壓縮工具載入
-        from utils.compression import load_compressed_file
-        data = load_compressed_file(base_path)
+            data = load_compressed_file(base_path)
         
         # 移除所有 [DEBUG] 載入基準線的訊息
         
+        if isinstance(data, dict) and isinstance(data.get('cells'), dict):
+            try:
+                if getattr(settings, 'COMPACT_CELL_STORAGE', True):
+                    data['cells'] = compact_workbook(data['cells'])
+                else:
+                    data['cells'] = to_plain_cells(data['cells'])
+            except (KeyError, ValueError, TypeError) as e:
+                # 例如地址不是 A1 格式的舊資料：沿用原本的 dict，不讓單一基準線中斷啟動建立
+                logging.warning(f"基準線儲存格無法轉為緊湊格式，改用原始資料 {baseline_file_or_base_name}: {e}")
         return data
         
     except (FileNotFoundError, PermissionError, OSError, json.JSONDecodeError, gzip.BadGzipFile) as e:
         logging.error(f"載入基準線失敗 {baseline_file_or_base_name}: {e}")
         return None
 
+def _manifest_key(base_path):
+    name = os.path.basename(base_path)
+    return name[:-len('.baseline.json')] if name.endswith('.baseline.json') else name
+
+def _record_manifest(base_key, source_mtime, source_size, content_hash):
+    try:
+        upsert_entry(base_key, source_mtime, source_size, content_hash)
+    except sqlite3.Error as e:
+        logging.warning(f"更新基準線清單失敗: {base_key}: {e}")
+
 def save_baseline(baseline_file_or_base_name, data):
     """
     保存基準線檔案，使用設定的壓縮格式
@@ -78,7 +150,7 @@ def save_baseline(baseline_file_or_base_name, data):
             base_path = baseline_file_path(baseline_file_or_base_name)
         else:
             base_path = baseline_file_or_base_name
-            if base_path.endswith('.gz') or base_path.endswith('.lz4') or base_path.endswith('.zst'):
+            if base_path.endswith(('.gz', '.lz4', '.zst', COLUMNAR_EXTENSION)):
                 base_path = base_path.rsplit('.', 1)[0]
         
         # 移除： print(f"[DEBUG] 基準路徑: {base_path}")
@@ -94,22 +166,41 @@ def save_baseline(baseline_file_or_base_name, data):
         compression_format = settings.DEFAULT_COMPRESSION_FORMAT
         # 移除： print(f"[DEBUG] 使用格式: {compression_format}")
         
-        # 檢查是否需要清理舊格式的檔案
-        for old_format in ['gzip', 'lz4', 'zstd']:
-            if old_format != compression_format:
-                old_ext = CompressionFormat.get_extension(old_format)
-                old_file = base_path + old_ext
-                if os.path.exists(old_file):
-                    try:
-                        os.remove(old_file)
-                    except OSError as e:
-                        logging.warning(f"清理舊檔案失敗: {e}")
+        # 儲存格式：'json'（整份 JSON 壓縮）或 'columnar'（每表獨立區塊，區塊以上述格式壓縮）
+        columnar = getattr(settings, 'BASELINE_STORAGE_FORMAT', 'json') == 'columnar'
+        keep_ext = COLUMNAR_EXTENSION if columnar else CompressionFormat.get_extension(compression_format)
+        
+        # 檢查是否需要清理舊格式的檔案（清單有記錄時只需處理記錄的那一個，不逐一探測）
+        base_key = _manifest_key(base_path)
+        stored = _stored_baseline_file(base_key) if base_path == baseline_file_path(base_key) else None
+        candidates = [stored] if stored else [base_path + ext for ext in ['.gz', '.lz4', '.zst', COLUMNAR_EXTENSION]]
+        for old_file in candidates:
+            if not old_file.endswith(keep_ext):
+                try:
+                    os.remove(old_file)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.warning(f"清理舊檔案失敗: {e}")
         
         # 保存新檔案
         # 移除： print(f"[DEBUG] 開始保存壓縮檔案...")
-        actual_file = save_compressed_file(base_path, data, compression_format)
+        if columnar:
+            actual_file = save_columnar_baseline(base_path, data, compression_format)
+        else:
+            actual_file = save_compressed_file(base_path, data, compression_format)
         # 移除： print(f"[DEBUG] 保存完成: {actual_file}")
         
+        # 以單一交易同步基準線清單：來源 mtime/size、內容雜湊、zip fingerprint 與基準線檔案資訊
+        try:
+            st = os.stat(actual_file)
+            upsert_entry(base_key, data.get('source_mtime'), data.get('source_size'), data.get('content_hash'),
+                         storage_path=actual_file, storage_format=_storage_format(actual_file),
+                         stored_size=st.st_size, stored_mtime=st.st_mtime,
+                         zip_fingerprints=data.get('zip_fingerprints'))
+        except sqlite3.Error as e:
+            logging.warning(f"更新基準線清單失敗: {base_key}: {e}")
+        
         # 簡化壓縮統計顯示
         if settings.SHOW_COMPRESSION_STATS:
             stats = get_compression_stats(actual_file)
@@ -122,6 +213,23 @@ def save_baseline(baseline_file_or_base_name, data):
         logging.error(f"保存基準線檔案失敗: {e}")
         return False
 
+def _archive_candidates():
+    """
+    可歸檔的 .baseline.json.lz4：(base_key, 路徑, 修改時間)。
+    取自基準線清單（一次查詢，不需 listdir/getmtime）；清單尚無檔案記錄時退回掃描 LOG_FOLDER。
+    """
+    suffix = '.baseline.json.lz4'
+    try:
+        manifest = load_manifest()
+    except sqlite3.Error as e:
+        logging.warning(f"讀取基準線清單失敗，改為掃描資料夾: {e}")
+        manifest = {}
+    stored = [(k, e['storage_path'], e.get('stored_mtime')) for k, e in manifest.items() if e.get('storage_path')]
+    if stored:
+        return [c for c in stored if c[1].endswith(suffix)]
+    return [(name[:-len(suffix)], os.path.join(settings.LOG_FOLDER, name), None)
+            for name in os.listdir(settings.LOG_FOLDER) if name.endswith(suffix)]
+
 def archive_old_baselines():
     """
     歸檔舊的基準線檔案，轉換為高壓縮率格式
@@ -133,18 +241,15 @@ def archive_old_baselines():
         archive_threshold = datetime.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
         archive_count = 0
         
-        for filename in os.listdir(settings.LOG_FOLDER):
-            if not filename.endswith('.baseline.json.lz4'):
-                continue
-            
-            filepath = os.path.join(settings.LOG_FOLDER, filename)
-            file_mtime = datetime.fromtimestamp(os.path.getmtime(filepath))
+        for base_key, filepath, stored_mtime in _archive_candidates():
+            file_mtime = datetime.fromtimestamp(stored_mtime if stored_mtime is not None else os.path.getmtime(filepath))
             
             if file_mtime < archive_threshold:
-                print(f"[ARCHIVE] 歸檔舊基準線: {filename}")
+                print(f"[ARCHIVE] 歸檔舊基準線: {os.path.basename(filepath)}")
                 new_filepath = migrate_baseline_format(filepath, settings.ARCHIVE_COMPRESSION_FORMAT)
                 if new_filepath:
                     archive_count += 1
+                    _record_storage(base_key, new_filepath)
                     print(f"[ARCHIVE] 完成: {os.path.basename(new_filepath)}")
         
         if archive_count > 0:
@@ -153,12 +258,191 @@ def archive_old_baselines():
     except (OSError, shutil.Error) as e:
         logging.error(f"歸檔過程出錯: {e}")
 
+def _build_one_baseline(file_path, silent=False):
+    """
+    為單一檔案建立基準線，返回 { status, stats, error }。
+    status：OK / SKIP / READ_ERROR / TIMEOUT / SAVE_ERROR / UNEXPECTED_ERROR；stats 為壓縮統計（SHOW_COMPRESSION_STATS 時）。
+    """
+    # 使用包含路徑哈希的 key，避免同名不同路徑覆蓋
+    from utils.helpers import _baseline_key_for_path
+    base_key = _baseline_key_for_path(file_path)
+    cell_data = None
+    old_baseline = None
+    # 複製一次：解析、作者與 zip fingerprint 共用同一個快取副本與 zip handle
+    lease = CacheLease(file_path, silent=silent)
+    try:
+        # 舊內容雜湊由基準線清單提供，不必解壓整份舊基準線；清單沒有雜湊（舊版留下的基準線）時才載入
+        try:
+            entry = get_entry(base_key)
+        except sqlite3.Error as e:
+            logging.warning(f"讀取基準線清單失敗: {base_key}: {e}")
+            entry = None
+        if entry and entry.get('content_hash'):
+            old_hash = entry['content_hash']
+        else:
+            old_baseline = load_baseline(base_key)
+            old_hash = old_baseline['content_hash'] if old_baseline and 'content_hash' in old_baseline else None
+            old_baseline = None
+
+        if not lease.available:
+            # 無法取得副本（嚴格模式不讀原檔，或檔案已不存在）
+            return {'status': 'READ_ERROR', 'stats': None}
+        try:
+            cell_data = dump_excel_cells_isolated(file_path, show_sheet_detail=not silent, silent=silent,
+                                                  local_path=lease.local_path, raise_timeout=True)
+        except ParseTimeout:
+            # 解析子行程超過 FILE_TIMEOUT_SECONDS 已被終止（逾時只計算解析本身，不含複製時間）
+            return {'status': 'TIMEOUT', 'stats': None}
+        if cell_data is None:
+            return {'status': 'READ_ERROR', 'stats': None}
+
+        # 雜湊樹逐區塊計算；根雜湊相同即內容相同，不需與舊基準線做整本比對
+        curr_tree = build_excel_content_tree(cell_data)
+        curr_hash = curr_tree['hash'] if curr_tree else None
+        # 複製當下的 mtime/size（與解析的副本一致）
+        src_mtime, src_size = lease.source_stat or (os.path.getmtime(file_path), os.path.getsize(file_path))
+        if old_hash == curr_hash and old_hash is not None:
+            # 內容未變：以目前的 mtime/size 更新清單，下次啟動即可直接略過
+            _record_manifest(base_key, src_mtime, src_size, curr_hash)
+            return {'status': 'SKIP', 'stats': None}
+
+        baseline_data = {
+            "source_mtime": src_mtime,
+            "source_size": src_size,
+            "last_author": get_excel_last_author(file_path, lease=lease), 
+            "content_hash": curr_hash, 
+            "content_tree": curr_tree,
+            "zip_fingerprints": get_workbook_fingerprints(file_path, lease=lease),
+            "cells": cell_data
+        }
+        if not save_baseline(base_key, baseline_data):
+            return {'status': 'SAVE_ERROR', 'stats': None}
+
+        # 統計壓縮效果
+        stats = None
+        if settings.SHOW_COMPRESSION_STATS:
+            actual_file = get_baseline_file_with_extension(base_key)
+            if actual_file:
+                stats = get_compression_stats(actual_file)
+        return {'status': 'OK', 'stats': stats}
+    except (FileNotFoundError, PermissionError, OSError, json.JSONDecodeError) as e:
+        return {'status': 'UNEXPECTED_ERROR', 'stats': None, 'error': e}
+    finally:
+        lease.close()
+        cell_data = None
+        old_baseline = None
+
+def _tally_outcome(tally, outcome):
+    status = outcome['status']
+    if status == 'OK':
+        tally['success'] += 1
+        stats = outcome.get('stats')
+        if stats and stats['original_size']:
+            tally['original_size'] += stats['original_size']
+            tally['compressed_size'] += stats['compressed_size']
+    elif status == 'SKIP':
+        tally['skip'] += 1
+    else:
+        tally['error'] += 1
+
+def _iter_changed_by_stat(xlsx_files, counts):
+    """
+    以基準線清單（單一 SQLite 查詢）比對來源檔 mtime/size，逐檔產出仍需處理的檔案；略過數累計於 counts['skipped']。
+    只需 stat 來源檔，不開啟任何基準線檔案；xlsx_files 可為掃描中的串流，找到一個就比對一個。
+    """
+    try:
+        manifest = load_manifest()
+    except sqlite3.Error as e:
+        logging.warning(f"讀取基準線清單失敗，改為完整掃描: {e}")
+        manifest = None
+    if not manifest:
+        yield from xlsx_files
+        return
+    from utils.helpers import _baseline_key_for_path
+    for file_path in xlsx_files:
+        base_key = _baseline_key_for_path(file_path)
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            yield file_path
+            continue
+        entry = manifest.get(base_key)
+        if stat_matches(entry, st.st_mtime, st.st_size) and (entry.get('storage_path') or get_baseline_file_with_extension(base_key)):
+            counts['skipped'] += 1
+            continue
+        yield file_path
+
+def _build_baselines_sequential(xlsx_files, tally):
+    """
+    逐一建立基準線（BASELINE_BUILD_WORKERS <= 1）：直接消化 xlsx_files（可為掃描中的串流），找到一個處理一個。
+    進度以路徑逐檔記錄（與並行建立共用），重新啟動時略過上次已完成的檔案。返回是否全部處理完成（未被停止）。
+    """
+    done = load_completed_files()
+    resumed = 0
+    count = 0
+    for file_path in xlsx_files:
+        if settings.force_stop:
+            print("\n🛑 收到停止信號，正在安全退出...")
+            return False
+        if file_path in done:
+            resumed += 1
+            _tally_outcome(tally, {'status': 'SKIP', 'stats': None})
+            continue
+
+        display_name = os.path.basename(file_path)
+        
+        if check_memory_limit():
+            print(f"⚠️ 記憶體使用量過高，暫停10秒...")
+            time.sleep(10)
+            if check_memory_limit(): 
+                print(f"❌ 記憶體仍然過高，停止處理")
+                return False
+
+        count += 1
+        file_start_time = time.time()
+        print(f"[{count:>2}] 處理中: {display_name} (記憶體: {get_memory_usage():.1f}MB)")
+        
+        outcome = _build_one_baseline(file_path)
+        status = outcome['status']
+        if status == 'UNEXPECTED_ERROR':
+            logging.error(f"  結果: [UNEXPECTED_ERROR]\n  錯誤: {outcome.get('error')}\n  耗時: {time.time() - file_start_time:.2f} 秒\n")
+        else:
+            print(f"  結果: [{status}]{' (Hash unchanged)' if status == 'SKIP' else ''}")
+            print(f"  耗時: {time.time() - file_start_time:.2f} 秒")
+            print("")
+        _tally_outcome(tally, outcome)
+        if status in ('OK', 'SKIP'):
+            mark_file_completed(file_path)
+        gc.collect()
+    if resumed:
+        print(f"發現之前的進度記錄: 略過上次已完成的 {resumed} 個檔案")
+    clear_completed_files()
+    return True
+
 def create_baseline_for_files_robust(xlsx_files, skip_force_baseline=True):
     """
     為多個檔案建立基準線
+    xlsx_files 可為清單或迭代器（例如啟動掃描的串流）：逐一建立時邊掃描邊處理，第一個檔案找到即開始；
+    並行建立需要完整清單才能大檔優先，因此先收集完畢再開始。
     """
-    total = len(xlsx_files)
-    if total == 0:
+    # 快速略過：來源檔 mtime/size 與基準線清單一致者不複製、不解析
+    counts = {'skipped': 0}
+    if getattr(settings, 'STARTUP_SKIP_BY_STAT', True):
+        files = _iter_changed_by_stat(xlsx_files, counts)
+    else:
+        files = iter(xlsx_files)
+
+    workers = int(getattr(settings, 'BASELINE_BUILD_WORKERS', 1) or 1)
+    parallel = workers > 1
+    if parallel:
+        files = list(files)
+        has_files = bool(files)
+    else:
+        first = next(files, None)
+        has_files = first is not None
+        if has_files:
+            files = itertools.chain([first], files)
+    if not has_files and not counts['skipped']:
         print("[INFO] 沒有需要 baseline 的檔案。")
         settings.baseline_completed = True
         return
@@ -174,19 +458,8 @@ def create_baseline_for_files_robust(xlsx_files, skip_force_baseline=True):
         print(f"⚠️  警告: 預設格式 {settings.DEFAULT_COMPRESSION_FORMAT} 不可用，降級到 gzip")
         settings.DEFAULT_COMPRESSION_FORMAT = 'gzip'
     
-    progress = load_progress()
-    start_index = 0
-    
-    if progress and settings.ENABLE_RESUME:
-        print(f"發現之前的進度記錄: 完成 {progress.get('completed', 0)}/{progress.get('total', 0)}")
-        # 自動續跑：不再詢問
-        start_index = progress.get('completed', 0)
-    
-    # 啟動超時處理
-    if settings.ENABLE_TIMEOUT:
-        from utils.helpers import timeout_handler
-        timeout_thread = threading.Thread(target=timeout_handler, daemon=True)
-        timeout_thread.start()
+    # 超時由隔離解析子行程執行（逾時即終止子行程）；主行程解析時無法中止，不顯示
+    if settings.ENABLE_TIMEOUT and getattr(settings, 'ISOLATE_PARSE_PROCESS', True):
         print(f"⏰ 啟用超時保護: {settings.FILE_TIMEOUT_SECONDS} 秒")
     
     if settings.ENABLE_MEMORY_MONITOR: 
@@ -198,99 +471,46 @@ def create_baseline_for_files_robust(xlsx_files, skip_force_baseline=True):
     if settings.USE_LOCAL_CACHE: 
         print(f"💾 本地緩存位置: {os.path.abspath(settings.CACHE_FOLDER)}")
     
-    print(f"📋 要處理的檔案: {total} 個 (從第 {start_index + 1} 個開始)")
+    if parallel:
+        print(f"📋 要處理的檔案: {len(files)} 個")
+    else:
+        print("📋 要處理的檔案: 邊掃描邊處理")
     print(f"⏰ 開始時間: {datetime.now():%Y-%m-%d %H:%M:%S}\n" + "-"*90)
     
     os.makedirs(settings.LOG_FOLDER, exist_ok=True)
     if settings.USE_LOCAL_CACHE: 
         os.makedirs(settings.CACHE_FOLDER, exist_ok=True)
     
-    success_count, skip_count, error_count = 0, 0, 0
+    tally = {'success': 0, 'skip': 0, 'error': 0, 'original_size': 0, 'compressed_size': 0}
     start_time = time.time()
-    total_original_size = 0
-    total_compressed_size = 0
-    
-    for i in range(start_index, total):
-        if settings.force_stop:
-            print("\n🛑 收到停止信號，正在安全退出...")
-            save_progress(i, total)
-            break
-        
-        file_path = xlsx_files[i]
-        # 使用包含路徑哈希的 key，避免同名不同路徑覆蓋
-        from utils.helpers import _baseline_key_for_path
-        base_key = _baseline_key_for_path(file_path)
-        display_name = os.path.basename(file_path)
-        
-        if check_memory_limit():
-            print(f"⚠️ 記憶體使用量過高，暫停10秒...")
-            time.sleep(10)
-            if check_memory_limit(): 
-                print(f"❌ 記憶體仍然過高，停止處理")
-                save_progress(i, total)
-                break
 
-        file_start_time = time.time()
-        print(f"[{i+1:>2}/{total}] 處理中: {display_name} (記憶體: {get_memory_usage():.1f}MB)")
-        
-        cell_data = None
-        try:
-            old_baseline = load_baseline(base_key)
-            old_hash = old_baseline['content_hash'] if old_baseline and 'content_hash' in old_baseline else None
-            
-            cell_data = dump_excel_cells_with_timeout(file_path)
-            
-            if cell_data is None:
-                if settings.current_processing_file is None and (time.time() - file_start_time) > settings.FILE_TIMEOUT_SECONDS:
-                     print(f"  結果: [TIMEOUT]")
-                else:
-                     print(f"  結果: [READ_ERROR]")
-                error_count += 1
+    if parallel:
+        from core.baseline_builder import build_baselines_parallel
+
+        def _on_result(file_path, outcome, finished, elapsed):
+            status = outcome['status']
+            if outcome.get('resumed'):
+                # 上次已完成的檔案：只計入統計，不逐一列出
+                _tally_outcome(tally, outcome)
+                return
+            line = f"[{finished:>2}/{len(files)}] {os.path.basename(file_path)}  結果: [{status}]"
+            if status == 'UNEXPECTED_ERROR':
+                logging.error(f"{line}\n  錯誤: {outcome.get('error')}\n  耗時: {elapsed:.2f} 秒")
             else:
-                curr_hash = hash_excel_content(cell_data)
-                if old_hash == curr_hash and old_hash is not None:
-                    print(f"  結果: [SKIP] (Hash unchanged)")
-                    skip_count += 1
-                else:
-                    curr_author = get_excel_last_author(file_path)
-                    baseline_data = {
-                        "source_mtime": os.path.getmtime(file_path),
-                        "source_size": os.path.getsize(file_path),
-                        "last_author": curr_author, 
-                        "content_hash": curr_hash, 
-                        "cells": cell_data
-                    }
-                    
-                    if save_baseline(base_key, baseline_data):
-                        print(f"  結果: [OK]")
-                        success_count += 1
-                        
-                        # 統計壓縮效果
-                        if settings.SHOW_COMPRESSION_STATS:
-                            actual_file = get_baseline_file_with_extension(base_key)
-                            if actual_file:
-                                stats = get_compression_stats(actual_file)
-                                if stats and stats['original_size']:
-                                    total_original_size += stats['original_size']
-                                    total_compressed_size += stats['compressed_size']
-                    else:
-                        print(f"  結果: [SAVE_ERROR]")
-                        error_count += 1
-            
-            print(f"  耗時: {time.time() - file_start_time:.2f} 秒")
-            print("")
-            save_progress(i + 1, total)
-            
-        except (FileNotFoundError, PermissionError, OSError, json.JSONDecodeError) as e:
-            logging.error(f"  結果: [UNEXPECTED_ERROR]\n  錯誤: {e}\n  耗時: {time.time() - file_start_time:.2f} 秒\n")
-            error_count += 1
-            save_progress(i + 1, total)
-        finally:
-            if cell_data is not None: 
-                del cell_data
-            if 'old_baseline' in locals() and old_baseline is not None: 
-                del old_baseline
-            gc.collect()
+                print(f"{line}{' (Hash unchanged)' if status == 'SKIP' else ''}  耗時: {elapsed:.2f} 秒")
+            _tally_outcome(tally, outcome)
+
+        build_baselines_parallel(files, _build_one_baseline, workers, _on_result)
+    else:
+        _build_baselines_sequential(files, tally)
+
+    # 串流模式下略過數在掃描結束後才確定
+    if counts['skipped']:
+        print(f"⚡ 快速略過: {counts['skipped']} 個檔案 mtime/size 與基準線清單一致")
+        tally['skip'] += counts['skipped']
+
+    success_count, skip_count, error_count = tally['success'], tally['skip'], tally['error']
+    total_original_size, total_compressed_size = tally['original_size'], tally['compressed_size']
 
     # 執行歸檔
     if settings.ENABLE_ARCHIVE_MODE:
@@ -0,0 +1,158 @@
+"""
+並行基準線建立 - 網路複製（I/O）與解析（CPU）重疊進行，大檔優先，受記憶體預算限制
+"""
+import os
+import gc
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import config.settings as settings
+from utils.cache import copy_to_cache
+from utils.helpers import load_completed_files, mark_file_completed, clear_completed_files
+from utils.memory import get_memory_usage
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _prefetch(path):
+    """預先複製到本地快取；失敗時由解析階段重新嘗試並回報錯誤。"""
+    try:
+        copy_to_cache(path, silent=True)
+    except Exception as e:
+        logging.warning(f"預先複製失敗: {path}: {e}")
+    return path
+
+
+def _memory_budget_mb():
+    budget = float(getattr(settings, 'BASELINE_MEMORY_BUDGET_MB', 0) or 0)
+    if budget <= 0 and settings.ENABLE_MEMORY_MONITOR:
+        budget = float(settings.MEMORY_LIMIT_MB)
+    return budget
+
+
+class MemoryBudget:
+    """
+    同時解析的檔案以估計用量（檔案大小 × BASELINE_MEMORY_PER_FILE_FACTOR）控管，加總不超過預算；
+    另以實際用量（本程序加上隔離解析子程序的 RSS）把關。
+    沒有進行中的解析時一律放行，避免超過預算的大檔永遠等待。預算為 0 表示不限制。
+    """
+
+    def __init__(self, budget_mb, factor):
+        self.budget_mb = budget_mb
+        self.factor = factor
+        self.in_use = 0.0
+
+    def estimate(self, size_bytes):
+        return max(1.0, size_bytes / (1024 * 1024) * self.factor)
+
+    def try_acquire(self, cost, running):
+        if self.budget_mb > 0 and running > 0:
+            if self.in_use + cost > self.budget_mb:
+                return False
+            if get_memory_usage(include_children=True) + cost > self.budget_mb:
+                return False
+        self.in_use += cost
+        return True
+
+    def release(self, cost):
+        self.in_use = max(0.0, self.in_use - cost)
+
+    def over_budget(self):
+        return self.budget_mb > 0 and get_memory_usage(include_children=True) > self.budget_mb
+
+
+def build_baselines_parallel(xlsx_files, build_one, workers, on_result):
+    """
+    並行建立基準線。
+    build_one(path, silent) -> { status, stats, error }；on_result(path, outcome, 完成序號, 耗時秒) 在主執行緒呼叫。
+    複製與解析各自一個執行緒池：複製保持固定的預取窗口，解析依檔案大小由大到小挑選放得進記憶體預算的檔案。
+    ENABLE_RESUME 時逐檔記錄已完成（OK/SKIP）的檔案，重新啟動只處理其餘檔案；
+    這些檔案以 {'status': 'SKIP', 'resumed': True} 回報給 on_result，統計仍涵蓋全部檔案。
+    返回是否全部處理完成（未被停止）。
+    """
+    total = len(xlsx_files)
+    done = load_completed_files()
+    pending_files = [p for p in xlsx_files if p not in done]
+    finished = total - len(pending_files)
+    if finished:
+        print(f"發現之前的進度記錄: 已完成 {finished}/{total}，略過已完成的檔案")
+        for n, path in enumerate((p for p in xlsx_files if p in done), 1):
+            on_result(path, {'status': 'SKIP', 'stats': None, 'resumed': True}, n, 0.0)
+
+    copy_workers = max(1, int(getattr(settings, 'BASELINE_COPY_WORKERS', 4) or 1))
+    budget = MemoryBudget(_memory_budget_mb(), float(getattr(settings, 'BASELINE_MEMORY_PER_FILE_FACTOR', 6)))
+    budget_text = f"{budget.budget_mb:.0f} MB" if budget.budget_mb > 0 else "不限制"
+    print(f"⚡ 並行建立: 解析 {workers} 個 / 複製 {copy_workers} 個，大檔優先，記憶體預算 {budget_text}")
+
+    stopped = False
+    with ThreadPoolExecutor(copy_workers, thread_name_prefix='baseline-copy') as copy_pool, \
+            ThreadPoolExecutor(workers, thread_name_prefix='baseline-parse') as parse_pool:
+        sizes = dict(zip(pending_files, copy_pool.map(_file_size, pending_files)))
+        queue = deque(sorted(pending_files, key=lambda p: sizes[p], reverse=True))
+        prefetch_window = workers + copy_workers
+        copying = {}   # future -> path
+        ready = []     # 已在快取、等待解析（大檔在前）
+        parsing = {}   # future -> (path, cost, start_time)
+
+        while queue or copying or ready or parsing:
+            if settings.force_stop and not stopped:
+                print("\n🛑 收到停止信號，等待進行中的檔案完成...")
+                stopped = True
+                queue.clear()
+                ready.clear()
+                for fut in list(copying):
+                    if fut.cancel():
+                        copying.pop(fut)
+
+            # 複製階段：保持固定的預取窗口，避免一次把所有檔案複製到快取
+            while queue and len(copying) + len(ready) < prefetch_window:
+                path = queue.popleft()
+                if settings.USE_LOCAL_CACHE:
+                    copying[copy_pool.submit(_prefetch, path)] = path
+                else:
+                    ready.append(path)
+
+            # 解析階段：依大小順序挑第一個放得進記憶體預算的檔案
+            while ready and len(parsing) < workers:
+                for idx, path in enumerate(ready):
+                    cost = budget.estimate(sizes[path])
+                    if budget.try_acquire(cost, len(parsing)):
+                        break
+                else:
+                    break
+                ready.pop(idx)
+                parsing[parse_pool.submit(build_one, path, True)] = (path, cost, time.time())
+
+            if not copying and not parsing:
+                continue
+            completed, _ = wait(list(copying) + list(parsing), timeout=1.0, return_when=FIRST_COMPLETED)
+            for fut in completed:
+                if fut in copying:
+                    path = copying.pop(fut)
+                    if not stopped:
+                        ready.append(path)
+                        ready.sort(key=lambda p: sizes[p], reverse=True)
+                    continue
+                path, cost, started = parsing.pop(fut)
+                budget.release(cost)
+                try:
+                    outcome = fut.result()
+                except Exception as e:
+                    outcome = {'status': 'UNEXPECTED_ERROR', 'stats': None, 'error': e}
+                finished += 1
+                on_result(path, outcome, finished, time.time() - started)
+                if outcome['status'] in ('OK', 'SKIP'):
+                    mark_file_completed(path)
+                if budget.over_budget():
+                    gc.collect()
+
+    if not stopped:
+        clear_completed_files()
+    return not stopped
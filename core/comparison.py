@@ -11,12 +11,17 @@ from wcwidth import wcwidth
 import config.settings as settings
 from utils.logging import _get_display_width
 from utils.helpers import get_file_mtime
-from core.excel_parser import pretty_formula, extract_external_refs, get_excel_last_author
+from core.excel_parser import pretty_formula, extract_external_refs, get_excel_last_author, get_workbook_fingerprints
+from utils.value_engines.stream_reader import sheets_needing_parse
+from utils.content_hash import build_content_tree, diff_content_trees, reusable_nodes, scoped_cells
 from core.baseline import load_baseline, baseline_file_path
 import logging
 import hashlib
+import sqlite3
 import json as _json
 import core.baseline as baseline
+from utils.baseline_manifest import get_entry as get_manifest_entry, stat_matches
+from utils.cache import CacheLease
 
 # ... [print_aligned_console_diff 和其他輔助函數保持不變] ...
 def print_aligned_console_diff(old_data, new_data, file_info=None, max_display_changes=0):
@@ -213,205 +218,472 @@ def format_timestamp_for_display(timestamp_str):
         logging.error(f"格式化時間戳失敗: {timestamp_str}, 錯誤: {e}")
         return timestamp_str
 
-def compare_excel_changes(file_path, silent=False, event_number=None, is_polling=False):
+class ComparisonResult:
     """
-    [最終修正版] 統一日誌記錄和顯示邏輯
+    compute_excel_changes 的結果：一次讀取、解析與比對，供靜默判斷與之後的顯示/保存共用，同一事件不重複解析。
+    - status：'CHANGED'、'UNCHANGED'（內容無變化）、'QUICK_SKIP'（mtime/size 未變）、'READ_ERROR'、'ERROR'
+    - diff：DiffResult（只在 CHANGED 時有值）
+    """
+
+    def __init__(self, file_path, event_number=None):
+        self.file_path = file_path
+        self.event_number = event_number
+        self.status = 'UNCHANGED'
+        self.error = None
+        self.base_key = None
+        self.old_baseline = {}
+        self.baseline_cells = {}
+        self.current_data = None
+        self.new_tree = None
+        self.new_fingerprints = None
+        self.source_stat = None
+        self.old_author = 'N/A'
+        self.new_author = None
+        self.diff = None
+
+    @property
+    def has_changes(self):
+        return self.status == 'CHANGED'
+
+def compute_excel_changes(file_path, event_number=None, lease=None):
+    """
+    比較階段：載入基準線、解析有變動的工作表並算出 DiffResult；不輸出、不寫檔。
+    lease：同一事件共用的快取租約；未傳入時自行建立並在結束時關閉。
     """
+    result = ComparisonResult(file_path, event_number)
+    own_lease = lease is None
+    if own_lease:
+        lease = CacheLease(file_path)
     try:
-        from core.excel_parser import dump_excel_cells_with_timeout
+        from core.parse_worker import dump_excel_cells_isolated
         
         from utils.helpers import _baseline_key_for_path
-        base_key = _baseline_key_for_path(file_path)
+        base_key = result.base_key = _baseline_key_for_path(file_path)
+        try:
+            st = os.stat(file_path)
+            result.source_stat = (st.st_mtime, st.st_size)
+        except OSError:
+            st = None
         
+        # 基準線清單記錄了 mtime/size 與 zip fingerprint：判定無變化時不需載入基準線
+        try:
+            entry = get_manifest_entry(base_key)
+        except sqlite3.Error:
+            entry = None
+        if entry and entry.get('storage_path') and st is not None:
+            if settings.QUICK_SKIP_BY_STAT and stat_matches(entry, st.st_mtime, st.st_size):
+                result.status = 'QUICK_SKIP'
+                return result
+        new_fingerprints = result.new_fingerprints = get_workbook_fingerprints(file_path, lease=lease)
+        if entry and entry.get('storage_path') and getattr(settings, 'SKIP_UNCHANGED_SHEETS_BY_CRC', True) \
+                and sheets_needing_parse(entry.get('zip_fingerprints'), new_fingerprints) == set() \
+                and set((entry['zip_fingerprints'] or {}).get('sheets', {})) == set(new_fingerprints.get('sheets', {})):
+            return result
+
         old_baseline = load_baseline(base_key)
         # 快速跳過：若與基準線的 mtime/size 一致（容差內），直接判定無變化
-        if settings.QUICK_SKIP_BY_STAT and old_baseline and \
+        if settings.QUICK_SKIP_BY_STAT and old_baseline and st is not None and \
            ("source_mtime" in old_baseline) and ("source_size" in old_baseline):
             try:
-                cur_mtime = os.path.getmtime(file_path)
-                cur_size  = os.path.getsize(file_path)
                 base_mtime = float(old_baseline.get("source_mtime", 0))
                 base_size  = int(old_baseline.get("source_size", -1))
-                if (cur_size == base_size) and (abs(cur_mtime - base_mtime) <= float(getattr(settings,'MTIME_TOLERANCE_SEC',2.0))):
-                    if not silent:
-                        print(f"[快速通過] {os.path.basename(file_path)} mtime/size 未變，略過讀取。")
-                    return False
+                if (st.st_size == base_size) and (abs(st.st_mtime - base_mtime) <= float(getattr(settings,'MTIME_TOLERANCE_SEC',2.0))):
+                    result.status = 'QUICK_SKIP'
+                    return result
             except Exception:
                 pass
         if old_baseline is None:
             old_baseline = {}
+        result.old_baseline = old_baseline
+        baseline_cells = result.baseline_cells = old_baseline.get('cells', {})
+
+        # zip fingerprint：只重新解析 CRC 有變動的工作表，其餘沿用基準線的 cells
+        only_sheets = None
+        if getattr(settings, 'SKIP_UNCHANGED_SHEETS_BY_CRC', True) and baseline_cells:
+            only_sheets = sheets_needing_parse(old_baseline.get('zip_fingerprints'), new_fingerprints)
+
+        if only_sheets is not None and not only_sheets:
+            current_data = {}
+        elif not lease.available:
+            # 無法取得副本（嚴格模式不讀原檔，或檔案已不存在）
+            result.status = 'READ_ERROR'
+            return result
+        else:
+            current_data = dump_excel_cells_isolated(file_path, show_sheet_detail=False, silent=True, only_sheets=only_sheets,
+                                                     local_path=lease.local_path)
+            if not current_data and only_sheets is None:
+                # 重試仍讀同一個租約副本：不再觸發另一次複製與穩定性等待
+                time.sleep(1)
+                current_data = dump_excel_cells_isolated(file_path, show_sheet_detail=False, silent=True,
+                                                         local_path=lease.local_path)
+            if current_data is None or (not current_data and only_sheets is None):
+                result.status = 'READ_ERROR'
+                return result
+        if only_sheets is not None:
+            # 依目前活頁簿順序合併：變動的表用新解析結果，其餘沿用基準線
+            # （columnar 延遲載入時沿用的是同一個 LazySheet 物件，比較時以 identity 判定相同，不會解碼）
+            merged = {}
+            for sheet_name in (new_fingerprints or {}).get('sheets', {}):
+                if sheet_name in only_sheets:
+                    if sheet_name in current_data:
+                        merged[sheet_name] = current_data[sheet_name]
+                elif sheet_name in baseline_cells:
+                    merged[sheet_name] = baseline_cells[sheet_name]
+            current_data = merged
+        result.current_data = current_data
+        if lease.source_stat is not None:
+            # 以複製當下的 stat 為準，與解析的副本內容一致
+            result.source_stat = lease.source_stat
+
+        # 雜湊樹：沿用基準線的工作表直接沿用基準線的節點，其餘逐區塊計算；
+        # 與基準線的樹比較即可得知有變動的工作表與列區塊，之後只比對這些範圍
+        old_tree = old_baseline.get('content_tree')
+        known = None
+        if only_sheets is not None:
+            known = reusable_nodes(old_tree, [name for name in current_data if name not in only_sheets])
+        new_tree = result.new_tree = build_content_tree(current_data, known=known)
+        scope = diff_content_trees(old_tree, new_tree)
+        if scope is None:
+            # 舊基準線沒有可比較的雜湊樹：退回整本比較
+            unchanged = baseline_cells == current_data
+            old_scoped, new_scoped = baseline_cells, current_data
+        else:
+            unchanged = not scope
+            block_rows = new_tree['block_rows']
+            old_scoped = scoped_cells(baseline_cells, scope, block_rows)
+            new_scoped = scoped_cells(current_data, scope, block_rows)
 
-        current_data = dump_excel_cells_with_timeout(file_path, show_sheet_detail=False, silent=True)
-        if not current_data:
-            time.sleep(1)
-            current_data = dump_excel_cells_with_timeout(file_path, show_sheet_detail=False, silent=True)
-            if not current_data:
-                if not silent:
-                    print(f"❌ 重試後仍無法讀取檔案: {os.path.basename(file_path)}")
-                return False
+        if unchanged:
+            return result
         
-        baseline_cells = old_baseline.get('cells', {})
-        if baseline_cells == current_data:
-            # 如果是輪詢且無變化，則不顯示任何內容
-            if is_polling:
-                print(f"    [輪詢檢查] {os.path.basename(file_path)} 內容無變化。")
-            return False
-        
-        any_sheet_has_changes = False
-        
-        old_author = old_baseline.get('last_author', 'N/A')
+        # 一次算出 DiffResult：靜默判斷、顯示、CSV、快照與事件索引共用
+        result.diff = DiffResult.compute(old_scoped, new_scoped)
+        if not result.diff.has_changes:
+            return result
+        result.status = 'CHANGED'
+        result.old_author = old_baseline.get('last_author', 'N/A')
         try:
-            new_author = get_excel_last_author(file_path)
+            result.new_author = get_excel_last_author(file_path, lease=lease)
         except Exception:
-            new_author = 'Unknown'
+            result.new_author = 'Unknown'
+        return result
+        
+    except Exception as e:
+        result.status = 'ERROR'
+        result.error = e
+        return result
+    finally:
+        if own_lease:
+            lease.close()
+
+def render_comparison(result, silent=False, is_polling=False):
+    """
+    顯示/保存階段：輸出比較表、寫入 CSV、保存歷史快照並（如啟用）更新基準線。
+    silent=True 時只返回是否有變更。
+    """
+    file_path = result.file_path
+    event_number = result.event_number
+    if result.status == 'QUICK_SKIP':
+        if not silent:
+            print(f"[快速通過] {os.path.basename(file_path)} mtime/size 未變，略過讀取。")
+        return False
+    if result.status == 'UNCHANGED':
+        # 如果是輪詢且無變化，則不顯示任何內容
+        if is_polling:
+            print(f"    [輪詢檢查] {os.path.basename(file_path)} 內容無變化。")
+        return False
+    if result.status == 'READ_ERROR':
+        if not silent:
+            print(f"❌ 重試後仍無法讀取檔案: {os.path.basename(file_path)}")
+        return False
+    if result.status == 'ERROR':
+        if not silent:
+            logging.error(f"比較過程出錯: {result.error}")
+        return False
+    if silent:
+        return True
 
-        for worksheet_name in set(baseline_cells.keys()) | set(current_data.keys()):
+    try:
+        diff = result.diff
+        baseline_cells = result.baseline_cells
+        current_data = result.current_data
+        old_author, new_author = result.old_author, result.new_author
+        baseline_timestamp = result.old_baseline.get('timestamp', 'N/A')
+        current_timestamp = get_file_mtime(file_path)
+
+        for worksheet_name, meaningful_changes in diff.sheets.items():
+            # 只顯示「有意義變更」（隱藏間接變更/無意義變更）
+            if not meaningful_changes:
+                continue
             old_ws = baseline_cells.get(worksheet_name, {})
             new_ws = current_data.get(worksheet_name, {})
+            addrs = [c['address'] for c in meaningful_changes]
+            display_old = {addr: old_ws.get(addr) for addr in addrs}
+            display_new = {addr: new_ws.get(addr) for addr in addrs}
+
+            # 顯示比較表（僅有意義變更）
+            print_aligned_console_diff(
+                display_old,
+                display_new,
+                {
+                    'filename': os.path.basename(file_path),
+                    'file_path': file_path,
+                    'event_number': event_number,
+                    'worksheet': worksheet_name,
+                    'baseline_time': format_timestamp_for_display(baseline_timestamp),
+                    'current_time': format_timestamp_for_display(current_timestamp),
+                    'old_author': old_author,
+                    'new_author': new_author,
+                },
+                max_display_changes=settings.MAX_CHANGES_TO_DISPLAY
+            )
             
-            if old_ws == new_ws:
-                continue
-
-            any_sheet_has_changes = True
-            
-            # 只有在非靜默模式下才顯示和記錄
-            if not silent:
-                baseline_timestamp = old_baseline.get('timestamp', 'N/A')
-                current_timestamp = get_file_mtime(file_path)
-                
-                # 只顯示「有意義變更」（隱藏間接變更/無意義變更）
-                meaningful_changes = analyze_meaningful_changes(old_ws, new_ws)
-                if not meaningful_changes:
-                    continue
-                addrs = [c['address'] for c in meaningful_changes]
-                display_old = {addr: old_ws.get(addr) for addr in addrs}
-                display_new = {addr: new_ws.get(addr) for addr in addrs}
-
-                # 顯示比較表（僅有意義變更）
-                print_aligned_console_diff(
-                    display_old,
-                    display_new,
-                    {
-                        'filename': os.path.basename(file_path),
-                        'file_path': file_path,
-                        'event_number': event_number,
-                        'worksheet': worksheet_name,
-                        'baseline_time': format_timestamp_for_display(baseline_timestamp),
-                        'current_time': format_timestamp_for_display(current_timestamp),
-                        'old_author': old_author,
-                        'new_author': new_author,
-                    },
-                    max_display_changes=settings.MAX_CHANGES_TO_DISPLAY
-                )
-                
-                # 分析並記錄有意義的變更
-                        # 分析並記錄有意義的變更（帶入設定控制）
-                meaningful_changes = analyze_meaningful_changes(old_ws, new_ws)
-                if meaningful_changes:
-                    # 只在非輪詢的第一次檢查時記錄日誌，避免重複
-                    if not is_polling:
-                        log_meaningful_changes_to_csv(file_path, worksheet_name, meaningful_changes, new_author)
+            # 只在非輪詢的第一次檢查時記錄日誌，避免重複
+            if not is_polling:
+                log_meaningful_changes_to_csv(file_path, worksheet_name, meaningful_changes, new_author)
 
         # 任何可見的比較（非靜默）且確實有變更時，先保存歷史快照，再（如啟用）更新基準線
-        if any_sheet_has_changes and not silent:
-            # MVP：保存完整快照（timeline）
-            try:
-                from utils.history import save_history_snapshot, sync_history_to_git_repo, insert_event_index
-                mc_count = 0
-                try:
-                    mc_count = sum(len(analyze_meaningful_changes(baseline_cells.get(ws, {}), current_data.get(ws, {}))) for ws in set(baseline_cells.keys()) | set(current_data.keys()))
-                except Exception:
-                    mc_count = 0
-                # 1) 保存壓縮快照（LOG_FOLDER/history）
-                snap_path = save_history_snapshot(file_path, current_data, last_author=new_author, event_number=event_number, meaningful_changes_count=mc_count)
-                # 2) 同步純 JSON 到 excel_git_repo 並 commit（如 Git 可用）
-                git_json_path = sync_history_to_git_repo(file_path, current_data, last_author=new_author, event_number=event_number, meaningful_changes_count=mc_count)
-                # 3) 插入事件索引（SQLite）
-                try:
-                    old_cells = (baseline.load_baseline(base_key) or {}).get('cells', {})
-                except Exception:
-                    old_cells = baseline_cells or {}
-                insert_event_index(file_path,
-                                   old_cells=old_cells,
-                                   new_cells=current_data,
-                                   last_author=new_author,
-                                   event_number=event_number,
-                                   snapshot_path=snap_path,
-                                   summary_path=None,
-                                   git_commit_sha=None,
-                                   db_path=None)
-            except Exception:
-                pass
-            if settings.AUTO_UPDATE_BASELINE_AFTER_COMPARE:
-                print(f"🔄 自動更新基準線: {os.path.basename(file_path)}")
-                cur_mtime = os.path.getmtime(file_path)
-                cur_size  = os.path.getsize(file_path)
-                updated_baseline = {
-                    "last_author": new_author,
-                    "content_hash": f"updated_{int(time.time())}",
-                    "cells": current_data,
-                    "timestamp": datetime.now().isoformat(),
-                     "source_mtime": cur_mtime,
-                     "source_size": cur_size
-                }
-                if not baseline.save_baseline(base_key, updated_baseline):
-                    print(f"[WARNING] 基準線更新失敗: {os.path.basename(file_path)}")
+        # MVP：保存完整快照（timeline）
+        try:
+            from utils.history import save_history_snapshot, sync_history_to_git_repo, insert_event_index
+            mc_count = diff.meaningful_count
+            # 1) 保存壓縮快照（LOG_FOLDER/history）
+            snap_path = save_history_snapshot(file_path, current_data, last_author=new_author, event_number=event_number, meaningful_changes_count=mc_count)
+            # 2) 同步純 JSON 到 excel_git_repo 並 commit（如 Git 可用）
+            git_json_path = sync_history_to_git_repo(file_path, current_data, last_author=new_author, event_number=event_number, meaningful_changes_count=mc_count)
+            # 3) 插入事件索引（SQLite）：統計直接取自同一次比對
+            insert_event_index(file_path,
+                               old_cells=baseline_cells,
+                               new_cells=current_data,
+                               last_author=new_author,
+                               event_number=event_number,
+                               snapshot_path=snap_path,
+                               summary_path=None,
+                               git_commit_sha=None,
+                               db_path=None,
+                               counters=diff.counters)
+        except Exception:
+            pass
+        if settings.AUTO_UPDATE_BASELINE_AFTER_COMPARE:
+            print(f"🔄 自動更新基準線: {os.path.basename(file_path)}")
+            # mtime/size 取自解析前的 stat：解析期間若又被修改，下次比較會因 stat 不符而重新解析
+            if result.source_stat is not None:
+                cur_mtime, cur_size = result.source_stat
+            else:
+                cur_mtime, cur_size = os.path.getmtime(file_path), os.path.getsize(file_path)
+            new_tree = result.new_tree
+            updated_baseline = {
+                "last_author": new_author,
+                "content_hash": new_tree['hash'] if new_tree else None,
+                "content_tree": new_tree,
+                "cells": current_data,
+                "timestamp": datetime.now().isoformat(),
+                 "source_mtime": cur_mtime,
+                 "source_size": cur_size,
+                "zip_fingerprints": result.new_fingerprints
+            }
+            if not baseline.save_baseline(result.base_key, updated_baseline):
+                print(f"[WARNING] 基準線更新失敗: {os.path.basename(file_path)}")
         
-        return any_sheet_has_changes
+        return True
         
     except Exception as e:
-        if not silent:
-            logging.error(f"比較過程出錯: {e}")
+        logging.error(f"比較過程出錯: {e}")
         return False
 
-def analyze_meaningful_changes(old_ws, new_ws):
+def compare_excel_changes(file_path, silent=False, event_number=None, is_polling=False):
     """
-    🧠 分析有意義的變更
+    [最終修正版] 統一日誌記錄和顯示邏輯
+    比較（compute_excel_changes）與顯示/保存（render_comparison）兩階段；需要先靜默判斷再顯示時，
+    直接呼叫兩個階段並沿用同一個結果，避免重複解析。
+    """
+    return render_comparison(compute_excel_changes(file_path, event_number=event_number), silent=silent, is_polling=is_polling)
+
+# 事件統計計數的欄位對應（與 Compare_Logic 定義一致；INDIRECT/NO_CHANGE 只計入 total）
+_COUNTER_KEYS = {
+    'CELL_ADDED': 'addc',
+    'CELL_DELETED': 'delc',
+    'DIRECT_VALUE_CHANGE': 'dvc',
+    'FORMULA_CHANGE_INTERNAL': 'fci',
+    'EXTERNAL_REF_LINK_CHANGE': 'xrlc',
+    'EXTERNAL_REFRESH_UPDATE': 'xru',
+}
+
+def _empty_counters():
+    counters = {k: 0 for k in ['dvc','fci','xrlc','xru','addc','delc']}
+    counters['total_changes'] = 0
+    return counters
+
+def _display_value(cell):
+    # 將輸出值優先用 cached_value（若存在）
+    return cell.get('cached_value') if cell.get('cached_value') is not None else cell.get('value')
+
+def _display_flags():
+    return {
+        'show_external_refresh': getattr(settings, 'SHOW_EXTERNAL_REFRESH_CHANGES', True),
+        'suppress_internal_same_value': getattr(settings, 'SUPPRESS_INTERNAL_FORMULA_CHANGE_WITH_SAME_VALUE', False),
+        'formula_only_mode': getattr(settings, 'FORMULA_ONLY_MODE', False),
+    }
+
+def _apply_display_flags(base_type, old_val, new_val, *, show_external_refresh=True, suppress_internal_same_value=False, formula_only_mode=False):
     """
+    由中性分類（所有顯示旗標皆為預設）推導出套用顯示旗標後的分類，結果與 classify_change_type 帶旗標呼叫相同。
+    """
+    if base_type == 'FORMULA_CHANGE_INTERNAL' and suppress_internal_same_value and old_val == new_val:
+        return 'NO_CHANGE'
+    if base_type == 'EXTERNAL_REFRESH_UPDATE' and not show_external_refresh:
+        return 'NO_CHANGE'
+    if base_type == 'DIRECT_VALUE_CHANGE' and formula_only_mode:
+        return 'NO_CHANGE'
+    return base_type
+
+def _is_filtered_out(change_type):
+    # 根據設定過濾變更
+    return (
+        change_type in ('FORMULA_CHANGE_INTERNAL', 'EXTERNAL_REF_LINK_CHANGE') and not settings.TRACK_FORMULA_CHANGES
+    ) or (
+        change_type == 'DIRECT_VALUE_CHANGE' and not settings.TRACK_DIRECT_VALUE_CHANGES
+    ) or (
+        change_type in ('EXTERNAL_REFRESH_UPDATE', 'EXTERNAL_REF_LINK_CHANGE') and not settings.TRACK_EXTERNAL_REFERENCES
+    ) or (
+        change_type == 'INDIRECT_CHANGE' and settings.IGNORE_INDIRECT_CHANGES
+    )
+
+def _excluded_change_types():
+    # 設定只需讀一次：算出會被過濾掉的分類集合
+    from core.vector_diff import CHANGE_TYPES
+    return {t for t in CHANGE_TYPES if _is_filtered_out(t)}
+
+def _use_vector_diff(old_ws, new_ws):
+    if getattr(settings, 'DIFF_ENGINE', 'python') != 'polars':
+        return False
+    from core.vector_diff import HAS_POLARS
+    if not HAS_POLARS:
+        return False
+    return (len(old_ws) + len(new_ws)) >= int(getattr(settings, 'VECTOR_DIFF_MIN_CELLS', 50000))
+
+def _diff_sheet_vectorized(old_ws, new_ws, flags, excluded, counters):
+    from core.vector_diff import diff_sheet_vectorized
+    rows, base_counts = diff_sheet_vectorized(old_ws, new_ws, flags, excluded)
+    if counters is not None:
+        for base_type, n in base_counts.items():
+            counters['total_changes'] += n
+            key = _COUNTER_KEYS.get(base_type)
+            if key:
+                counters[key] += n
+    meaningful_changes = []
+    for addr, change_type in rows:
+        old_cell = old_ws.get(addr, {})
+        new_cell = new_ws.get(addr, {})
+        meaningful_changes.append({
+            'address': addr,
+            'old_value': _display_value(old_cell),
+            'new_value': _display_value(new_cell),
+            'old_formula': old_cell.get('formula'),
+            'new_formula': new_cell.get('formula'),
+            'change_type': change_type
+        })
+    return meaningful_changes
+
+def _diff_sheet(old_ws, new_ws, flags, counters=None):
+    """
+    單張工作表的單次比對：每個不同的儲存格只分類一次（中性分類），
+    同時累計事件統計（counters）並產生套用顯示旗標與過濾設定後的有意義變更列表。
+    DIFF_ENGINE='polars' 且儲存格數達 VECTOR_DIFF_MIN_CELLS 時改用向量化比對（失敗時退回逐格比對）。
+    """
+    excluded = _excluded_change_types()
+    if _use_vector_diff(old_ws, new_ws):
+        try:
+            sheet_counters = _empty_counters() if counters is not None else None
+            result = _diff_sheet_vectorized(old_ws, new_ws, flags, excluded, sheet_counters)
+            if counters is not None:
+                for k, v in sheet_counters.items():
+                    counters[k] += v
+            return result
+        except Exception as e:
+            logging.warning(f"向量化比對失敗，改用逐格比對: {e}")
+
     meaningful_changes = []
     all_addresses = set(old_ws.keys()) | set(new_ws.keys())
-    
+
     for addr in all_addresses:
         old_cell = old_ws.get(addr, {})
         new_cell = new_ws.get(addr, {})
-        
+
         if old_cell == new_cell:
             continue
 
-        change_type = classify_change_type(
-            old_cell,
-            new_cell,
-            show_external_refresh=getattr(settings, 'SHOW_EXTERNAL_REFRESH_CHANGES', True),
-            suppress_internal_same_value=getattr(settings, 'SUPPRESS_INTERNAL_FORMULA_CHANGE_WITH_SAME_VALUE', False),
-            formula_only_mode=getattr(settings, 'FORMULA_ONLY_MODE', False),
-        )
-        
-        # 根據設定過濾變更
-        if (
-            change_type in ('FORMULA_CHANGE_INTERNAL', 'EXTERNAL_REF_LINK_CHANGE') and not settings.TRACK_FORMULA_CHANGES
-        ) or (
-            change_type == 'DIRECT_VALUE_CHANGE' and not settings.TRACK_DIRECT_VALUE_CHANGES
-        ) or (
-            change_type in ('EXTERNAL_REFRESH_UPDATE', 'EXTERNAL_REF_LINK_CHANGE') and not settings.TRACK_EXTERNAL_REFERENCES
-        ) or (
-            change_type == 'INDIRECT_CHANGE' and settings.IGNORE_INDIRECT_CHANGES
-        ):
+        base_type = classify_change_type(old_cell, new_cell)
+        old_val = _display_value(old_cell)
+        new_val = _display_value(new_cell)
+        if counters is not None:
+            counters['total_changes'] += 1
+            key = _COUNTER_KEYS.get(base_type)
+            if key:
+                counters[key] += 1
+
+        change_type = _apply_display_flags(base_type, old_val, new_val, **flags)
+        if change_type in excluded:
             continue
 
-        # 將輸出值優先用 cached_value（若存在）
-        def _disp(x):
-            return x.get('cached_value') if x.get('cached_value') is not None else x.get('value')
         meaningful_changes.append({
             'address': addr,
-            'old_value': _disp(old_cell),
-            'new_value': _disp(new_cell),
+            'old_value': old_val,
+            'new_value': new_val,
             'old_formula': old_cell.get('formula'),
             'new_formula': new_cell.get('formula'),
             'change_type': change_type
         })
-    
+
     return meaningful_changes
 
+class DiffResult:
+    """
+    一次事件的比對結果（每個儲存格只分類一次），供主控台顯示、CSV 記錄、歷史快照與事件索引共用：
+    - sheets：{ 工作表: 有意義變更列表 }（只含有差異的工作表，依活頁簿順序）
+    - sheet_counters：{ 工作表: 該表統計 }
+    - counters：整本統計 dvc/fci/xrlc/xru/addc/delc/total_changes（中性分類，與顯示設定無關）
+    """
+
+    def __init__(self):
+        self.sheets = {}
+        self.sheet_counters = {}
+        self.counters = _empty_counters()
+
+    @property
+    def meaningful_count(self):
+        return sum(len(v) for v in self.sheets.values())
+
+    @property
+    def has_changes(self):
+        return bool(self.sheets)
+
+    @classmethod
+    def compute(cls, old_cells, new_cells, sheet_names=None):
+        result = cls()
+        old_cells = old_cells or {}
+        new_cells = new_cells or {}
+        if sheet_names is None:
+            sheet_names = list(new_cells.keys()) + [s for s in old_cells.keys() if s not in new_cells]
+        flags = _display_flags()
+        for name in sheet_names:
+            old_ws = old_cells.get(name, {})
+            new_ws = new_cells.get(name, {})
+            if old_ws == new_ws:
+                continue
+            sheet_counters = _empty_counters()
+            result.sheets[name] = _diff_sheet(old_ws, new_ws, flags, sheet_counters)
+            result.sheet_counters[name] = sheet_counters
+            for k, v in sheet_counters.items():
+                result.counters[k] += v
+        return result
+
+def analyze_meaningful_changes(old_ws, new_ws):
+    """
+    🧠 分析有意義的變更
+    """
+    return _diff_sheet(old_ws, new_ws, _display_flags())
+
 def classify_change_type(old_cell, new_cell, *, show_external_refresh=True, suppress_internal_same_value=False, formula_only_mode=False):
     """
     🔍 分類變更類型
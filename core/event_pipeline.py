@@ -0,0 +1,183 @@
+"""
+非同步事件管線 - watchdog 的 observer 執行緒只負責把 (路徑, 事件時間) 放入佇列，
+複製/解析/比對由固定大小的工作執行緒池處理，一個大檔不會卡住其他檔案的事件。
+
+- 同一檔案同時只由一個工作執行緒處理；處理期間再收到的事件合併為一筆（只保留最新的），處理完立即接續。
+  同一檔案的不同工作（修改事件、輪詢穩定後的比較）各自合併、依排入順序執行，不會互相取代。
+- 佇列有上限（EVENT_QUEUE_MAX 個不同檔案）；滿了時 observer 執行緒等待（背壓），不丟棄事件。
+- 統計：佇列深度、處理中數量、各階段（queue/compute/author/monitor_only/render/baseline/total）的次數、平均與最大耗時。
+"""
+import time
+import logging
+import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
+import config.settings as settings
+
+
+class _StageStats:
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+
+class EventPipeline:
+    """
+    以檔案路徑為鍵的工作佇列。submit(key, fn, *args) 排入工作，工作執行緒呼叫 fn(*args)。
+    """
+
+    def __init__(self, workers=None, max_pending=None, name='event'):
+        self.workers = max(1, int(workers or getattr(settings, 'EVENT_WORKERS', 2) or 1))
+        self.max_pending = max(1, int(max_pending or getattr(settings, 'EVENT_QUEUE_MAX', 1000) or 1))
+        self.name = name
+        self._cond = threading.Condition()
+        self._pending = OrderedDict()  # key -> [(fn, args, 排入時間), ...]（每種 fn 最多一筆）
+        self._ready = deque()          # 可立即處理的 key（不在處理中）
+        self._running = set()
+        self._threads = []
+        self._stopped = False
+        self._stats_lock = threading.Lock()
+        self._stages = {}
+        self.submitted = 0
+        self.coalesced = 0
+        self.processed = 0
+        self.failed = 0
+
+    # ---- 生命週期 ----
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            self._stopped = False
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f'{self.name}-worker-{i + 1}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, wait=False, timeout=None):
+        """停止接受新工作並喚醒工作執行緒；尚未開始的工作直接丟棄。"""
+        with self._cond:
+            self._stopped = True
+            self._pending.clear()
+            self._ready.clear()
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join(timeout)
+        self._threads = []
+
+    # ---- 排入 ----
+    def submit(self, key, fn, *args):
+        """排入一筆工作；同一 key、同一 fn 尚未開始的工作以新的取代（合併）。返回是否已排入。"""
+        with self._cond:
+            if self._stopped:
+                return False
+            if not self._threads:
+                self.start()
+            self.submitted += 1
+            while True:
+                entries = self._pending.get(key)
+                if entries is not None:
+                    # key 已在佇列或處理中：同一種工作合併，不同工作排在其後
+                    for i, (queued_fn, _, queued_at) in enumerate(entries):
+                        if queued_fn == fn:
+                            entries[i] = (fn, args, queued_at)
+                            self.coalesced += 1
+                            return True
+                    entries.append((fn, args, time.time()))
+                    return True
+                if len(self._pending) < self.max_pending:
+                    break
+                # 背壓：不同檔案數量達上限時等待，而不是丟棄事件
+                self._cond.wait(0.5)
+                if self._stopped:
+                    return False
+            self._pending[key] = [(fn, args, time.time())]
+            if key not in self._running:
+                self._ready.append(key)
+                self._cond.notify()
+            return True
+
+    # ---- 處理 ----
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                key = self._ready.popleft()
+                entries = self._pending[key]
+                fn, args, queued_at = entries.pop(0)
+                if not entries:
+                    del self._pending[key]
+                self._running.add(key)
+                self._cond.notify_all()  # 釋放一個佇列名額
+            self.record('queue', time.time() - queued_at)
+            try:
+                fn(*args)
+                ok = True
+            except Exception as e:
+                ok = False
+                logging.error(f"事件處理失敗: {key}: {e}", exc_info=True)
+            with self._cond:
+                self._running.discard(key)
+                if ok:
+                    self.processed += 1
+                else:
+                    self.failed += 1
+                # 處理期間又收到同一檔案的事件：接著處理
+                if key in self._pending and not self._stopped:
+                    self._ready.append(key)
+                    self._cond.notify()
+
+    # ---- 統計 ----
+    def record(self, stage, seconds):
+        with self._stats_lock:
+            st = self._stages.get(stage)
+            if st is None:
+                st = self._stages[stage] = _StageStats()
+            st.add(seconds)
+
+    @contextmanager
+    def timed(self, stage):
+        """記錄一個階段的耗時：with pipeline.timed('compare'): ..."""
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.record(stage, time.time() - started)
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self):
+        with self._cond:
+            depth, running = len(self._pending), len(self._running)
+        with self._stats_lock:
+            stages = {name: {'count': st.count,
+                             'avg_ms': st.total / st.count * 1000 if st.count else 0.0,
+                             'max_ms': st.max * 1000}
+                      for name, st in self._stages.items()}
+        return {'queue_depth': depth, 'running': running, 'workers': self.workers,
+                'submitted': self.submitted, 'coalesced': self.coalesced,
+                'processed': self.processed, 'failed': self.failed, 'stages': stages}
+
+    def format_stats(self):
+        s = self.stats()
+        parts = [f"佇列 {s['queue_depth']}，處理中 {s['running']}/{s['workers']}，"
+                 f"已處理 {s['processed']}（失敗 {s['failed']}，合併 {s['coalesced']}）"]
+        for name, st in s['stages'].items():
+            parts.append(f"{name} {st['count']} 次 平均 {st['avg_ms']:.0f}ms / 最大 {st['max_ms']:.0f}ms")
+        return '；'.join(parts)
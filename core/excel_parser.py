@@ -6,13 +6,15 @@ import time
 import zipfile
 import xml.etree.ElementTree as ET
 import re
-import json
-import hashlib
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from openpyxl import load_workbook
 from openpyxl.worksheet.formula import ArrayFormula
 import config.settings as settings
-from utils.cache import copy_to_cache
+from utils.cache import copy_to_cache, lease_for
+from utils.value_engines.stream_reader import col_letters, workbook_sheet_members
+from utils.cell_store import compact_workbook
+from utils.content_hash import build_content_tree
 import logging
 import urllib.parse
 
@@ -182,20 +184,21 @@ def serialize_cell_value(value):
         return value
     return str(value)
 
-def get_excel_last_author(path):
+def get_excel_last_author(path, lease=None):
     """
     以非鎖定方式讀取 Excel 檔案的最後修改者：
     - 優先從快取副本的 docProps/core.xml 解析 cp:lastModifiedBy（不開啟原檔，不用 openpyxl）。
     - 如遇非常規檔案或解析失敗，才退回以 openpyxl 讀取「快取檔」。
+    lease：同一事件共用的快取租約（utils.cache.CacheLease），沿用其副本與已開啟的 zip。
     """
     try:
         # 先複製到本地快取，避免直接打開原始檔案
-        local_path = copy_to_cache(path, silent=True)
-        if not local_path or not os.path.exists(local_path):
-            return None
-        try:
-            with zipfile.ZipFile(local_path, 'r') as z:
-                core_xml = z.read('docProps/core.xml')
+        with lease_for(path, lease) as l:
+            local_path = l.local_path
+            if not local_path:
+                return None
+            try:
+                core_xml = l.zip().read('docProps/core.xml')
                 root = ET.fromstring(core_xml)
                 ns = {
                     'cp': 'http://schemas.openxmlformats.org/package/2006/metadata/core-properties',
@@ -206,9 +209,9 @@ def get_excel_last_author(path):
                     node = root.find('dc:lastModifiedBy', ns)  # 極少數模板可能使用 dc
                 author = (node.text or '').strip() if node is not None else None
                 return author or None
-        except (KeyError, zipfile.BadZipFile, ET.ParseError):
-            # 結構異常或非 zip 格式（例如舊 xls），退回 openpyxl（仍用本地快取檔）
-            pass
+            except (KeyError, zipfile.BadZipFile, ET.ParseError):
+                # 結構異常或非 zip 格式（例如舊 xls），退回 openpyxl（仍用本地快取檔）
+                pass
 
         # Fallback：對快取檔使用 openpyxl（不會鎖定原檔）
         try:
@@ -249,9 +252,125 @@ def safe_load_workbook(path, max_retry=5, delay=0.5, **kwargs):
             break
     raise last_err
 
-def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):  # noqa: C901
+def _iter_sheet_cells_dense(ws):
+    """
+    逐格走訪 1..max_row × 1..max_column 的矩形範圍（包含大量 EmptyCell）
+    """
+    for r_idx, row in enumerate(ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=1, max_col=ws.max_column, values_only=False), start=1):
+        for c_idx, cell in enumerate(row, start=1):
+            # ⚡️ Patch: formula 直接存 cell.formula if present, fallback get_cell_formula
+            try:
+                if hasattr(cell, 'formula') and cell.formula:
+                    fstr = cell.formula
+                else:
+                    fstr = get_cell_formula(cell)
+            except Exception:
+                fstr = None
+            yield r_idx, c_idx, fstr, getattr(cell, 'value', None)
+
+def _iter_sheet_cells_sparse(ws):
+    """
+    只走訪 worksheet XML 中實際存在的 <c> 元素（使用 openpyxl 自身的 WorkSheetParser，
+    公式語意與 iter_rows 相同），不受 max_row/max_column 影響：
+    一個位於 XFD1048576 的格式化儲存格不會令迴圈膨脹為整張表。
+    """
+    from openpyxl.worksheet._reader import WorkSheetParser
+    wb = ws.parent
+    with ws._get_source() as src:
+        parser = WorkSheetParser(src, ws._shared_strings, data_only=False, epoch=wb.epoch,
+                                 date_formats=wb._date_formats, timedelta_formats=wb._timedelta_formats)
+        for _, row in parser.parse():
+            for c in row:
+                value = c.get('value')
+                fstr = None
+                if c.get('data_type') == 'f':
+                    fstr = value.text if isinstance(value, ArrayFormula) else value
+                yield c['row'], c['column'], fstr, value
+
+def _iter_sheet_cells(ws, sparse=True):
+    """
+    產出 (row, col, formula, raw_value)；sparse 模式需要 read_only 工作表，不支援時退回逐格走訪。
+    sparse 依賴 openpyxl 的內部介面（_get_source、_date_formats、WorkSheetParser），這些錯誤在走訪時才會出現：
+    走訪中失敗時改以逐格走訪接續，已產出的位置（兩者皆依列優先順序）不重複產出。
+    """
+    last = None
+    if sparse and hasattr(ws, '_get_source'):
+        try:
+            for item in _iter_sheet_cells_sparse(ws):
+                last = (item[0], item[1])
+                yield item
+            return
+        except Exception as e:
+            logging.warning(f"sparse 走訪失敗，改用逐格走訪: sheet='{getattr(ws, 'title', '')}' err={e}")
+    for item in _iter_sheet_cells_dense(ws):
+        if last is None or (item[0], item[1]) > last:
+            yield item
+
+def _iter_sheet_entries(ws, ref_map, sparse_mode):
+    """
+    走訪單張表，產出 (addr, formula, raw_value)；公式已對外部參照做正規化展示（還原路徑，解 %20，統一反斜線）
+    """
+    if not (sparse_mode or ws.max_row > 1 or ws.max_column > 1):
+        return
+    for r_idx, c_idx, fstr, raw_value in _iter_sheet_cells(ws, sparse=sparse_mode):
+        # 使用索引安全推導地址（預先計算的欄位字母表），避免 EmptyCell 無 coordinate 造成早退
+        addr = f"{col_letters(c_idx)}{r_idx}"
+        if fstr:
+            try:
+                fstr = pretty_formula(fstr, ref_map=ref_map)
+            except Exception:
+                pass
+        yield addr, fstr, raw_value
+
+# 逐表平行解析的子行程狀態：每個 worker 在 initializer 以 read_only 開啟一次快取副本
+_sheet_worker_state = {}
+
+def _init_openpyxl_sheet_worker(local_path, ref_map, sparse_mode):
+    wb = safe_load_workbook(local_path, read_only=True, data_only=False)
+    if wb is None:
+        raise RuntimeError(f"子行程無法開啟活頁簿: {local_path}")
+    _sheet_worker_state['wb'] = wb
+    _sheet_worker_state['ref_map'] = ref_map
+    _sheet_worker_state['sparse'] = sparse_mode
+
+def _scan_openpyxl_sheet_worker(title):
+    """
+    子行程：走訪一張工作表，返回 (title, [(addr, formula, value)], 錯誤訊息或 None)；
+    raw_value 先序列化再跨行程傳回（serialize_cell_value 對已序列化的值不變）
+    """
+    entries = []
+    try:
+        ws = _sheet_worker_state['wb'][title]
+        for addr, fstr, raw_value in _iter_sheet_entries(ws, _sheet_worker_state['ref_map'], _sheet_worker_state['sparse']):
+            entries.append((addr, fstr, serialize_cell_value(raw_value)))
+    except Exception as e:
+        return title, entries, str(e)
+    return title, entries, None
+
+def _scan_sheets_in_pool(local_path, titles, ref_map, sparse_mode, workers):
+    """
+    FORMULA_ENGINE='openpyxl' 的逐表平行解析：各 worker 自行載入活頁簿，依工作表名稱分配；
+    大表（sheet XML 較大）先送出，讓負載較平均。結果以工作表名稱為 key，由呼叫方依活頁簿順序合併。
+    """
+    sizes = {}
+    try:
+        with zipfile.ZipFile(local_path, 'r') as z:
+            sizes = {nm: z.getinfo(m).file_size for nm, m in workbook_sheet_members(z)}
+    except (zipfile.BadZipFile, OSError, KeyError, ET.ParseError):
+        pass
+    order = sorted(titles, key=lambda t: sizes.get(t, 0), reverse=True)
+    scanned = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_openpyxl_sheet_worker,
+                             initargs=(local_path, ref_map, sparse_mode)) as pool:
+        for title, entries, err in pool.map(_scan_openpyxl_sheet_worker, order):
+            scanned[title] = (entries, err)
+    return scanned
+
+def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False, only_sheets=None, local_path=None):  # noqa: C901
     """
     提取 Excel 檔案中的所有儲存格數據（含公式）
+    only_sheets：只解析指定名稱的工作表（配合 zip fingerprint 跳過未變更的工作表）
+    local_path：呼叫方已取得的快取副本（CacheLease.local_path），不再重新 copy_to_cache
     """
     # 更新全局變數
     settings.current_processing_file = path
@@ -262,14 +381,19 @@ def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
         if not silent: 
             print(f"   📊 檔案大小: {os.path.getsize(path)/(1024*1024):.1f} MB")
         
-        local_path = copy_to_cache(path, silent=silent)
+        if not local_path:
+            local_path = copy_to_cache(path, silent=silent)
         if not local_path or not os.path.exists(local_path):
             if not silent:
                 print("   ❌ 無法使用快取副本（嚴格模式下不會讀取原檔），略過此檔案。")
             return None
         
+        # 公式引擎 xml：單次串流解析，公式與值一次取得，不經 openpyxl 與值引擎的雙重讀取
+        if getattr(settings, 'FORMULA_ENGINE', 'openpyxl') == 'xml':
+            return _dump_cells_via_stream(local_path, show_sheet_detail=show_sheet_detail, silent=silent, only_sheets=only_sheets)
+
         read_only_mode = True
-        if not silent: 
+        if not silent:
             print(f"   🚀 讀取模式: read_only={read_only_mode}, data_only=False")
         
         wb = safe_load_workbook(local_path, read_only=read_only_mode, data_only=False)
@@ -384,7 +508,24 @@ def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
                 sheet_order = []
 
         per_sheet_formula_provided = {}
+        sparse_mode = bool(getattr(settings, 'SPARSE_CELL_ITERATION', True))
+
+        # 逐表平行解析：大檔且多張表時，各工作表交由行程池走訪，值引擎的值仍在此依活頁簿順序合併
+        titles = [ws.title for ws in wb.worksheets if only_sheets is None or ws.title in only_sheets]
+        workers = min(_sheet_workers_for(local_path), len(titles))
+        if not silent:
+            print(f"   [formula-engine] openpyxl | sheet_workers={max(workers, 1)}")
+        scanned = None
+        if workers > 1:
+            try:
+                scanned = _scan_sheets_in_pool(local_path, titles, ref_map, sparse_mode, workers)
+            except Exception as e:
+                logging.warning(f"逐表平行解析失敗，改為單行程解析: {path}, {e}")
+                scanned = None
+
         for idx, ws in enumerate(wb.worksheets, 1):
+            if only_sheets is not None and ws.title not in only_sheets:
+                continue
             cell_count = 0
             ws_data = {}
             formula_addrs = []
@@ -411,54 +552,37 @@ def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
                     show_keys = []
                 print(f"   [map] ws_index={idx} ws_title='{ws.title}' -> key='{selected_key or ''}' provided={p_count} keys={show_keys}")
 
-            if ws.max_row > 1 or ws.max_column > 1:
-                try:
-                    # 使用索引安全推導地址，避免 EmptyCell 無 coordinate 造成早退
-                    def _col_to_letters(n: int) -> str:
-                        s = ''
-                        while n > 0:
-                            n, r = divmod(n-1, 26)
-                            s = chr(65 + r) + s
-                        return s
-                    for r_idx, row in enumerate(ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=1, max_col=ws.max_column, values_only=False), start=1):
-                        for c_idx, cell in enumerate(row, start=1):
-                            addr = f"{_col_to_letters(c_idx)}{r_idx}"
-                            # ⚡️ Patch: formula 直接存 cell.formula if present, fallback get_cell_formula
-                            try:
-                                if hasattr(cell, 'formula') and cell.formula:
-                                    fstr = cell.formula
-                                else:
-                                    fstr = get_cell_formula(cell)
-                            except Exception:
-                                fstr = None
-                            # 對外部參照做正規化展示（還原路徑，解 %20，統一反斜線）
-                            if fstr:
-                                try:
-                                    fstr = pretty_formula(fstr, ref_map=ref_map)
-                                except Exception:
-                                    pass
-                                formula_addrs.append(addr)
-                                formula_cells_global += 1
-                            # 取值（由值引擎供應）
-                            try:
-                                vstr = sheet_vals.get(addr)
-                            except Exception as _e:
-                                if not silent:
-                                    print(f"   [read_error] sheet='{ws.title}' addr='{addr}' op='assemble' err={_e}")
-                                try:
-                                    vstr = serialize_cell_value(getattr(cell, 'value', None))
-                                except Exception:
-                                    vstr = None
-                            if fstr is not None or vstr is not None:
-                                # 若值引擎已提供顯示值，直接作為 cached_value 使用，避免後續二次 data_only pass
-                                cached_v = vstr if value_engine in ('polars','polars_xml','xml') else None
-                                ws_data[addr] = {"formula": fstr, "value": vstr, "cached_value": cached_v}
-                                if fstr and (vstr is not None):
-                                    per_sheet_formula_provided[selected_key or ws.title] = per_sheet_formula_provided.get(selected_key or ws.title, 0) + 1
-                                cell_count += 1
-                except Exception as _e:
-                    if not silent:
-                        print(f"   [read_error] sheet='{ws.title}' op='iterate_rows' err={_e}")
+            try:
+                if scanned is not None:
+                    entries, scan_err = scanned.get(ws.title, ([], None))
+                else:
+                    entries, scan_err = _iter_sheet_entries(ws, ref_map, sparse_mode), None
+                for addr, fstr, raw_value in entries:
+                    if fstr:
+                        formula_addrs.append(addr)
+                        formula_cells_global += 1
+                    # 取值（由值引擎供應）
+                    try:
+                        vstr = sheet_vals.get(addr)
+                    except Exception as _e:
+                        if not silent:
+                            print(f"   [read_error] sheet='{ws.title}' addr='{addr}' op='assemble' err={_e}")
+                        try:
+                            vstr = serialize_cell_value(raw_value)
+                        except Exception:
+                            vstr = None
+                    if fstr is not None or vstr is not None:
+                        # 若值引擎已提供顯示值，直接作為 cached_value 使用，避免後續二次 data_only pass
+                        cached_v = vstr if value_engine in ('polars','polars_xml','xml') else None
+                        ws_data[addr] = {"formula": fstr, "value": vstr, "cached_value": cached_v}
+                        if fstr and (vstr is not None):
+                            per_sheet_formula_provided[selected_key or ws.title] = per_sheet_formula_provided.get(selected_key or ws.title, 0) + 1
+                        cell_count += 1
+                if scan_err and not silent:
+                    print(f"   [read_error] sheet='{ws.title}' op='iterate_rows' err={scan_err}")
+            except Exception as _e:
+                if not silent:
+                    print(f"   [read_error] sheet='{ws.title}' op='iterate_rows' err={_e}")
             
             if show_sheet_detail and not silent: 
                 print(f"      處理工作表 {idx}/{worksheet_count}: {ws.title}（{cell_count} 有資料 cell）")
@@ -528,6 +652,8 @@ def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
         if not silent and show_sheet_detail: 
             print(f"   ✅ Excel 讀取完成")
         
+        if getattr(settings, 'COMPACT_CELL_STORAGE', True):
+            result = compact_workbook(result)
         return result
         
     except Exception as e:
@@ -543,16 +669,83 @@ def dump_excel_cells_with_timeout(path, show_sheet_detail=True, silent=False):
         settings.current_processing_file = None
         settings.processing_start_time = None
 
-def hash_excel_content(cells_dict):
+def _sheet_workers_for(local_path):
+    """
+    決定逐表平行解析的行程數：需啟用 PARALLEL_SHEET_PARSING，且檔案大於 PARALLEL_SHEET_MIN_FILE_MB
+    （小檔案啟動行程池的成本高於收益）；上限為 MAX_SHEET_WORKERS 與 CPU 核心數。
     """
-    計算 Excel 內容的雜湊值
+    if not getattr(settings, 'PARALLEL_SHEET_PARSING', False):
+        return 1
+    try:
+        size_mb = os.path.getsize(local_path) / (1024 * 1024)
+    except OSError:
+        return 1
+    if size_mb < float(getattr(settings, 'PARALLEL_SHEET_MIN_FILE_MB', 5)):
+        return 1
+    max_workers = int(getattr(settings, 'MAX_SHEET_WORKERS', 1) or 1)
+    return max(1, min(max_workers, os.cpu_count() or 1))
+
+def _dump_cells_via_stream(local_path, show_sheet_detail=True, silent=False, only_sheets=None):
     """
-    if cells_dict is None: 
+    FORMULA_ENGINE='xml'：以 iterparse 單次走訪每張 worksheet XML，直接產生 {formula, value, cached_value}
+    """
+    from utils.value_engines.stream_reader import read_cells_from_xlsx_via_stream
+
+    workers = _sheet_workers_for(local_path)
+    if not silent:
+        print(f"   [formula-engine] XML stream (single pass: formula + cached value) | sheet_workers={workers}")
+    ref_map = extract_external_refs(local_path)
+
+    def _prettify(fstr):
+        return pretty_formula(fstr, ref_map=ref_map)
+
+    def _on_sheet(idx, total, name, cell_count):
+        if idx == 1 and not silent and show_sheet_detail:
+            print(f"   工作表數量: {total}")
+        if show_sheet_detail and not silent:
+            print(f"      處理工作表 {idx}/{total}: {name}（{cell_count} 有資料 cell）")
+
+    result = read_cells_from_xlsx_via_stream(local_path, formula_transform=_prettify, on_sheet=_on_sheet,
+                                             workers=workers, only_sheets=only_sheets,
+                                             compact=bool(getattr(settings, 'COMPACT_CELL_STORAGE', True)))
+    if not silent and show_sheet_detail:
+        print(f"   ✅ Excel 讀取完成")
+    return result
+
+def get_workbook_fingerprints(path, lease=None):
+    """
+    讀取快取副本 zip central directory 中各 worksheet / sharedStrings / externalLinks 的 CRC32 與大小，
+    供基準線記錄與「只重新解析有變動的工作表」使用。失敗時返回 None。
+    lease：同一事件共用的快取租約，沿用其已開啟的 zip。
+    """
+    try:
+        with lease_for(path, lease) as l:
+            if not l.local_path:
+                return None
+            # 以 xlsx2csv 讀值時，日期等顯示格式取決於 styles.xml
+            extra = ('xl/styles.xml',) if (getattr(settings, 'FORMULA_ENGINE', 'openpyxl') != 'xml'
+                                            and getattr(settings, 'VALUE_ENGINE', 'polars') == 'polars') else ()
+            from utils.value_engines.stream_reader import read_zip_fingerprints
+            return read_zip_fingerprints(l.zip(), extra_global=extra)
+    except (zipfile.BadZipFile, OSError, KeyError, ET.ParseError) as e:
+        logging.warning(f"讀取 zip fingerprint 失敗: {path}, {e}")
+        return None
+
+def build_excel_content_tree(cells_dict):
+    """
+    計算 Excel 內容的階層式雜湊樹（列區塊 → 工作表 → 活頁簿），逐區塊串流計算，不產生整本的 JSON 字串
+    """
+    if cells_dict is None:
         return None
-    
     try:
-        content_str = json.dumps(cells_dict, sort_keys=True, ensure_ascii=False)
-        return hashlib.md5(content_str.encode('utf-8')).hexdigest()
-    except (TypeError, json.JSONEncodeError) as e:
+        return build_content_tree(cells_dict)
+    except (TypeError, ValueError) as e:
         logging.error(f"計算 Excel 內容雜湊值失敗: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def hash_excel_content(cells_dict):
+    """
+    計算 Excel 內容的雜湊值（雜湊樹的根）
+    """
+    tree = build_excel_content_tree(cells_dict)
+    return tree['hash'] if tree else None
\ No newline at end of file
@@ -0,0 +1,296 @@
+"""
+隔離行程解析 - 在可被強制終止的子行程中執行 Excel 解析，真正落實 FILE_TIMEOUT_SECONDS
+
+- 子行程常駐重用：openpyxl 等模組只在子行程啟動時匯入一次，之後每次解析只傳送一則任務訊息
+- 只有逾時、停止或異常結束時才終止該子行程並於下次需要時重新啟動；處理 _MAX_TASKS_PER_WORKER 次後也會汰換，避免記憶體累積
+- 目前正在解析的檔案依呼叫執行緒分別記錄（current_parses），多個執行緒同時解析時互不覆蓋
+"""
+import os
+import gc
+import time
+import atexit
+import signal
+import logging
+import threading
+import multiprocessing
+import config.settings as settings
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+# 子行程需要沿用的設定型別（執行期由 UI/runtime 覆寫的值也要帶過去）
+_SNAPSHOT_TYPES = (bool, int, float, str, list, tuple, dict, type(None))
+
+# 等待結果時每次輪詢的秒數（期間檢查 force_stop 與逾時）
+_POLL_SLICE_SEC = 0.5
+
+# 單一子行程處理多少次任務後汰換
+_MAX_TASKS_PER_WORKER = 200
+
+_pool_lock = threading.Lock()
+_idle_workers = []
+_all_workers = set()
+_shutdown_registered = False
+
+# 執行緒 id -> 正在隔離解析的檔案路徑
+_active_lock = threading.Lock()
+_active_parses = {}
+
+
+class ParseTimeout(Exception):
+    """子行程在期限內未完成解析。"""
+
+
+class ParseCancelled(Exception):
+    """解析因停止要求（force_stop）而被中止。"""
+
+
+def _settings_snapshot():
+    snap = {}
+    for k in dir(settings):
+        if not k.isupper():
+            continue
+        v = getattr(settings, k, None)
+        if isinstance(v, _SNAPSHOT_TYPES):
+            snap[k] = v
+    return snap
+
+
+def _worker_main(conn):
+    """
+    常駐子行程入口：逐一接收 (設定快照, target, args, kwargs)，套用快照後執行 target 並送回結果；收到 None 或通道關閉時結束。
+    Ctrl+C 由父行程處理（設定 force_stop 後終止子行程），子行程本身忽略 SIGINT，避免閒置的子行程被一併中斷。
+    """
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    except (ValueError, OSError):
+        pass
+    try:
+        while True:
+            try:
+                task = conn.recv()
+            except (EOFError, OSError):
+                break
+            if task is None:
+                break
+            snapshot, target, args, kwargs = task
+            try:
+                for k, v in (snapshot or {}).items():
+                    setattr(settings, k, v)
+                result = target(*args, **kwargs)
+                conn.send(('ok', result))
+            except BaseException as e:
+                try:
+                    conn.send(('error', f"{type(e).__name__}: {e}"))
+                except Exception:
+                    break
+            finally:
+                result = None
+                gc.collect()
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _kill_process_tree(proc):
+    """
+    終止子行程；若有 psutil，一併終止其衍生的行程（例如逐表平行解析的行程池）。
+    """
+    if HAS_PSUTIL:
+        try:
+            parent = psutil.Process(proc.pid)
+            for child in parent.children(recursive=True):
+                try:
+                    child.kill()
+                except psutil.Error:
+                    pass
+        except psutil.Error:
+            pass
+    try:
+        proc.kill()
+    except Exception:
+        try:
+            proc.terminate()
+        except Exception:
+            pass
+    proc.join(5)
+
+
+class _Worker:
+    def __init__(self):
+        ctx = multiprocessing.get_context('spawn')
+        self.conn, child_conn = ctx.Pipe(duplex=True)
+        # 非 daemon：子行程內可能再開逐表解析的行程池
+        self.proc = ctx.Process(target=_worker_main, args=(child_conn,), name='watchdog-parse-worker')
+        self.proc.start()
+        child_conn.close()
+        self.tasks = 0
+        _register_shutdown()
+
+    def kill(self):
+        _kill_process_tree(self.proc)
+        self._close_conn()
+
+    def close(self):
+        """通知子行程結束；未在時限內結束則強制終止"""
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self.proc.join(2)
+        if self.proc.is_alive():
+            _kill_process_tree(self.proc)
+        self._close_conn()
+
+    def _close_conn(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+def _max_idle_workers():
+    # 同時可能解析的執行緒數：事件管線工作執行緒與並行建立基準線
+    return max(1, int(getattr(settings, 'EVENT_WORKERS', 1) or 1), int(getattr(settings, 'BASELINE_BUILD_WORKERS', 1) or 1))
+
+
+def _acquire_worker():
+    with _pool_lock:
+        while _idle_workers:
+            worker = _idle_workers.pop()
+            if worker.proc.is_alive():
+                return worker
+            _all_workers.discard(worker)
+            worker._close_conn()
+    worker = _Worker()
+    with _pool_lock:
+        _all_workers.add(worker)
+    return worker
+
+
+def _release_worker(worker, reusable):
+    if reusable and worker.proc.is_alive() and worker.tasks < _MAX_TASKS_PER_WORKER:
+        with _pool_lock:
+            if len(_idle_workers) < _max_idle_workers():
+                _idle_workers.append(worker)
+                return
+    with _pool_lock:
+        _all_workers.discard(worker)
+    if reusable:
+        worker.close()
+    else:
+        worker.kill()
+
+
+def shutdown_workers():
+    """結束所有常駐的解析子行程（程式結束時呼叫；也由 atexit 保底）"""
+    with _pool_lock:
+        workers = list(_all_workers)
+        idle = set(_idle_workers)
+        _idle_workers.clear()
+        _all_workers.clear()
+    for worker in workers:
+        if worker in idle:
+            worker.close()
+        else:
+            worker.kill()
+
+
+def _register_shutdown():
+    # multiprocessing 結束時會等待所有非 daemon 子行程；atexit 後註冊先執行，須在其之後註冊才能先通知常駐子行程結束
+    global _shutdown_registered
+    with _pool_lock:
+        if _shutdown_registered:
+            return
+        _shutdown_registered = True
+    atexit.register(shutdown_workers)
+
+
+def run_in_worker(target, args=(), kwargs=None, timeout=None):
+    """
+    在常駐子行程執行 target(*args, **kwargs) 並返回其結果。
+    - 每次呼叫取得一個閒置的子行程（沒有則啟動新的），完成後放回重用
+    - 超過 timeout 秒：強制終止子行程並拋出 ParseTimeout
+    - settings.force_stop 被設定：強制終止子行程並拋出 ParseCancelled
+    - 子行程內發生例外：拋出 RuntimeError（子行程仍可重用）；子行程異常結束：拋出 RuntimeError
+    """
+    worker = _acquire_worker()
+    reusable = False
+    try:
+        worker.conn.send((_settings_snapshot(), target, tuple(args), dict(kwargs or {})))
+        worker.tasks += 1
+        deadline = (time.time() + float(timeout)) if timeout else None
+        while True:
+            if getattr(settings, 'force_stop', False):
+                raise ParseCancelled("停止要求，已中止解析子行程")
+            wait = _POLL_SLICE_SEC
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise ParseTimeout(f"解析超過 {timeout}s，已終止子行程 (pid={worker.proc.pid})")
+                wait = min(wait, remaining)
+            if worker.conn.poll(wait):
+                try:
+                    status, payload = worker.conn.recv()
+                except EOFError:
+                    worker.proc.join(5)
+                    raise RuntimeError(f"解析子行程異常結束 (exitcode={worker.proc.exitcode})")
+                reusable = True
+                if status == 'ok':
+                    return payload
+                raise RuntimeError(payload)
+            if not worker.proc.is_alive() and not worker.conn.poll(0):
+                raise RuntimeError(f"解析子行程異常結束 (exitcode={worker.proc.exitcode})")
+    finally:
+        _release_worker(worker, reusable)
+
+
+def current_parses():
+    """目前正在隔離子行程中解析的檔案（每個呼叫執行緒一筆）"""
+    with _active_lock:
+        return list(_active_parses.values())
+
+
+def _dump_in_child(path, show_sheet_detail, silent, only_sheets, local_path=None):
+    from core.excel_parser import dump_excel_cells_with_timeout
+    return dump_excel_cells_with_timeout(path, show_sheet_detail=show_sheet_detail, silent=silent, only_sheets=only_sheets, local_path=local_path)
+
+
+def dump_excel_cells_isolated(path, show_sheet_detail=True, silent=False, only_sheets=None, local_path=None, raise_timeout=False):
+    """
+    與 dump_excel_cells_with_timeout 相同的介面與返回值（失敗/逾時返回 None）。
+    ISOLATE_PARSE_PROCESS 啟用時在子行程解析，逾時（ENABLE_TIMEOUT/FILE_TIMEOUT_SECONDS）會真正終止解析；
+    停用時直接在目前行程解析。local_path 為已取得的快取副本（子行程直接讀取，不再複製）。
+    raise_timeout：逾時改為拋出 ParseTimeout，讓呼叫方區分逾時與讀取失敗。
+    """
+    if not getattr(settings, 'ISOLATE_PARSE_PROCESS', True):
+        from core.excel_parser import dump_excel_cells_with_timeout
+        return dump_excel_cells_with_timeout(path, show_sheet_detail=show_sheet_detail, silent=silent, only_sheets=only_sheets, local_path=local_path)
+
+    timeout = settings.FILE_TIMEOUT_SECONDS if getattr(settings, 'ENABLE_TIMEOUT', True) else None
+    # 狀態依執行緒記錄，不動全域的 settings.current_processing_file（多執行緒並行解析時會互相覆蓋）
+    ident = threading.get_ident()
+    with _active_lock:
+        _active_parses[ident] = path
+    try:
+        return run_in_worker(_dump_in_child, (path, show_sheet_detail, silent, only_sheets, local_path), timeout=timeout)
+    except ParseTimeout as e:
+        print(f"\n超時：{os.path.basename(path)} {e}")
+        logging.warning(f"解析逾時: {path}: {e}")
+        if raise_timeout:
+            raise
+        return None
+    except ParseCancelled:
+        return None
+    except Exception as e:
+        if not silent:
+            logging.error(f"隔離解析失敗: {path}: {e}")
+        return None
+    finally:
+        with _active_lock:
+            _active_parses.pop(ident, None)
@@ -0,0 +1,141 @@
+"""
+向量化差異比對（Polars）- 大型工作表的 outer join、相等遮罩與變更分類一次以欄式運算完成
+"""
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+try:
+    import polars as pl
+    HAS_POLARS = True
+except ImportError:
+    pl = None
+    HAS_POLARS = False
+
+from utils.cell_store import SheetCells, _encode_addr, _decode_key
+
+# 與 core.comparison.classify_change_type 相同的分類名稱
+CHANGE_TYPES = (
+    'CELL_ADDED', 'CELL_DELETED', 'EXTERNAL_REF_LINK_CHANGE', 'FORMULA_CHANGE_INTERNAL',
+    'EXTERNAL_REFRESH_UPDATE', 'INDIRECT_CHANGE', 'DIRECT_VALUE_CHANGE', 'NO_CHANGE',
+)
+
+_MAX_EXACT_INT = 2 ** 53
+
+
+def _norm(v) -> Optional[str]:
+    """
+    值的正規化字串，讓欄式相等比較與 Python 的 == 一致（1 == 1.0 == True；字串與數字不相等）。
+    """
+    if v is None:
+        return None
+    if isinstance(v, str):
+        return 's:' + v
+    if isinstance(v, (bool, int, float)):
+        try:
+            f = float(v)
+            if f.is_integer() and abs(f) < _MAX_EXACT_INT:
+                return 'n:%d' % int(f)
+            return 'n:' + repr(f)
+        except (OverflowError, ValueError):
+            return 'n:' + repr(v)
+    return 'o:' + repr(v)
+
+
+def _sheet_frame(ws: Mapping) -> 'pl.DataFrame':
+    """工作表 -> DataFrame(key, f, v, c)；SheetCells 直接以值池 gather，不逐格組 dict。"""
+    if not isinstance(ws, SheetCells) and hasattr(ws, 'load'):
+        ws = ws.load()  # 延遲載入的工作表
+    if isinstance(ws, SheetCells):
+        pool, keys, f_idx, v_idx, c_idx = ws.columns()
+        norm = pl.Series('n', [_norm(pool[i]) for i in range(len(pool))], dtype=pl.Utf8)
+        return pl.DataFrame({
+            'key': pl.Series('key', keys.tolist(), dtype=pl.Int64),
+            'f': norm.gather(pl.Series(f_idx.tolist(), dtype=pl.UInt32)),
+            'v': norm.gather(pl.Series(v_idx.tolist(), dtype=pl.UInt32)),
+            'c': norm.gather(pl.Series(c_idx.tolist(), dtype=pl.UInt32)),
+        })
+    keys: List[int] = []
+    fs: List[Optional[str]] = []
+    vs: List[Optional[str]] = []
+    cs: List[Optional[str]] = []
+    for addr, cell in ws.items():
+        try:
+            keys.append(_encode_addr(addr))
+        except KeyError:
+            raise ValueError(f"無法向量化的地址: {addr!r}")
+        cell = cell if isinstance(cell, dict) else {'value': cell}
+        fs.append(_norm(cell.get('formula')))
+        vs.append(_norm(cell.get('value')))
+        cs.append(_norm(cell.get('cached_value')))
+    return pl.DataFrame({
+        'key': pl.Series('key', keys, dtype=pl.Int64),
+        'f': pl.Series('f', fs, dtype=pl.Utf8),
+        'v': pl.Series('v', vs, dtype=pl.Utf8),
+        'c': pl.Series('c', cs, dtype=pl.Utf8),
+    })
+
+
+def _outer_join(a: 'pl.DataFrame', b: 'pl.DataFrame') -> 'pl.DataFrame':
+    try:
+        return a.join(b, on='key', how='full', coalesce=True, suffix='_new')
+    except (TypeError, ValueError):
+        # 舊版 Polars
+        return a.join(b, on='key', how='outer_coalesce', suffix='_new')
+
+
+def _has_ext(col: 'pl.Expr') -> 'pl.Expr':
+    return (col.str.contains("['", literal=True) | col.str.contains("!'", literal=True)).fill_null(False)
+
+
+def diff_sheet_vectorized(old_ws: Mapping, new_ws: Mapping, flags: Dict[str, bool],
+                          excluded_types: Iterable[str]) -> Tuple[List[Tuple[str, str]], Dict[str, int]]:
+    """
+    向量化比對單張工作表。
+    返回 ([(address, 顯示分類), ...] 依地址排序、已套用顯示旗標與過濾, { 中性分類: 筆數 })。
+    分類規則與 core.comparison.classify_change_type 相同。
+    """
+    old = _sheet_frame(old_ws).with_columns(pl.lit(True).alias('po'))
+    new = _sheet_frame(new_ws).with_columns(pl.lit(True).alias('pn'))
+    j = _outer_join(old, new)
+
+    po = pl.col('po').fill_null(False)
+    pn = pl.col('pn').fill_null(False)
+    f_old, f_new = pl.col('f'), pl.col('f_new')
+    d_old = pl.coalesce([pl.col('c'), pl.col('v')])
+    d_new = pl.coalesce([pl.col('c_new'), pl.col('v_new')])
+    same_cell = po & pn & f_old.eq_missing(f_new) & pl.col('v').eq_missing(pl.col('v_new')) & pl.col('c').eq_missing(pl.col('c_new'))
+    same_display = d_old.eq_missing(d_new)
+    # 與 classify_change_type 的 `if old_formula and new_formula` 一致：空字串公式視為無公式
+    has_f_old = (f_old.is_not_null() & (f_old != 's:')).fill_null(False)
+    has_f_new = (f_new.is_not_null() & (f_new != 's:')).fill_null(False)
+
+    base = (
+        pl.when(~po).then(pl.lit('CELL_ADDED'))
+        .when(~pn).then(pl.lit('CELL_DELETED'))
+        .when(~f_old.eq_missing(f_new)).then(
+            pl.when(_has_ext(f_old) | _has_ext(f_new)).then(pl.lit('EXTERNAL_REF_LINK_CHANGE'))
+            .otherwise(pl.lit('FORMULA_CHANGE_INTERNAL')))
+        .when(has_f_old & has_f_new & ~same_display).then(
+            pl.when(_has_ext(f_old)).then(pl.lit('EXTERNAL_REFRESH_UPDATE'))
+            .otherwise(pl.lit('INDIRECT_CHANGE')))
+        .when(~has_f_old & ~has_f_new & ~same_display).then(pl.lit('DIRECT_VALUE_CHANGE'))
+        .otherwise(pl.lit('NO_CHANGE'))
+    )
+
+    changed = j.lazy().filter(~same_cell).with_columns(base.alias('base'), same_display.alias('same_display'))
+
+    display = pl.col('base')
+    if flags.get('suppress_internal_same_value'):
+        display = pl.when((pl.col('base') == 'FORMULA_CHANGE_INTERNAL') & pl.col('same_display')).then(pl.lit('NO_CHANGE')).otherwise(display)
+    if not flags.get('show_external_refresh', True):
+        display = pl.when(pl.col('base') == 'EXTERNAL_REFRESH_UPDATE').then(pl.lit('NO_CHANGE')).otherwise(display)
+    if flags.get('formula_only_mode'):
+        display = pl.when(pl.col('base') == 'DIRECT_VALUE_CHANGE').then(pl.lit('NO_CHANGE')).otherwise(display)
+
+    changed = changed.with_columns(display.alias('display')).select('key', 'base', 'display').collect()
+
+    counts = {row[0]: int(row[1]) for row in changed.group_by('base').len().iter_rows()}
+    excluded = list(excluded_types)
+    kept = changed.filter(~pl.col('display').is_in(excluded)) if excluded else changed
+    kept = kept.sort('key')
+    rows = [(_decode_key(k), t) for k, t in zip(kept.get_column('key').to_list(), kept.get_column('display').to_list())]
+    return rows, counts
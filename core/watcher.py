@@ -1,23 +1,85 @@
 import os
 import time
+import heapq
 import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import config.settings as settings
 import logging
 from datetime import datetime
+from core.event_pipeline import EventPipeline
+from utils.stability import stability_tracker
+
+# 即時比較表的輸出在多個工作執行緒間序列化，避免不同檔案的表格交錯
+_display_lock = threading.Lock()
+
+# 同一資料夾至少有這麼多個檔案同時到期時，改用一次 os.scandir 取得 stat
+_SCANDIR_MIN_FILES = 4
+
+def _batch_stat(paths, check_lock):
+    """
+    一次取得多個檔案的 (mtime, size) 與是否有 ~$ 暫存鎖檔。
+    同一資料夾有多個到期檔案時以一次 os.scandir 取得（網路磁碟上只需一次往返），其餘逐一 os.stat。
+    返回 { path: ((mtime, size) 或 None, 是否有鎖檔) }
+    """
+    by_dir = {}
+    for p in paths:
+        by_dir.setdefault(os.path.dirname(p), []).append(p)
+    result = {}
+    for d, group in by_dir.items():
+        if len(group) >= _SCANDIR_MIN_FILES:
+            try:
+                entries = {}
+                with os.scandir(d or '.') as it:
+                    for de in it:
+                        entries[de.name] = de
+                for p in group:
+                    name = os.path.basename(p)
+                    de = entries.get(name)
+                    try:
+                        st = de.stat() if de is not None else None
+                    except OSError:
+                        st = None
+                    result[p] = ((st.st_mtime, st.st_size) if st else None,
+                                 check_lock and ("~$" + name) in entries)
+                continue
+            except OSError:
+                pass
+        for p in group:
+            try:
+                st = os.stat(p)
+                sig = (st.st_mtime, st.st_size)
+            except OSError:
+                sig = None
+            locked = False
+            if check_lock:
+                try:
+                    locked = os.path.exists(os.path.join(d, "~$" + os.path.basename(p)))
+                except Exception:
+                    locked = False
+            result[p] = (sig, locked)
+    return result
 
 class ActivePollingHandler:
     """
     主動輪詢處理器，採用新的智慧輪詢邏輯 + 穩定窗口/冷靜期
+    所有檔案的穩定檢查由單一排程執行緒（最小堆積，依到期時間排序）驅動，每個 tick 批次 stat；
+    達到穩定窗口後的比較交給事件管線的工作執行緒，不阻塞其他檔案的檢查。
     """
-    def __init__(self):
+    def __init__(self, dispatch=None):
+        # { file_path: {"interval":float, "event_number":int, "gen":int, "busy":bool} }
         self.polling_tasks = {}
         self.lock = threading.Lock()
         self.stop_event = threading.Event()
-        # 狀態表（每檔案）
-        # { file_path: {"last_mtime":float, "last_size":int, "stable":int, "cooldown_until":float} }
+        # 狀態表（每檔案）；mtime/size 的穩定判斷由 stability_tracker 負責（與複製前預檢共用）
+        # { file_path: {"cooldown_until":float, "has_shown_initial_compare":bool} }
         self.state = {}
+        # dispatch(key, fn, *args)：比較在哪裡執行（預設為事件管線）
+        self._dispatch = dispatch
+        self._cond = threading.Condition(self.lock)
+        self._heap = []   # (到期時間, 序號, file_path, gen)
+        self._seq = 0
+        self._thread = None
 
     def start_polling(self, file_path, event_number):
         """
@@ -39,108 +101,138 @@ class ActivePollingHandler:
         polling_type = "密集" if file_size_mb < settings.POLLING_SIZE_THRESHOLD_MB else "稀疏"
         
         print(f"[輪詢] 檔案: {os.path.basename(file_path)}（{polling_type}輪詢，每 {interval}s 檢查一次；首次檢查 {interval}s 後）")
-        # 初始化 last_mtime/size 與狀態
-        try:
-            last_mtime = os.path.getmtime(file_path)
-        except Exception:
-            last_mtime = 0
+        # 目前的 mtime/size 作為穩定窗口的第一次觀察
         try:
-            last_size = os.path.getsize(file_path)
-        except Exception:
-            last_size = -1
+            st = os.stat(file_path)
+            stability_tracker.observe(file_path, (st.st_mtime, st.st_size))
+        except OSError:
+            pass
         with self.lock:
-            self.state[file_path] = {"last_mtime": last_mtime, "last_size": last_size, "stable": 0, "cooldown_until": 0.0}
-        self._start_adaptive_polling(file_path, event_number, interval, last_mtime)
+            self.state[file_path] = {"cooldown_until": 0.0}
+            task = self.polling_tasks.get(file_path)
+            gen = task['gen'] + 1 if task else 1  # 舊的排程與進行中的比較結果作廢
+            self.polling_tasks[file_path] = {"interval": interval, "event_number": event_number, "gen": gen, "busy": False}
+            self._schedule_locked(file_path)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='polling-scheduler', daemon=True)
+                self._thread.start()
 
-    def _start_adaptive_polling(self, file_path, event_number, interval, last_mtime):
-        """
-        開始自適應輪詢
-        """
-        # 停止中不再排程
-        if self.stop_event.is_set() or getattr(settings, 'force_stop', False):
+    def _schedule_locked(self, file_path):
+        """在 interval 秒後再次檢查（呼叫者須持有 self.lock）"""
+        task = self.polling_tasks.get(file_path)
+        if task is None or self.stop_event.is_set():
             return
-        with self.lock:
-            if file_path in self.polling_tasks:
-                self.polling_tasks[file_path]['timer'].cancel()
+        self._seq += 1
+        heapq.heappush(self._heap, (time.time() + task['interval'], self._seq, file_path, task['gen']))
+        self._cond.notify()
 
-            def task_wrapper():
-                if self.stop_event.is_set() or getattr(settings, 'force_stop', False):
+    def _run(self):
+        """排程執行緒：等到最早的到期時間，取出所有到期的檔案一起檢查"""
+        while not self.stop_event.is_set():
+            with self._cond:
+                while not self.stop_event.is_set():
+                    now = time.time()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                if self.stop_event.is_set():
                     return
-                self._poll_for_stability(file_path, event_number, interval, last_mtime)
-
-            timer = threading.Timer(interval, task_wrapper)
-            self.polling_tasks[file_path] = {'timer': timer}
-            timer.start()
+                due = []
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now:
+                    _, _, file_path, gen = heapq.heappop(self._heap)
+                    task = self.polling_tasks.get(file_path)
+                    if task is not None and task['gen'] == gen and not task['busy']:
+                        due.append((file_path, gen))
+            if not due or getattr(settings, 'force_stop', False):
+                continue
+            check_lock = getattr(settings, 'SKIP_WHEN_TEMP_LOCK_PRESENT', True)
+            stats = _batch_stat([p for p, _ in due], check_lock)
+            for file_path, gen in due:
+                try:
+                    self._poll_for_stability(file_path, gen, *stats[file_path])
+                except Exception as e:
+                    logging.error(f"輪詢檢查失敗: {file_path}: {e}")
 
-    def _poll_for_stability(self, file_path, event_number, interval, last_mtime):
+    def _poll_for_stability(self, file_path, gen, sig, locked):
         """
         執行輪詢檢查：使用 mtime/size 的穩定窗口策略，並包含冷靜期與暫存鎖檔判斷
         """
         if self.stop_event.is_set():
             return
 
-        # 冷靜期判斷
-        st = self.state.get(file_path, {})
-        now = time.time()
-        if st and now < st.get("cooldown_until", 0):
-            print(f"    [cooldown] {os.path.basename(file_path)} 尚在冷靜期，略過本次。")
-            # 重新排程
-            with self.lock:
-                if file_path in self.polling_tasks:
-                    new_timer = threading.Timer(interval, lambda: self._poll_for_stability(file_path, event_number, interval, last_mtime))
-                    self.polling_tasks[file_path]['timer'] = new_timer
-                    new_timer.start()
-            return
+        with self.lock:
+            task = self.polling_tasks.get(file_path)
+            st = self.state.get(file_path, {})
+            if task is None or task['gen'] != gen:
+                return
 
-        # 檢測暫存鎖檔 (~$)
-        if getattr(settings, 'SKIP_WHEN_TEMP_LOCK_PRESENT', True):
-            tmp_lock = os.path.join(os.path.dirname(file_path), "~$" + os.path.basename(file_path))
-            try:
-                if os.path.exists(tmp_lock):
-                    print(f"    [鎖檔] 偵測到 {os.path.basename(tmp_lock)}，延後檢查。")
-                    with self.lock:
-                        if file_path in self.polling_tasks:
-                            new_timer = threading.Timer(interval, lambda: self._poll_for_stability(file_path, event_number, interval, last_mtime))
-                            self.polling_tasks[file_path]['timer'] = new_timer
-                            new_timer.start()
-                    return
-            except Exception:
-                pass
+            # 冷靜期判斷
+            if st and time.time() < st.get("cooldown_until", 0):
+                print(f"    [cooldown] {os.path.basename(file_path)} 尚在冷靜期，略過本次。")
+                self._schedule_locked(file_path)
+                return
 
-        print(f"    [輪詢檢查] 正在檢查 {os.path.basename(file_path)} 的變更...")
+            # 檢測暫存鎖檔 (~$)
+            if locked:
+                print(f"    [鎖檔] 偵測到 ~${os.path.basename(file_path)}，延後檢查。")
+                self._schedule_locked(file_path)
+                return
 
-        # 以 mtime/size 穩定判斷
-        try:
-            cur_mtime = os.path.getmtime(file_path)
-        except Exception:
-            cur_mtime = last_mtime
-        try:
-            cur_size = os.path.getsize(file_path)
-        except Exception:
-            cur_size = self.state.get(file_path, {}).get('last_size', -1)
-
-        changed = False
-        st = self.state.get(file_path, {})
-        if st:
-            if cur_mtime != st.get('last_mtime') or cur_size != st.get('last_size'):
-                changed = True
-                st['last_mtime'] = cur_mtime
-                st['last_size'] = cur_size
-                st['stable'] = 0
-                print(f"    [輪詢] 檢測到變動，等待穩定窗口（{getattr(settings,'POLLING_STABLE_CHECKS',3)} 次）…")
+            print(f"    [輪詢檢查] 正在檢查 {os.path.basename(file_path)} 的變更...")
+
+            # 以 mtime/size 穩定判斷：連續 POLLING_STABLE_CHECKS 次檢查未變動（stat 失敗時本次不計）
+            stable = False
+            if sig is not None:
+                if stability_tracker.observe(file_path, sig) == 1:
+                    print(f"    [輪詢] 檢測到變動，等待穩定窗口（{getattr(settings,'POLLING_STABLE_CHECKS',3)} 次）…")
+                checks = int(getattr(settings, 'POLLING_STABLE_CHECKS', 3)) + 1
+                stable = stability_tracker.is_stable(file_path, sig, checks, task['interval'])
+
+            if stable:
+                # 已穩定：之後比較時的複製不必再等一次預檢窗口
+                stability_tracker.mark_stable(file_path, sig)
+                # 比較交給工作執行緒，完成後由 _after_compare 決定冷靜期或結束
+                task['busy'] = True
+                event_number = task['event_number']
             else:
-                st['stable'] = st.get('stable', 0) + 1
-        
+                # 尚未達穩定次數，或剛檢測到變動，繼續等待
+                self._schedule_locked(file_path)
+                return
+
+        # 與修改事件使用同一個 key：同一檔案的比較、保存基準線都在同一條序列上執行
+        dispatch = self._dispatch or event_pipeline.submit
+        if not dispatch(file_path, self._compare_and_continue, file_path, gen, event_number):
+            with self.lock:
+                task = self.polling_tasks.get(file_path)
+                if task is not None and task['gen'] == gen:
+                    task['busy'] = False
+                    self._schedule_locked(file_path)
+
+    def _compare(self, file_path, event_number):
+        from core.comparison import compute_excel_changes, render_comparison, set_current_event_number
+        set_current_event_number(event_number)
+        print(f"    [輪詢] 已穩定，開始比較…")
+        result = compute_excel_changes(file_path, event_number=event_number)
+        # 只有輸出階段需要序列化，解析與比對可與其他檔案並行
+        with _display_lock:
+            return render_comparison(result, silent=False, is_polling=True)
+
+    def _compare_and_continue(self, file_path, gen, event_number):
         has_changes = False
-        if st and st.get('stable', 0) >= getattr(settings, 'POLLING_STABLE_CHECKS', 3):
-            from core.comparison import compare_excel_changes, set_current_event_number
-            set_current_event_number(event_number)
-            print(f"    [輪詢] 已穩定，開始比較…")
-            has_changes = compare_excel_changes(file_path, silent=False, event_number=event_number, is_polling=True)
+        try:
+            if not self.stop_event.is_set():
+                has_changes = self._compare(file_path, event_number)
+        finally:
+            self._after_compare(file_path, gen, event_number, has_changes)
 
+    def _after_compare(self, file_path, gen, event_number, has_changes):
         with self.lock:
-            if file_path not in self.polling_tasks:
+            task = self.polling_tasks.get(file_path)
+            if task is None or task['gen'] != gen:
                 return
+            task['busy'] = False
+            st = self.state.get(file_path, {})
 
             if has_changes:
                 try:
@@ -150,24 +242,14 @@ class ActivePollingHandler:
                     _sz_str = "N/A"
                 print(f"    [輪詢] 變更仍持續（事件 #{event_number}，大小 {_sz_str}），啟動冷靜期，{getattr(settings,'POLLING_COOLDOWN_SEC',20)} 秒後再次檢查。")
                 st['cooldown_until'] = time.time() + float(getattr(settings, 'POLLING_COOLDOWN_SEC', 20))
-                st['stable'] = 0
-                new_timer = threading.Timer(interval, lambda: self._poll_for_stability(file_path, event_number, interval, last_mtime))
-                self.polling_tasks[file_path]['timer'] = new_timer
-                new_timer.start()
+                # 仍有變更：穩定窗口重新起算
+                stability_tracker.note_event(file_path)
+                self._schedule_locked(file_path)
             else:
-                # 若尚未達穩定次數，或剛檢測到變動，繼續等待；若已穩定且無變更，結束輪詢
-                if st and st.get('stable', 0) < getattr(settings, 'POLLING_STABLE_CHECKS', 3):
-                    new_timer = threading.Timer(interval, lambda: self._poll_for_stability(file_path, event_number, interval, last_mtime))
-                    self.polling_tasks[file_path]['timer'] = new_timer
-                    new_timer.start()
-                elif changed:
-                    new_timer = threading.Timer(interval, lambda: self._poll_for_stability(file_path, event_number, interval, last_mtime))
-                    self.polling_tasks[file_path]['timer'] = new_timer
-                    new_timer.start()
-                else:
-                    print(f"    [輪詢結束] {os.path.basename(file_path)} 檔案已穩定。")
-                    self.polling_tasks.pop(file_path, None)
-                    self.state.pop(file_path, None)
+                # 已穩定且無變更，結束輪詢
+                print(f"    [輪詢結束] {os.path.basename(file_path)} 檔案已穩定。")
+                self.polling_tasks.pop(file_path, None)
+                self.state.pop(file_path, None)
 
     def stop(self):
         """
@@ -175,16 +257,17 @@ class ActivePollingHandler:
         """
         self.stop_event.set()
         with self.lock:
-            for task in self.polling_tasks.values():
-                task['timer'].cancel()
             self.polling_tasks.clear()
+            self._heap.clear()
+            self._cond.notify_all()
 
 class ExcelFileEventHandler(FileSystemEventHandler):
     """
     Excel 檔案事件處理器
     """
-    def __init__(self, polling_handler):
+    def __init__(self, polling_handler, pipeline=None):
         self.polling_handler = polling_handler
+        self.pipeline = pipeline or event_pipeline
         self.last_event_times = {}
         self.event_counter = 0
         
@@ -239,11 +322,17 @@ class ExcelFileEventHandler(FileSystemEventHandler):
         if os.path.basename(file_path).startswith('~$'):
             return
 
+        stability_tracker.note_event(file_path)
+        # 建立基準線交給工作執行緒，不佔用 observer 執行緒
+        self.pipeline.submit(file_path, self._process_created, file_path)
+
+    def _process_created(self, file_path):
         print(f"\n✨ 發現新檔案: {os.path.basename(file_path)}")
         print(f"📊 正在建立基準線...")
 
         from core.baseline import create_baseline_for_files_robust
-        create_baseline_for_files_robust([file_path])
+        with self.pipeline.timed('baseline'):
+            create_baseline_for_files_robust([file_path])
 
         print(f"✅ 基準線建立完成，已納入監控: {os.path.basename(file_path)}")
 
@@ -309,8 +398,11 @@ class ExcelFileEventHandler(FileSystemEventHandler):
         if os.path.basename(file_path).startswith('~$'):
             return
             
-        # 防抖動處理
+        # 每個事件都讓穩定窗口重新起算（包含被防抖動略過的事件）
         current_time = time.time()
+        stability_tracker.note_event(file_path, current_time)
+
+        # 防抖動處理
         if file_path in self.last_event_times:
             if current_time - self.last_event_times[file_path] < settings.DEBOUNCE_INTERVAL_SEC:
                 return
@@ -318,63 +410,95 @@ class ExcelFileEventHandler(FileSystemEventHandler):
         self.last_event_times[file_path] = current_time
         self.event_counter += 1
         
-        # 獲取檔案最後作者
+        # observer 執行緒只負責排入；複製/解析/比對由工作執行緒處理（同一檔案依序處理）
+        self.pipeline.submit(file_path, self._process_modified, file_path, self.event_counter, current_time)
+
+    def _process_modified(self, file_path, event_number, event_time):
+        """
+        處理一筆修改事件（在事件管線的工作執行緒中執行）
+        """
+        if getattr(settings, 'force_stop', False):
+            return
+        try:
+            self._handle_modified(file_path, event_number)
+        finally:
+            self.pipeline.record('total', time.time() - event_time)
+
+    def _last_author(self, file_path, lease=None):
         try:
             from core.excel_parser import get_excel_last_author
-            last_author = get_excel_last_author(file_path)
-            author_info = f" (最後儲存者: {last_author})" if last_author != 'Unknown' else ""
-        except Exception as e:
-            author_info = ""
-        
-        # 先做一次靜默比對，若無變更則不噪音輸出（仍可後續輪詢）
-        from core.comparison import compare_excel_changes, set_current_event_number
-        set_current_event_number(self.event_counter)
-        has_changes_preview = compare_excel_changes(file_path, silent=True, event_number=self.event_counter, is_polling=False)
+            with self.pipeline.timed('author'):
+                return get_excel_last_author(file_path, lease=lease)
+        except Exception:
+            return 'Unknown'
+
+    def _handle_modified(self, file_path, event_number):
+        # 每個事件只複製一次：比較、作者查詢與 monitor-only 的首次基準線共用同一個快取租約
+        from utils.cache import CacheLease
+        with CacheLease(file_path) as lease:
+            self._handle_modified_with_lease(file_path, event_number, lease)
+
+    def _handle_modified_with_lease(self, file_path, event_number, lease):
+        # 只比較一次（解析一次）：先以結果判斷是否有變更，之後顯示/保存沿用同一個結果
+        from core.comparison import compute_excel_changes, render_comparison, set_current_event_number
+        set_current_event_number(event_number)
+        with self.pipeline.timed('compute'):
+            result = compute_excel_changes(file_path, event_number=event_number, lease=lease)
         
-        if has_changes_preview:
-            print(f"\n🔔 檔案變更偵測: {os.path.basename(file_path)} (事件 #{self.event_counter}){author_info}")
+        if result.has_changes:
+            # 比較時已取得最後作者
+            last_author = result.new_author or 'Unknown'
+            author_info = f" (最後儲存者: {last_author})" if last_author != 'Unknown' else ""
+            print(f"\n🔔 檔案變更偵測: {os.path.basename(file_path)} (事件 #{event_number}){author_info}")
         
         # 監控但不預先 baseline 的區域：首次變更只紀錄資訊並建立 baseline，之後才比較
         if self._is_monitor_only(file_path):
+            last_author = result.new_author or self._last_author(file_path, lease)
             try:
                 from utils.helpers import get_file_mtime
                 mtime = get_file_mtime(file_path)
                 print(f"    [MONITOR-ONLY] {file_path}\n       - 最後修改時間: {mtime}\n       - 最後儲存者: {last_author}")
                 # 若尚未有 baseline，先建立一份；已存在則繼續走下面的比較流程
                 from core.baseline import get_baseline_file_with_extension, save_baseline
-                from core.excel_parser import dump_excel_cells_with_timeout, hash_excel_content
+                from core.excel_parser import build_excel_content_tree, get_workbook_fingerprints
+                from core.parse_worker import dump_excel_cells_isolated
                 from utils.helpers import _baseline_key_for_path
                 base_key = _baseline_key_for_path(file_path)
                 baseline_exists = bool(get_baseline_file_with_extension(base_key))
                 if not baseline_exists:
-                    cur = dump_excel_cells_with_timeout(file_path)
+                    with self.pipeline.timed('monitor_only'):
+                        # 沒有基準線時比較階段已完整解析過，直接沿用
+                        cur = result.current_data or dump_excel_cells_isolated(file_path, local_path=lease.local_path)
+                        if cur:
+                            tree = result.new_tree if result.current_data else build_excel_content_tree(cur)
+                            bdata = {"last_author": last_author, "content_hash": tree['hash'] if tree else None, "content_tree": tree,
+                                     "cells": cur, "timestamp": datetime.now().isoformat(),
+                                     "zip_fingerprints": result.new_fingerprints or get_workbook_fingerprints(file_path, lease=lease)}
+                            save_baseline(base_key, bdata)
                     if cur:
-                        bdata = {"last_author": last_author, "content_hash": hash_excel_content(cur), "cells": cur, "timestamp": datetime.now().isoformat()}
-                        save_baseline(base_key, bdata)
                         print("    [MONITOR-ONLY] 已建立首次基準線（本次不比較）。")
                         return
             except Exception as e:
                 logging.warning(f"monitor-only 初始化失敗: {e}")
                 return
         
-        # 🔥 設定事件編號並立即執行一次比較
-        from core.comparison import compare_excel_changes, set_current_event_number
-        set_current_event_number(self.event_counter)
-        
+        # 🔥 立即顯示比較結果（沿用上面的比較，不重新解析）
         # 允許在輪詢中也顯示一次即時比較表（本輪只顯示一次），滿足「detect 即顯示」
         if file_path in self.polling_handler.polling_tasks:
             st = self.polling_handler.state.get(file_path, {})
             if not st.get('has_shown_initial_compare', False):
-                print(f"📊 立即檢查變更（輪詢中首次）...")
-                has_changes = compare_excel_changes(file_path, silent=False, event_number=self.event_counter, is_polling=False)
+                with _display_lock, self.pipeline.timed('render'):
+                    print(f"📊 立即檢查變更（輪詢中首次）...")
+                    has_changes = render_comparison(result, silent=False, is_polling=False)
                 st['has_shown_initial_compare'] = True
                 self.polling_handler.state[file_path] = st
             else:
                 print(f"    [偵測] {os.path.basename(file_path)} 正在輪詢中，已顯示過即時比較，忽略本次。")
                 return
         else:
-            print(f"📊 立即檢查變更...")
-            has_changes = compare_excel_changes(file_path, silent=False, event_number=self.event_counter, is_polling=False)
+            with _display_lock, self.pipeline.timed('render'):
+                print(f"📊 立即檢查變更...")
+                has_changes = render_comparison(result, silent=False, is_polling=False)
         
         if has_changes:
             print(f"✅ 偵測到變更，啟動輪詢以監控後續活動...")
@@ -382,8 +506,10 @@ class ExcelFileEventHandler(FileSystemEventHandler):
             print(f"ℹ️  未發現即時變更，啟動輪詢以監控後續活動...")
         
         # 開始輪詢
-        self.polling_handler.start_polling(file_path, self.event_counter)
+        self.polling_handler.start_polling(file_path, event_number)
 
 # 創建全局輪詢處理器實例
 active_polling_handler = ActivePollingHandler()
+# 全局事件管線（observer 執行緒只排入事件）
+event_pipeline = EventPipeline()
 
@@ -6,6 +6,7 @@ import os
 import sys
 import signal
 import threading
+import itertools
 import time
 from datetime import datetime
 import logging
@@ -18,12 +19,14 @@ sys.path.insert(0, current_dir)
 import config.settings as settings
 from utils.logging import init_logging
 from utils.memory import check_memory_limit
-from utils.helpers import get_all_excel_files, timeout_handler
+from utils.discovery import iter_excel_files
+from utils.cache import get_copy_scheduler
 from utils.compression import CompressionFormat, test_compression_support  # 新增
 from ui.console import init_console
 from core.baseline import create_baseline_for_files_robust
-from core.watcher import active_polling_handler, ExcelFileEventHandler
+from core.watcher import active_polling_handler, event_pipeline, ExcelFileEventHandler
 from core.comparison import set_current_event_number
+from core.parse_worker import current_parses, shutdown_workers
 from watchdog.observers import Observer
 
 def signal_handler(signum, frame):
@@ -35,6 +38,8 @@ def signal_handler(signum, frame):
         print("\n🛑 收到中斷信號，正在安全停止...")
         if settings.current_processing_file: 
             print(f"   目前處理檔案: {settings.current_processing_file}")
+        for path in current_parses():
+            print(f"   目前處理檔案: {path}")
         active_polling_handler.stop()
         print("   (再按一次 Ctrl+C 強制退出)")
     else:
@@ -106,11 +111,6 @@ def main():
     # 設定信號處理器
     signal.signal(signal.SIGINT, signal_handler)
     
-    # 啟動超時監控
-    if settings.ENABLE_TIMEOUT:
-        timeout_thread = threading.Thread(target=timeout_handler, daemon=True)
-        timeout_thread.start()
-    
     # 檢查壓縮格式支援
     available_formats = CompressionFormat.get_available_formats()
     print(f"🗜️  支援壓縮格式: {', '.join(available_formats)}")
@@ -136,24 +136,26 @@ def main():
             else:
                 print(f"   ❌ 檔案不存在: {target}")
     
-    # 獲取所有 Excel 檔案
-    all_files = []
+    # 獲取所有 Excel 檔案（並行掃描，邊找邊交給基準線流程）
+    scan_roots = []
     if settings.SCAN_ALL_MODE:
         print("\n🔍 掃描所有 Excel 檔案...")
         scan_roots = list(settings.WATCH_FOLDERS or [])
         # 若使用者指定 SCAN_TARGET_FOLDERS，僅針對該子集掃描
         if getattr(settings, 'SCAN_TARGET_FOLDERS', None):
             scan_roots = list(dict.fromkeys([r for r in settings.SCAN_TARGET_FOLDERS if r]))
-        all_files = get_all_excel_files(scan_roots)
-        print(f"找到 {len(all_files)} 個 Excel 檔案")
     
-    # 🔥 合併手動目標和掃描結果
-    total_files = list(set(all_files + manual_files))
+    # 🔥 合併手動目標和掃描結果（去除重複）
+    def _startup_files():
+        seen = set()
+        for path in itertools.chain(manual_files, iter_excel_files(scan_roots) if scan_roots else ()):
+            if path not in seen:
+                seen.add(path)
+                yield path
     
     # 建立基準線
-    if total_files:
-        print(f"\n📊 總共需要處理 {len(total_files)} 個檔案")
-        create_baseline_for_files_robust(total_files)
+    if manual_files or scan_roots:
+        create_baseline_for_files_robust(_startup_files())
     
     # 啟動檔案監控
     print("\n👀 啟動檔案監控...")
@@ -184,16 +186,29 @@ def main():
     print(f"   - 歸檔模式: {'開啟' if settings.ENABLE_ARCHIVE_MODE else '關閉'}")
     print("\n按 Ctrl+C 停止監控...")
     
+    # 定期輸出事件管線統計（期間沒有新事件時不重複輸出）
+    stats_interval = float(getattr(settings, 'PIPELINE_STATS_INTERVAL_SEC', 300) or 0)
+    last_stats_at, last_submitted = time.time(), 0
     try:
         while not settings.force_stop:
             time.sleep(1)
+            if stats_interval > 0 and time.time() - last_stats_at >= stats_interval:
+                last_stats_at = time.time()
+                if event_pipeline.submitted != last_submitted:
+                    last_submitted = event_pipeline.submitted
+                    print(f"📈 事件管線統計: {event_pipeline.format_stats()}")
     except KeyboardInterrupt:
         pass
     finally:
         print("\n🔄 正在停止監控...")
         observer.stop()
         observer.join()
+        event_pipeline.stop()
         active_polling_handler.stop()
+        get_copy_scheduler().stop()
+        shutdown_workers()
+        print(f"📈 事件管線統計: {event_pipeline.format_stats()}")
+        print(f"📦 複製排程統計: {get_copy_scheduler().format_stats()}")
         print("✅ 監控已停止")
 
 if __name__ == "__main__":
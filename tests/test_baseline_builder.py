@@ -0,0 +1,89 @@
+import pytest
+import os
+import sys
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+pytest.importorskip('psutil')
+
+import config.settings as settings
+import core.baseline_builder as builder
+from core.baseline_builder import MemoryBudget, build_baselines_parallel
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'USE_LOCAL_CACHE', False, raising=False)
+    monkeypatch.setattr(settings, 'ENABLE_MEMORY_MONITOR', False, raising=False)
+    monkeypatch.setattr(settings, 'BASELINE_MEMORY_BUDGET_MB', 0, raising=False)
+    monkeypatch.setattr(settings, 'BASELINE_COPY_WORKERS', 1, raising=False)
+    monkeypatch.setattr(settings, 'force_stop', False, raising=False)
+    monkeypatch.setattr(builder, 'load_completed_files', lambda: set())
+    monkeypatch.setattr(builder, 'mark_file_completed', lambda p: None)
+    monkeypatch.setattr(builder, 'clear_completed_files', lambda: None)
+    paths = []
+    for name, size in (('small.xlsx', 10), ('big.xlsx', 3000), ('mid.xlsx', 500)):
+        p = tmp_path / name
+        p.write_bytes(b'x' * size)
+        paths.append(str(p))
+    return paths
+
+
+def test_parallel_build_largest_first_and_resume(files, monkeypatch):
+    """
+    測試並行建立：依檔案大小由大到小處理；上次已完成的檔案不重建，但仍回報給 on_result 計入統計
+    """
+    built, results = [], []
+    ok = build_baselines_parallel(files, lambda p, silent: built.append(os.path.basename(p)) or {'status': 'OK', 'stats': None},
+                                  1, lambda p, outcome, n, sec: results.append((os.path.basename(p), outcome)))
+    assert ok
+    assert built == ['big.xlsx', 'mid.xlsx', 'small.xlsx']
+
+    monkeypatch.setattr(builder, 'load_completed_files', lambda: {files[1]})
+    built.clear()
+    results.clear()
+    build_baselines_parallel(files, lambda p, silent: built.append(os.path.basename(p)) or {'status': 'OK', 'stats': None},
+                             1, lambda p, outcome, n, sec: results.append((os.path.basename(p), outcome)))
+    assert built == ['mid.xlsx', 'small.xlsx']
+    assert len(results) == 3
+    assert results[0][0] == 'big.xlsx' and results[0][1]['status'] == 'SKIP' and results[0][1]['resumed']
+
+
+def test_parallel_build_stops_on_force_stop(files):
+    """
+    測試停止信號：進行中的檔案完成後不再開始新的檔案，並返回未完成
+    """
+    built = []
+
+    def build_one(path, silent):
+        built.append(path)
+        settings.force_stop = True
+        return {'status': 'OK', 'stats': None}
+
+    assert not build_baselines_parallel(files, build_one, 1, lambda *a: None)
+    assert len(built) == 1
+
+
+def test_memory_budget_admission(monkeypatch):
+    """
+    測試記憶體預算：估計用量加總不超過預算；實際用量（含子程序）過高時不放行；沒有進行中的解析時一律放行
+    """
+    usage = {'mb': 0.0}
+    monkeypatch.setattr(builder, 'get_memory_usage', lambda include_children=False: usage['mb'] if include_children else 0.0)
+    budget = MemoryBudget(100, factor=1)
+    assert budget.try_acquire(60, running=0)
+    assert not budget.try_acquire(60, running=1)
+    assert budget.try_acquire(30, running=1)
+    budget.release(60)
+    usage['mb'] = 90  # 子程序佔用的記憶體也計入
+    assert not budget.try_acquire(20, running=1)
+    assert budget.over_budget() is False
+    usage['mb'] = 120
+    assert budget.over_budget()
+    assert budget.try_acquire(500, running=0)  # 沒有進行中的解析：大檔也放行
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,99 @@
+import pytest
+import os
+import sys
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+pytest.importorskip('psutil')
+pytest.importorskip('openpyxl')
+
+import config.settings as settings
+import core.baseline as baseline
+from core.baseline import load_baseline, create_baseline_for_files_robust
+from utils.compression import save_compressed_file
+
+
+def test_load_baseline_keeps_cells_that_cannot_be_compacted(tmp_path, monkeypatch):
+    """
+    測試基準線含非 A1 地址（例如名稱）時不拋出例外，改以原本的 dict 返回
+    """
+    monkeypatch.setattr(settings, 'COMPACT_CELL_STORAGE', True, raising=False)
+    base = str(tmp_path / 'odd.xlsx__1.baseline.json')
+    cells = {'Sheet1': {'A1': {'formula': None, 'value': 1, 'cached_value': 1}, 'Named': {'formula': '=A1', 'value': 1, 'cached_value': 1}}}
+    save_compressed_file(base, {'content_hash': 'h', 'cells': cells}, 'gzip')
+
+    data = load_baseline(base)
+    assert data is not None
+    assert data['content_hash'] == 'h'
+    assert dict(data['cells']['Sheet1']) == cells['Sheet1']
+
+
+def test_sequential_build_streams_discovered_files(tmp_path, monkeypatch):
+    """
+    測試逐一建立基準線直接消化掃描串流：第一個檔案找到即開始建立，不等掃描結束；上次已完成的檔案略過並計入統計
+    """
+    monkeypatch.setattr(settings, 'BASELINE_BUILD_WORKERS', 1, raising=False)
+    monkeypatch.setattr(settings, 'STARTUP_SKIP_BY_STAT', True, raising=False)
+    monkeypatch.setattr(settings, 'ENABLE_TIMEOUT', False, raising=False)
+    monkeypatch.setattr(settings, 'ENABLE_ARCHIVE_MODE', False, raising=False)
+    monkeypatch.setattr(settings, 'LOG_FOLDER', str(tmp_path / 'logs'), raising=False)
+    monkeypatch.setattr(settings, 'USE_LOCAL_CACHE', False, raising=False)
+    monkeypatch.setattr(settings, 'force_stop', False, raising=False)
+    monkeypatch.setattr(baseline, 'load_manifest', lambda: {})
+    monkeypatch.setattr(baseline, 'check_memory_limit', lambda: False)
+    marked = []
+    monkeypatch.setattr(baseline, 'load_completed_files', lambda: {'c.xlsx'})
+    monkeypatch.setattr(baseline, 'mark_file_completed', marked.append)
+    monkeypatch.setattr(baseline, 'clear_completed_files', lambda: marked.append('cleared'))
+    events = []
+    monkeypatch.setattr(baseline, '_build_one_baseline', lambda path: events.append('build ' + path) or {'status': 'OK', 'stats': None})
+
+    def discover():
+        for name in ('a.xlsx', 'b.xlsx', 'c.xlsx'):
+            events.append('found ' + name)
+            yield name
+
+    create_baseline_for_files_robust(discover())
+    assert events == ['found a.xlsx', 'build a.xlsx', 'found b.xlsx', 'build b.xlsx', 'found c.xlsx']
+    assert marked == ['a.xlsx', 'b.xlsx', 'cleared']
+
+
+def test_build_one_baseline_reports_timeout_from_parse_worker(tmp_path, monkeypatch):
+    """
+    測試 TIMEOUT 由解析子行程的逾時判定：逾時才回報 TIMEOUT，其餘解析失敗（即使耗時很長）回報 READ_ERROR
+    """
+    from core.parse_worker import ParseTimeout
+
+    class _Lease:
+        available = True
+        local_path = str(tmp_path / 'a.xlsx')
+
+        def __init__(self, path, silent=False):
+            pass
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(baseline, 'CacheLease', _Lease)
+    monkeypatch.setattr(baseline, 'get_entry', lambda key: None)
+    monkeypatch.setattr(baseline, 'load_baseline', lambda key: None)
+    monkeypatch.setattr(settings, 'FILE_TIMEOUT_SECONDS', 0, raising=False)
+    monkeypatch.setattr(settings, 'current_processing_file', None, raising=False)
+    calls = []
+
+    def timed_out(path, **kwargs):
+        calls.append(kwargs.get('raise_timeout'))
+        raise ParseTimeout('解析超過 1s')
+
+    monkeypatch.setattr(baseline, 'dump_excel_cells_isolated', timed_out)
+    assert baseline._build_one_baseline(str(tmp_path / 'a.xlsx'), silent=True)['status'] == 'TIMEOUT'
+    assert calls == [True]
+
+    monkeypatch.setattr(baseline, 'dump_excel_cells_isolated', lambda path, **kwargs: None)
+    assert baseline._build_one_baseline(str(tmp_path / 'a.xlsx'), silent=True)['status'] == 'READ_ERROR'
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,50 @@
+import pytest
+import os
+import sys
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.baseline_manifest import upsert_entry, load_manifest, get_entry, remove_entry, stat_matches
+
+
+def test_manifest_upsert_and_stat_match(tmp_path):
+    """
+    測試基準線清單的寫入/覆寫/刪除，以及 mtime/size 比對
+    """
+    db = str(tmp_path / 'manifest.sqlite')
+    upsert_entry('a_123', 1000.0, 42, 'h1', db_path=db)
+    upsert_entry('b_456', 2000.0, 7, None, db_path=db)
+    upsert_entry('a_123', 1500.0, 43, 'h2', db_path=db)
+
+    manifest = load_manifest(db_path=db)
+    assert set(manifest) == {'a_123', 'b_456'}
+    assert manifest['a_123']['content_hash'] == 'h2'
+
+    entry = get_entry('a_123', db_path=db)
+    assert stat_matches(entry, 1501.0, 43, tolerance=2.0)
+    assert not stat_matches(entry, 1500.0, 44, tolerance=2.0)
+    assert not stat_matches(entry, 1510.0, 43, tolerance=2.0)
+    assert not stat_matches(None, 1500.0, 43)
+
+    remove_entry('b_456', db_path=db)
+    assert get_entry('b_456', db_path=db) is None
+
+
+def test_manifest_fingerprints_follow_saved_baseline(tmp_path):
+    """
+    測試 zip fingerprint：新基準線沒有 fingerprint 時寫入 NULL（不沿用描述舊儲存格的值）；只更新 stat 時保留
+    """
+    db = str(tmp_path / 'manifest.sqlite')
+    fp = {'sheets': {'Sheet1': 123}}
+    upsert_entry('a_123', 1000.0, 42, 'h1', zip_fingerprints=fp, db_path=db)
+    upsert_entry('a_123', 1100.0, 42, 'h1', db_path=db)
+    assert get_entry('a_123', db_path=db)['zip_fingerprints'] == fp
+
+    upsert_entry('a_123', 1200.0, 50, 'h2', zip_fingerprints=None, db_path=db)
+    assert get_entry('a_123', db_path=db)['zip_fingerprints'] is None
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,104 @@
+import pytest
+import os
+import sys
+import time
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import config.settings as settings
+import utils.cache as cache
+from utils import cache_index
+
+
+def test_cache_dedup_freshness_and_eviction(tmp_path, monkeypatch):
+    """
+    測試快取索引：相同內容的副本以硬連結共用並只計一次、以索引判斷副本是否過期、超過容量時淘汰久未使用的副本
+    """
+    share = tmp_path / 'share'
+    share.mkdir()
+    a, b, c = share / 'a.xlsx', share / 'b.xlsx', share / 'c.xlsx'
+    a.write_bytes(b'A' * 4000)
+    b.write_bytes(b'A' * 4000)  # 與 a 內容相同
+    c.write_bytes(b'C' * 4000)
+    os.utime(b, (1_000_000_000, 1_000_000_000))
+
+    monkeypatch.setattr(settings, 'USE_LOCAL_CACHE', True, raising=False)
+    monkeypatch.setattr(settings, 'CACHE_FOLDER', str(tmp_path / 'cache'), raising=False)
+    monkeypatch.setattr(settings, 'LOG_FOLDER', str(tmp_path / 'logs'), raising=False)
+    monkeypatch.setattr(settings, 'COPY_STABILITY_CHECKS', 1, raising=False)
+    monkeypatch.setattr(settings, 'COPY_POST_SLEEP_SEC', 0, raising=False)
+    monkeypatch.setattr(settings, 'COPY_CHUNK_SIZE_MB', 0, raising=False)
+    monkeypatch.setattr(settings, 'COPY_ENGINE', 'python', raising=False)
+    monkeypatch.setattr(settings, 'CACHE_DEDUP', True, raising=False)
+    monkeypatch.setattr(settings, 'CACHE_MAX_SIZE_MB', 0, raising=False)
+
+    ca = cache.copy_to_cache(str(a), silent=True)
+    cb = cache.copy_to_cache(str(b), silent=True)
+    assert os.path.samefile(ca, cb)
+    assert cache_index.total_size() == 4000
+
+    # 硬連結共用 a 的 mtime，但索引記錄 b 的來源 stat：仍視為有效，不重新複製
+    before = os.path.getmtime(cb)
+    assert cache.copy_to_cache(str(b), silent=True) == cb
+    assert os.path.getmtime(cb) == before
+
+    # 修改 b：刪除舊連結後重新複製，不會改到 a 的副本
+    b.write_bytes(b'B' * 4000)
+    cb = cache.copy_to_cache(str(b), silent=True)
+    assert open(ca, 'rb').read() == b'A' * 4000
+    assert open(cb, 'rb').read() == b'B' * 4000
+
+    # 容量上限 8000 bytes：複製 c 後淘汰最久未使用的 a
+    cache_index.touch(cb)
+    conn = cache_index._connect(cache_index.get_index_path())
+    conn.execute("UPDATE cache_entries SET last_access=? WHERE cache_file=?", (time.time() - 3600, os.path.basename(ca)))
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(settings, 'CACHE_MAX_SIZE_MB', 8000 / (1024 * 1024), raising=False)
+    cc = cache.copy_to_cache(str(c), silent=True)
+    assert os.path.exists(cc) and os.path.exists(cb)
+    assert not os.path.exists(ca)
+    assert cache_index.total_size() == 8000
+
+
+def test_cache_dedup_hashes_only_same_size_copies(tmp_path, monkeypatch):
+    """
+    測試快取去重只在索引已有同大小副本時才計算雜湊；既有副本沒有雜湊時補算並寫回，相同內容仍以硬連結共用
+    """
+    share = tmp_path / 'share'
+    share.mkdir()
+    a, b, c = share / 'a.xlsx', share / 'b.xlsx', share / 'c.xlsx'
+    a.write_bytes(b'A' * 4000)
+    b.write_bytes(b'A' * 4000)  # 與 a 內容相同
+    c.write_bytes(b'C' * 5000)
+
+    monkeypatch.setattr(settings, 'USE_LOCAL_CACHE', True, raising=False)
+    monkeypatch.setattr(settings, 'CACHE_FOLDER', str(tmp_path / 'cache'), raising=False)
+    monkeypatch.setattr(settings, 'LOG_FOLDER', str(tmp_path / 'logs'), raising=False)
+    monkeypatch.setattr(settings, 'COPY_STABILITY_CHECKS', 1, raising=False)
+    monkeypatch.setattr(settings, 'COPY_POST_SLEEP_SEC', 0, raising=False)
+    monkeypatch.setattr(settings, 'COPY_CHUNK_SIZE_MB', 0, raising=False)
+    monkeypatch.setattr(settings, 'COPY_ENGINE', 'python', raising=False)
+    monkeypatch.setattr(settings, 'CACHE_DEDUP', True, raising=False)
+    monkeypatch.setattr(settings, 'CACHE_MAX_SIZE_MB', 0, raising=False)
+    hashed = []
+    real_hash = cache_index.file_content_hash
+    monkeypatch.setattr(cache_index, 'file_content_hash', lambda path: hashed.append(os.path.basename(path)) or real_hash(path))
+
+    ca = cache.copy_to_cache(str(a), silent=True)
+    cc = cache.copy_to_cache(str(c), silent=True)
+    assert hashed == []
+    assert cache_index.get_entry(ca)['content_hash'] is None
+
+    cb = cache.copy_to_cache(str(b), silent=True)
+    assert sorted(hashed) == sorted([os.path.basename(ca), os.path.basename(cb)])
+    assert os.path.samefile(ca, cb)
+    assert cache_index.get_entry(ca)['content_hash'] == cache_index.get_entry(cb)['content_hash'] is not None
+    assert cache_index.get_entry(cc)['content_hash'] is None
+    assert cache_index.total_size() == 9000
+
+
+if __name__ == "__main__":
+    pytest.main()
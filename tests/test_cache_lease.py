@@ -0,0 +1,49 @@
+import pytest
+import os
+import sys
+import zipfile
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import config.settings as settings
+import utils.cache as cache
+from utils.value_engines.stream_reader import read_zip_fingerprints
+
+
+def test_cache_lease_copies_once_and_shares_zip(tmp_path, monkeypatch):
+    """
+    測試快取租約：延遲到第一次使用才複製、之後沿用同一副本與 zip handle；結束時關閉 handle
+    """
+    src = tmp_path / 'share' / 'book.xlsx'
+    src.parent.mkdir()
+    with zipfile.ZipFile(src, 'w') as z:
+        z.writestr('docProps/core.xml', '<x/>')
+        z.writestr('xl/worksheets/sheet1.xml', '<worksheet/>')
+
+    monkeypatch.setattr(settings, 'USE_LOCAL_CACHE', True, raising=False)
+    monkeypatch.setattr(settings, 'CACHE_FOLDER', str(tmp_path / 'cache'), raising=False)
+    monkeypatch.setattr(settings, 'COPY_STABILITY_CHECKS', 1, raising=False)
+    monkeypatch.setattr(settings, 'COPY_POST_SLEEP_SEC', 0, raising=False)
+    monkeypatch.setattr(settings, 'LOG_FOLDER', str(tmp_path / 'logs'), raising=False)
+    calls = []
+    real_copy = cache.copy_to_cache
+    monkeypatch.setattr(cache, 'copy_to_cache', lambda p, silent=False: calls.append(p) or real_copy(p, silent=silent))
+
+    with cache.CacheLease(str(src)) as lease:
+        assert calls == []  # 尚未使用，不複製
+        local = lease.local_path
+        assert local and local != str(src) and os.path.exists(local)
+        assert lease.source_stat == (os.path.getmtime(src), os.path.getsize(src))
+        z = lease.zip()
+        assert lease.zip() is z
+        fp = read_zip_fingerprints(z)
+        assert 'xl/worksheets/sheet1.xml' in fp['members']
+        assert lease.local_path == local
+    assert calls == [str(src)]
+    assert z.fp is None  # 離開 with 後已關閉
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,68 @@
+import pytest
+import os
+import sys
+import json
+import pickle
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.cell_store import SheetCells, CellPool, compact_workbook, to_plain_cells, cells_json_default
+
+
+def _plain():
+    return {
+        'Sheet1': {
+            'A1': {'formula': None, 'value': 'x', 'cached_value': 'x'},
+            'B1': {'formula': '=A1', 'value': '1', 'cached_value': '1'},
+            'AA10': {'formula': None, 'value': True, 'cached_value': None},
+        },
+        'Sheet2': {
+            'C3': {'formula': None, 'value': 1, 'cached_value': 1.0},
+        },
+    }
+
+
+def test_sheet_cells_behaves_like_dict():
+    """
+    測試 SheetCells 的查詢、走訪、相等比較與原本的 dict 結構一致。
+    """
+    plain = _plain()
+    compact = compact_workbook(plain)
+    ws = compact['Sheet1']
+    assert isinstance(ws, SheetCells)
+    assert ws['B1'] == plain['Sheet1']['B1']
+    assert ws.get('Z99') is None
+    assert 'AA10' in ws and 'A2' not in ws
+    assert list(ws) == ['A1', 'B1', 'AA10']
+    assert ws == plain['Sheet1']
+    assert plain['Sheet1'] == ws
+    assert compact == plain
+    # 型別不同的值不可被合併（1 與 1.0 / True）
+    assert compact['Sheet2']['C3'] == {'formula': None, 'value': 1, 'cached_value': 1.0}
+    assert type(compact['Sheet2']['C3']['cached_value']) is float
+    assert compact['Sheet1']['AA10']['value'] is True
+
+
+def test_sheet_cells_out_of_order_and_serialization():
+    """
+    測試亂序加入會排序、JSON 序列化結果與 dict 相同、可 pickle 傳遞。
+    """
+    sc = SheetCells(CellPool())
+    sc.add('B2', None, 2, 2)
+    sc.add('A1', '=B2', 2, 2)
+    sc.add('B2', None, 3, 3)
+    sc.freeze()
+    assert list(sc) == ['A1', 'B2']
+    assert sc['B2']['value'] == 3
+
+    plain = _plain()
+    compact = compact_workbook(plain)
+    assert json.dumps(compact, sort_keys=True, default=cells_json_default) == json.dumps(plain, sort_keys=True)
+    assert to_plain_cells(compact) == plain
+    assert pickle.loads(pickle.dumps(compact)) == plain
+
+
+if __name__ == "__main__":
+    pytest.main()
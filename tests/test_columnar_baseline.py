@@ -0,0 +1,113 @@
+import pytest
+import os
+import sys
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.columnar_baseline import save_columnar_baseline, load_columnar_baseline, read_columnar_header, LazySheet
+from utils.compression import save_compressed_file, load_compressed_file, migrate_baseline_format
+from utils.cell_store import compact_workbook, to_plain_cells
+
+
+def _baseline():
+    return {
+        'last_author': 'Alice',
+        'content_hash': 'abc',
+        'source_mtime': 1700000000.5,
+        'cells': {
+            '工作表1': {
+                'A1': {'formula': None, 'value': '名稱', 'cached_value': '名稱'},
+                'B2': {'formula': '=A1&"x"', 'value': '名稱x', 'cached_value': '名稱x'},
+            },
+            'Data': {
+                'C3': {'formula': None, 'value': 1, 'cached_value': 1.0},
+                'XFD1048576': {'formula': None, 'value': True, 'cached_value': None},
+            },
+        },
+    }
+
+
+def test_columnar_round_trip(tmp_path):
+    """
+    測試 columnar 基準線保存後載入與原始資料一致，且可只解碼指定工作表。
+    """
+    base = str(tmp_path / 'book.xlsx__1234.baseline.json')
+    data = _baseline()
+    path = save_columnar_baseline(base, data, 'gzip')
+    assert path.endswith('.wdc')
+
+    header = read_columnar_header(path)
+    assert [e['name'] for e in header['sheets']] == ['工作表1', 'Data']
+    assert header['meta']['last_author'] == 'Alice'
+
+    loaded = load_columnar_baseline(path)
+    assert loaded['cells'] == data['cells']
+    assert loaded['source_mtime'] == data['source_mtime']
+    assert list(loaded['cells'].keys()) == ['工作表1', 'Data']
+
+    partial = load_columnar_baseline(path, sheets={'Data'})
+    assert list(partial['cells'].keys()) == ['Data']
+
+    # 由共用值池的 SheetCells 保存也應得到相同結果
+    data2 = dict(data, cells=compact_workbook(data['cells']))
+    loaded2 = load_columnar_baseline(save_columnar_baseline(base, data2, 'gzip'))
+    assert loaded2['cells'] == data['cells']
+
+
+def test_migrate_between_json_and_columnar(tmp_path):
+    """
+    測試 migrate_baseline_format 可在 JSON 與 columnar 之間互轉，load_compressed_file 可讀取兩種格式。
+    """
+    base = str(tmp_path / 'm.baseline.json')
+    json_path = save_compressed_file(base, _baseline(), 'gzip')
+    wdc_path = migrate_baseline_format(json_path, 'columnar')
+    assert wdc_path.endswith('.wdc') and not os.path.exists(json_path)
+    assert load_compressed_file(base)['cells'] == _baseline()['cells']
+
+    back = migrate_baseline_format(wdc_path, 'gzip')
+    assert back.endswith('.gz') and not os.path.exists(wdc_path)
+    assert load_compressed_file(base)['cells'] == _baseline()['cells']
+
+
+def test_lazy_sheets_decode_on_access_and_pass_through(tmp_path):
+    """
+    測試延遲載入：表名、儲存格數、digest 不需解碼即可取得；重新保存時未變更的表沿用原區塊。
+    """
+    base = str(tmp_path / 'lazy.baseline.json')
+    path = save_columnar_baseline(base, _baseline(), 'gzip')
+    data = load_columnar_baseline(path, lazy=True)
+    cells = data['cells']
+    assert list(cells.keys()) == ['工作表1', 'Data']
+    assert all(isinstance(ws, LazySheet) and not ws.is_loaded for ws in cells.values())
+    assert len(cells['Data']) == 2 and cells['Data'].digest
+    assert not cells['Data'].is_loaded
+
+    assert cells['工作表1']['B2']['formula'] == '=A1&"x"'
+    assert cells['工作表1'].is_loaded and not cells['Data'].is_loaded
+
+    # 只改一張表後重新保存：Data 沿用原區塊，保存後仍可從新檔案延遲讀取
+    new_cells = {'工作表1': {'A1': {'formula': None, 'value': 'new', 'cached_value': 'new'}}, 'Data': cells['Data']}
+    digest_before = cells['Data'].digest
+    save_columnar_baseline(base, dict(data, cells=new_cells), 'gzip')
+    assert cells['Data'].digest == digest_before
+    assert dict(cells['Data']) == _baseline()['cells']['Data']
+    reloaded = load_columnar_baseline(path)
+    assert reloaded['cells']['Data'] == _baseline()['cells']['Data']
+    assert reloaded['cells']['工作表1']['A1']['value'] == 'new'
+
+
+def test_plain_cells_keep_lazy_sheets_lazy(tmp_path):
+    """
+    測試停用緊湊儲存（to_plain_cells）時，延遲載入的工作表不會被整本解碼。
+    """
+    path = save_columnar_baseline(str(tmp_path / 'plain.baseline.json'), _baseline(), 'gzip')
+    cells = to_plain_cells(load_columnar_baseline(path, lazy=True)['cells'])
+    assert all(isinstance(ws, LazySheet) and not ws.is_loaded for ws in cells.values())
+    assert cells['Data']['C3']['value'] == 1
+    assert cells['Data'].is_loaded and not cells['工作表1'].is_loaded
+
+
+if __name__ == "__main__":
+    pytest.main()
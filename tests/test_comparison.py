@@ -0,0 +1,202 @@
+import pytest
+import os
+import sys
+import itertools
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+pytest.importorskip('psutil')
+pytest.importorskip('openpyxl')
+
+import config.settings as settings
+import core.comparison as comparison
+import core.parse_worker as parse_worker
+import utils.history as history
+from core.comparison import compute_excel_changes, render_comparison, DiffResult, classify_change_type, _apply_display_flags, _display_value
+
+
+def _cell(formula=None, value=None, cached_value=None):
+    return {'formula': formula, 'value': value, 'cached_value': cached_value}
+
+
+EXT = "='[book.xlsx]Sheet1'!A1"
+
+# 涵蓋 classify_change_type 每個分支的 (舊, 新) 儲存格
+CELL_PAIRS = [
+    ({}, _cell(value=1)),                                             # 新增
+    (_cell(value=1), {}),                                             # 刪除
+    (_cell('=A1', 1, 1), _cell('=A2', 1, 1)),                         # 內部公式變更，值相同
+    (_cell('=A1', 1, 1), _cell('=A2', 2, 2)),                         # 內部公式變更，值不同
+    (_cell('=A1', 1, 1), _cell(None, 1, None)),                       # 公式被移除
+    (_cell('=A1', 1, 1), _cell(EXT, 1, 1)),                           # 外部參照連結變更
+    (_cell(EXT, 1, 1), _cell(EXT, 1, 5)),                             # 外部參照刷新
+    (_cell('=A1', 1, 1), _cell('=A1', 1, 2)),                         # 間接變更
+    (_cell(None, 'a', None), _cell(None, 'b', None)),                 # 純值變更
+    (_cell(None, 1, 1), _cell(None, 1, None)),                        # 顯示值相同
+]
+
+FLAG_NAMES = ('show_external_refresh', 'suppress_internal_same_value', 'formula_only_mode')
+
+
+def _reference_counters(old_cells, new_cells):
+    # 改寫前 utils.history.compute_change_counters 的逐格實作
+    counters = {k: 0 for k in ['dvc', 'fci', 'xrlc', 'xru', 'addc', 'delc']}
+    total = 0
+    keys = {'CELL_ADDED': 'addc', 'CELL_DELETED': 'delc', 'DIRECT_VALUE_CHANGE': 'dvc',
+            'FORMULA_CHANGE_INTERNAL': 'fci', 'EXTERNAL_REF_LINK_CHANGE': 'xrlc', 'EXTERNAL_REFRESH_UPDATE': 'xru'}
+    for s in set(old_cells) | set(new_cells):
+        a = old_cells.get(s, {})
+        b = new_cells.get(s, {})
+        for addr in set(a) | set(b):
+            oa = a.get(addr, {})
+            nb = b.get(addr, {})
+            if oa == nb:
+                continue
+            total += 1
+            t = classify_change_type(oa, nb)
+            if t in keys:
+                counters[keys[t]] += 1
+    counters['total_changes'] = total
+    return counters
+
+
+@pytest.mark.parametrize('flag_values', list(itertools.product((True, False), repeat=3)))
+def test_apply_display_flags_matches_classify_change_type(flag_values):
+    """
+    測試由中性分類推導的顯示分類，與 classify_change_type 帶相同旗標呼叫的結果一致
+    """
+    flags = dict(zip(FLAG_NAMES, flag_values))
+    for old_cell, new_cell in CELL_PAIRS:
+        base_type = classify_change_type(old_cell, new_cell)
+        derived = _apply_display_flags(base_type, _display_value(old_cell), _display_value(new_cell), **flags)
+        assert derived == classify_change_type(old_cell, new_cell, **flags), (old_cell, new_cell, flags)
+
+
+@pytest.mark.parametrize('formula_only', [True, False])
+def test_diff_result_counters_match_reference(monkeypatch, formula_only):
+    """
+    測試 DiffResult 的整本與逐表統計與原本的 compute_change_counters 一致，且不受顯示設定影響
+    """
+    monkeypatch.setattr(settings, 'DIFF_ENGINE', 'python', raising=False)
+    monkeypatch.setattr(settings, 'FORMULA_ONLY_MODE', formula_only, raising=False)
+    monkeypatch.setattr(settings, 'SHOW_EXTERNAL_REFRESH_CHANGES', not formula_only, raising=False)
+    old_cells = {'Sheet1': {}, 'Gone': {'A1': _cell(value=1)}, 'Same': {'A1': _cell(value=1)}}
+    new_cells = {'Sheet1': {}, 'New': {'B2': _cell('=A1', 1, 1)}, 'Same': {'A1': _cell(value=1)}}
+    for i, (old_cell, new_cell) in enumerate(CELL_PAIRS, start=1):
+        if old_cell:
+            old_cells['Sheet1'][f'A{i}'] = old_cell
+        if new_cell:
+            new_cells['Sheet1'][f'A{i}'] = new_cell
+
+    result = DiffResult.compute(old_cells, new_cells)
+    assert result.counters == _reference_counters(old_cells, new_cells)
+    assert set(result.sheets) == {'Sheet1', 'New', 'Gone'}
+    for name, counters in result.sheet_counters.items():
+        assert counters == _reference_counters({name: old_cells.get(name, {})}, {name: new_cells.get(name, {})})
+
+
+class _FakeLease:
+    def __init__(self, available=True):
+        self.available = available
+        self.local_path = '/cache/book.xlsx' if available else None
+        self.source_stat = (1.0, 10) if available else None
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def flow(tmp_path, monkeypatch):
+    """
+    以假的基準線清單、基準線與解析器執行 compute_excel_changes；記錄每次解析與保存呼叫
+    """
+    book = tmp_path / 'book.xlsx'
+    book.write_bytes(b'x' * 10)
+    state = {'entry': None, 'parsed': {'Sheet1': {'A1': _cell(value=1)}}, 'parses': [], 'saved': [], 'history': []}
+    old_cells = {'Sheet1': {'A1': _cell(value=1)}}
+
+    def fake_parse(path, show_sheet_detail=True, silent=False, only_sheets=None, local_path=None):
+        state['parses'].append(local_path)
+        return state['parsed']
+
+    monkeypatch.setattr(settings, 'DIFF_ENGINE', 'python', raising=False)
+    monkeypatch.setattr(settings, 'QUICK_SKIP_BY_STAT', True, raising=False)
+    monkeypatch.setattr(settings, 'SKIP_UNCHANGED_SHEETS_BY_CRC', False, raising=False)
+    monkeypatch.setattr(settings, 'AUTO_UPDATE_BASELINE_AFTER_COMPARE', True, raising=False)
+    monkeypatch.setattr(settings, 'CSV_LOG_FILE', str(tmp_path / 'logs' / 'changes.csv.gz'), raising=False)
+    monkeypatch.setattr(comparison, 'get_manifest_entry', lambda key: state['entry'])
+    monkeypatch.setattr(comparison, 'get_workbook_fingerprints', lambda path, lease=None: {'sheets': {'Sheet1': 1}})
+    monkeypatch.setattr(comparison, 'load_baseline', lambda key: {'cells': old_cells, 'last_author': 'Alice', 'timestamp': 'N/A'})
+    monkeypatch.setattr(comparison, 'get_excel_last_author', lambda path, lease=None: 'Bob')
+    monkeypatch.setattr(comparison.baseline, 'save_baseline', lambda key, data: state['saved'].append(data) or True)
+    monkeypatch.setattr(parse_worker, 'dump_excel_cells_isolated', fake_parse)
+    monkeypatch.setattr(comparison.time, 'sleep', lambda sec: None)
+    for name in ('save_history_snapshot', 'sync_history_to_git_repo', 'insert_event_index'):
+        monkeypatch.setattr(history, name, lambda *a, _name=name, **k: state['history'].append(_name))
+    state['path'] = str(book)
+    return state
+
+
+def test_status_quick_skip_by_manifest_stat(flow, capsys):
+    """
+    測試基準線清單的 mtime/size 相符時直接 QUICK_SKIP，不解析；靜默時不輸出
+    """
+    st = os.stat(flow['path'])
+    flow['entry'] = {'storage_path': 'x.gz', 'source_mtime': st.st_mtime, 'source_size': st.st_size}
+    result = compute_excel_changes(flow['path'], lease=_FakeLease())
+    assert result.status == 'QUICK_SKIP'
+    assert flow['parses'] == []
+    assert render_comparison(result, silent=True) is False
+    assert capsys.readouterr().out == ''
+    assert render_comparison(result) is False
+    assert '快速通過' in capsys.readouterr().out
+
+
+def test_status_unchanged_and_read_error(flow):
+    """
+    測試內容相同為 UNCHANGED；無法取得副本或解析失敗為 READ_ERROR，失敗時只以同一個副本重試一次
+    """
+    result = compute_excel_changes(flow['path'], lease=_FakeLease())
+    assert result.status == 'UNCHANGED' and not result.has_changes
+    assert flow['parses'] == ['/cache/book.xlsx']
+
+    flow['parses'].clear()
+    assert compute_excel_changes(flow['path'], lease=_FakeLease(available=False)).status == 'READ_ERROR'
+    assert flow['parses'] == []
+
+    for parsed in (None, {}):
+        flow['parses'].clear()
+        flow['parsed'] = parsed
+        result = compute_excel_changes(flow['path'], lease=_FakeLease())
+        assert result.status == 'READ_ERROR'
+        assert flow['parses'] == ['/cache/book.xlsx', '/cache/book.xlsx']
+        assert render_comparison(result, silent=True) is False
+
+
+def test_status_changed_parses_once_for_silent_and_visible_render(flow, capsys):
+    """
+    測試 CHANGED：同一事件先靜默判斷再顯示只解析一次；靜默判斷不輸出、不保存，顯示時才寫入歷史與更新基準線
+    """
+    flow['parsed'] = {'Sheet1': {'A1': _cell(value=2)}}
+    result = compute_excel_changes(flow['path'], event_number=7, lease=_FakeLease())
+    assert result.status == 'CHANGED' and result.has_changes
+    assert result.old_author == 'Alice' and result.new_author == 'Bob'
+    assert result.diff.counters['dvc'] == 1
+
+    assert render_comparison(result, silent=True) is True
+    assert capsys.readouterr().out == ''
+    assert flow['saved'] == [] and flow['history'] == []
+
+    assert render_comparison(result) is True
+    assert flow['parses'] == ['/cache/book.xlsx']
+    assert flow['history'] == ['save_history_snapshot', 'sync_history_to_git_repo', 'insert_event_index']
+    assert len(flow['saved']) == 1
+    saved = flow['saved'][0]
+    assert saved['cells'] == flow['parsed'] and saved['last_author'] == 'Bob'
+    assert (saved['source_mtime'], saved['source_size']) == (1.0, 10)
+
+
+if __name__ == "__main__":
+    pytest.main()
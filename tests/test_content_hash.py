@@ -0,0 +1,51 @@
+import pytest
+import os
+import sys
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.cell_store import SheetCells
+from utils.content_hash import build_content_tree, diff_content_trees, scoped_cells
+
+
+def _sheet(n_rows, changed_row=None):
+    cells = {}
+    for r in range(1, n_rows + 1):
+        value = 'changed' if r == changed_row else r
+        cells[f"A{r}"] = {'formula': None, 'value': value, 'cached_value': None}
+        cells[f"B{r}"] = {'formula': f"=A{r}*2", 'value': None, 'cached_value': r * 2}
+    return cells
+
+
+def test_content_tree_same_for_dict_and_compact_storage():
+    """
+    測試 dict 與 SheetCells 表示同一份內容時，雜湊樹相同
+    """
+    plain = {'S1': _sheet(600), 'S2': _sheet(3)}
+    compact = {name: SheetCells.from_dict(ws) for name, ws in plain.items()}
+    assert build_content_tree(plain) == build_content_tree(compact)
+    assert diff_content_trees(build_content_tree(plain), build_content_tree(compact)) == {}
+
+
+def test_diff_content_trees_locates_changed_sheet_and_block():
+    """
+    測試雜湊樹比較只回報有變動的工作表與列區塊
+    """
+    old = {'S1': _sheet(600), 'S2': _sheet(3)}
+    new = {'S1': SheetCells.from_dict(_sheet(600, changed_row=300)), 'S2': _sheet(3), 'S3': _sheet(1)}
+    old_tree = build_content_tree(old)
+    new_tree = build_content_tree(new, known={'S2': old_tree['sheets']['S2']})
+
+    scope = diff_content_trees(old_tree, new_tree)
+    assert scope == {'S1': {300 // old_tree['block_rows']}, 'S3': None}
+
+    sub = scoped_cells(new, scope, new_tree['block_rows'])
+    assert set(sub) == {'S1', 'S3'}
+    assert 'A300' in sub['S1'] and 'A1' not in sub['S1']
+    assert sub['S1']['A300']['value'] == 'changed'
+
+
+if __name__ == "__main__":
+    pytest.main()
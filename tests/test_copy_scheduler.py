@@ -0,0 +1,138 @@
+import pytest
+import os
+import sys
+import time
+import threading
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import config.settings as settings
+import utils.cache as cache
+from utils.copy_scheduler import CopyScheduler, CopyDeferred, share_key
+
+
+def test_copy_scheduler_dedup_share_limit_priority_and_retry(monkeypatch):
+    """
+    測試複製排程器：同一路徑合併為一次複製、同一共享的同時傳輸數受限、小檔優先、失敗時退避後重試
+    """
+    monkeypatch.setattr(settings, 'COPY_RETRY_COUNT', 3, raising=False)
+    monkeypatch.setattr(settings, 'COPY_RETRY_BACKOFF_SEC', 0.01, raising=False)
+    assert share_key(r'\\srv\share\dept\a.xlsx') == share_key('//SRV/share/b.xlsx') == r'\\srv\share'
+
+    sched = CopyScheduler(workers=4, per_share=1)
+    lock = threading.Lock()
+    active = {}
+    peak = {}
+    order = []
+    calls = []
+    gate = threading.Event()
+
+    def make(path, fail_times=0):
+        def attempt(n):
+            share = share_key(path)
+            with lock:
+                calls.append(path)
+                active[share] = active.get(share, 0) + 1
+                peak[share] = max(peak.get(share, 0), active[share])
+            if path.endswith('first.xlsx'):
+                gate.wait(5)
+            time.sleep(0.02)
+            with lock:
+                active[share] -= 1
+                order.append(path)
+            if n <= fail_times:
+                raise CopyDeferred('仍在寫入')
+            return 'cached:' + path, 100
+        return attempt
+
+    first = sched.submit(r'\\srv\a\first.xlsx', make(r'\\srv\a\first.xlsx'), lambda e, n: None, size=1)
+    time.sleep(0.05)
+    big = sched.submit(r'\\srv\a\big.xlsx', make(r'\\srv\a\big.xlsx'), lambda e, n: None, size=10_000_000)
+    small = sched.submit(r'\\srv\a\small.xlsx', make(r'\\srv\a\small.xlsx', fail_times=1), lambda e, n: None, size=10)
+    dup = sched.submit(r'\\srv\a\small.xlsx', make(r'\\srv\a\small.xlsx'), lambda e, n: None, size=10)
+    other = sched.submit(r'\\srv\b\x.xlsx', make(r'\\srv\b\x.xlsx'), lambda e, n: None, size=5)
+    assert dup is small
+    assert other.result(5) == r'cached:\\srv\b\x.xlsx'  # 另一個共享不受阻塞
+    gate.set()
+
+    assert small.result(5) == r'cached:\\srv\a\small.xlsx'
+    assert big.result(5) == r'cached:\\srv\a\big.xlsx'
+    assert first.result(5) == r'cached:\\srv\a\first.xlsx'
+    share_a = [p for p in order if p.startswith(r'\\srv\a')]
+    assert share_a[:2] == [r'\\srv\a\first.xlsx', r'\\srv\a\small.xlsx']
+    assert peak[share_key(r'\\srv\a\x')] == 1
+    assert calls.count(r'\\srv\a\small.xlsx') == 2  # 一次延後 + 一次成功
+
+    # 重試用盡時以 on_fail 的結果結束
+    failing = sched.submit('/mnt/share/c.xlsx', make('/mnt/share/c.xlsx', fail_times=5), lambda e, n: ('failed', n))
+    assert failing.result(5) == ('failed', 3)
+
+    stats = sched.stats()
+    assert stats['joined'] == 1 and stats['completed'] == 4 and stats['failed'] == 1 and stats['retries'] == 3
+    sched.stop(wait=True, timeout=5)
+
+
+def test_copy_scheduler_deferral_releases_share_slot(monkeypatch):
+    """
+    測試延後檢查（CopyDeferred 帶 delay）：不計入重試次數，等待期間同一共享的其他複製可以進行
+    """
+    monkeypatch.setattr(settings, 'COPY_RETRY_COUNT', 1, raising=False)
+    sched = CopyScheduler(workers=2, per_share=1)
+    seen = []
+    finished = []
+
+    def unstable(n):
+        seen.append(n)
+        if len(seen) <= 3:
+            raise CopyDeferred('尚未穩定', delay=0.1)
+        finished.append('unstable')
+        return 'unstable', 1
+
+    def stable(n):
+        finished.append('stable')
+        return 'stable', 1
+
+    a = sched.submit('/mnt/share/unstable.xlsx', unstable, lambda e, n: None, size=1)
+    time.sleep(0.02)
+    b = sched.submit('/mnt/share/stable.xlsx', stable, lambda e, n: None, size=2)
+    assert b.result(5) == 'stable'
+    assert a.result(5) == 'unstable'
+    assert finished == ['stable', 'unstable']
+    assert seen == [1, 1, 1, 1]
+    stats = sched.stats()
+    assert stats['deferred'] == 3 and stats['retries'] == 0 and stats['failed'] == 0
+    sched.stop(wait=True, timeout=5)
+
+
+def test_copy_to_cache_waits_for_stability_through_scheduler(tmp_path, monkeypatch):
+    """
+    測試複製前穩定性預檢：未穩定的來源以延後檢查排回佇列（不在工作執行緒內睡眠），穩定後才複製
+    """
+    src = tmp_path / 'share' / 'new.xlsx'
+    src.parent.mkdir()
+    src.write_bytes(b'data' * 100)
+    monkeypatch.setattr(settings, 'USE_LOCAL_CACHE', True, raising=False)
+    monkeypatch.setattr(settings, 'CACHE_FOLDER', str(tmp_path / 'cache'), raising=False)
+    monkeypatch.setattr(settings, 'LOG_FOLDER', str(tmp_path / 'logs'), raising=False)
+    monkeypatch.setattr(settings, 'COPY_STABILITY_CHECKS', 3, raising=False)
+    monkeypatch.setattr(settings, 'COPY_STABILITY_INTERVAL_SEC', 0.05, raising=False)
+    monkeypatch.setattr(settings, 'COPY_STABILITY_MAX_WAIT_SEC', 5, raising=False)
+    monkeypatch.setattr(settings, 'COPY_RETRY_COUNT', 1, raising=False)
+    monkeypatch.setattr(settings, 'COPY_POST_SLEEP_SEC', 0, raising=False)
+    monkeypatch.setattr(settings, 'COPY_WORKERS', 1, raising=False)
+    monkeypatch.setattr(settings, 'COPY_ENGINE', 'python', raising=False)
+    monkeypatch.setattr(settings, 'CACHE_MAX_SIZE_MB', 0, raising=False)
+    sched = CopyScheduler(workers=1, per_share=1)
+    monkeypatch.setattr(cache, '_copy_scheduler', sched)
+
+    cached = cache.copy_to_cache(str(src), silent=True)
+    assert cached != str(src) and open(cached, 'rb').read() == src.read_bytes()
+    stats = sched.stats()
+    assert stats['deferred'] >= 2 and stats['completed'] == 1 and stats['retries'] == 0
+    sched.stop(wait=True, timeout=5)
+
+
+if __name__ == "__main__":
+    pytest.main()
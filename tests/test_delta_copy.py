@@ -0,0 +1,74 @@
+import pytest
+import os
+import sys
+import zipfile
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import config.settings as settings
+import utils.cache as cache
+from utils.delta_copy import delta_copy
+
+
+def _write_book(path, sheet1, vba):
+    # 固定時間戳記，模擬 Excel 重新存檔時未變動成員的位元組不變
+    with zipfile.ZipFile(path, 'w') as z:
+        for name, data, method in (
+            ('[Content_Types].xml', b'<Types/>', zipfile.ZIP_DEFLATED),
+            ('xl/vbaProject.bin', vba, zipfile.ZIP_STORED),
+            ('xl/worksheets/sheet1.xml', sheet1, zipfile.ZIP_DEFLATED),
+        ):
+            info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = method
+            z.writestr(info, data)
+
+
+def test_delta_copy_fetches_only_changed_members(tmp_path, monkeypatch):
+    """
+    測試差異複製（本地資料夾模擬網路共享）：只從來源讀取變動的成員，結果與來源逐位元組相同；整份重寫時改完整複製
+    """
+    share = tmp_path / 'share'
+    share.mkdir()
+    src = share / 'big.xlsm'
+    vba = os.urandom(512 * 1024)
+    _write_book(src, b'<sheetData>v1</sheetData>', vba)
+
+    monkeypatch.setattr(settings, 'USE_LOCAL_CACHE', True, raising=False)
+    monkeypatch.setattr(settings, 'CACHE_FOLDER', str(tmp_path / 'cache'), raising=False)
+    monkeypatch.setattr(settings, 'LOG_FOLDER', str(tmp_path / 'logs'), raising=False)
+    monkeypatch.setattr(settings, 'COPY_STABILITY_CHECKS', 1, raising=False)
+    monkeypatch.setattr(settings, 'COPY_POST_SLEEP_SEC', 0, raising=False)
+    monkeypatch.setattr(settings, 'COPY_ENGINE', 'delta', raising=False)
+    monkeypatch.setattr(settings, 'CACHE_MAX_SIZE_MB', 0, raising=False)
+
+    cached = cache.copy_to_cache(str(src), silent=True)
+    assert open(cached, 'rb').read() == src.read_bytes()
+
+    # 只改工作表：大型的 vbaProject.bin 從舊副本沿用
+    _write_book(src, b'<sheetData>v2 changed</sheetData>', vba)
+    os.utime(src, (2_000_000_000, 2_000_000_000))
+    old_copy = tmp_path / 'old.xlsm'
+    old_copy.write_bytes(open(cached, 'rb').read())
+    stats = delta_copy(str(src), cached)
+    assert stats['mode'] == 'delta'
+    assert stats['reused'] >= len(vba)
+    assert stats['fetched'] < stats['size'] // 10
+    assert open(cached, 'rb').read() == src.read_bytes()
+
+    # copy_to_cache 以差異複製更新副本
+    _write_book(src, b'<sheetData>v3</sheetData>', vba)
+    os.utime(src, (2_000_000_100, 2_000_000_100))
+    cached = cache.copy_to_cache(str(src), silent=True)
+    assert open(cached, 'rb').read() == src.read_bytes()
+
+    # 整份重寫：沒有可沿用的成員，改完整複製
+    _write_book(src, b'<sheetData>v4</sheetData>', os.urandom(512 * 1024))
+    stats = delta_copy(str(src), str(old_copy))
+    assert stats['mode'] == 'full' and stats['reused'] == 0
+    assert old_copy.read_bytes() == src.read_bytes()
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,72 @@
+import pytest
+import os
+import sys
+import time
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import config.settings as settings
+from utils.discovery import iter_excel_files
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x')
+
+
+def test_iter_excel_files_prunes_excluded_and_reuses_dir_cache(tmp_path, monkeypatch):
+    """
+    測試並行掃描：排除資料夾在走訪時剪枝、暫存檔不列入；資料夾 mtime 未變時沿用快取，新增檔案後重新列出
+    """
+    root = tmp_path / 'share'
+    for rel in ('a.xlsx', 'sub/b.XLSM', 'sub/~$b.xlsm', 'sub/deep/c.xlsx', 'skip/d.xlsx', 'note.txt'):
+        _touch(str(root / rel))
+    # 讓資料夾 mtime 早於快取的時間窗口
+    for dirpath, _, _ in os.walk(root):
+        os.utime(dirpath, (1_000_000_000, 1_000_000_000))
+
+    monkeypatch.setattr(settings, 'LOG_FOLDER', str(tmp_path / 'logs'), raising=False)
+    monkeypatch.setattr(settings, 'SUPPORTED_EXTS', ('.xlsx', '.xlsm'), raising=False)
+    monkeypatch.setattr(settings, 'WATCH_EXCLUDE_FOLDERS', [str(root / 'skip')], raising=False)
+    monkeypatch.setattr(settings, 'force_stop', False, raising=False)
+
+    expected = {str(root / 'a.xlsx'), str(root / 'sub' / 'b.XLSM'), str(root / 'sub' / 'deep' / 'c.xlsx')}
+    assert set(iter_excel_files([str(root)], workers=4, use_cache=True)) == expected
+    assert os.path.exists(tmp_path / 'logs' / 'discovery_cache.json')
+
+    # 快取命中：結果相同
+    assert set(iter_excel_files([str(root)], workers=4, use_cache=True)) == expected
+
+    # 新增檔案會改變資料夾 mtime，該資料夾重新列出
+    _touch(str(root / 'sub' / 'deep' / 'e.xlsx'))
+    assert set(iter_excel_files([str(root)], workers=2, use_cache=True)) == expected | {str(root / 'sub' / 'deep' / 'e.xlsx')}
+
+
+def test_iter_excel_files_multiple_roots_with_slow_consumer(tmp_path, monkeypatch):
+    """
+    測試多個根目錄：前面的根目錄先掃完時不可提早結束，消費端處理較慢時也不遺漏任何檔案
+    """
+    monkeypatch.setattr(settings, 'LOG_FOLDER', str(tmp_path / 'logs'), raising=False)
+    monkeypatch.setattr(settings, 'SUPPORTED_EXTS', ('.xlsx', '.xlsm'), raising=False)
+    monkeypatch.setattr(settings, 'WATCH_EXCLUDE_FOLDERS', [], raising=False)
+    monkeypatch.setattr(settings, 'force_stop', False, raising=False)
+    roots = [tmp_path / f'root{i}' for i in range(3)]
+    expected = set()
+    for root in roots:
+        for n in range(3):
+            _touch(str(root / f'f{n}.xlsx'))
+            expected.add(str(root / f'f{n}.xlsx'))
+
+    for delay in (0, 0.02):
+        found = []
+        for path in iter_excel_files([str(r) for r in roots], workers=4, use_cache=False):
+            found.append(path)
+            time.sleep(delay)
+        assert sorted(found) == sorted(expected)
+
+
+if __name__ == "__main__":
+    pytest.main()
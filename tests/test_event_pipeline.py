@@ -0,0 +1,106 @@
+import pytest
+import os
+import sys
+import time
+import threading
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from core.event_pipeline import EventPipeline
+
+
+def test_pipeline_serializes_per_file_and_coalesces():
+    """
+    測試事件管線：同一檔案不會並行處理、處理中收到的事件合併為一筆；慢檔案不阻塞其他檔案
+    """
+    pipeline = EventPipeline(workers=3, max_pending=10)
+    active = {}
+    overlap = []
+    done = []
+    lock = threading.Lock()
+    release_slow = threading.Event()
+
+    def work(key, n):
+        with lock:
+            if active.get(key):
+                overlap.append(key)
+            active[key] = True
+        if key == 'slow.xlsx' and n == 1:
+            release_slow.wait(5)
+        with pipeline.timed('compare'):
+            time.sleep(0.01)
+        with lock:
+            active[key] = False
+            done.append((key, n))
+
+    pipeline.submit('slow.xlsx', work, 'slow.xlsx', 1)
+    time.sleep(0.05)
+    for n in (2, 3, 4):
+        pipeline.submit('slow.xlsx', work, 'slow.xlsx', n)
+    pipeline.submit('fast.xlsx', work, 'fast.xlsx', 1)
+
+    deadline = time.time() + 5
+    while ('fast.xlsx', 1) not in done and time.time() < deadline:
+        time.sleep(0.01)
+    assert ('fast.xlsx', 1) in done  # 慢檔案處理中，其他檔案照常處理
+
+    release_slow.set()
+    while len(done) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    pipeline.stop(wait=True, timeout=5)
+
+    assert not overlap
+    assert [n for key, n in done if key == 'slow.xlsx'] == [1, 4]
+    stats = pipeline.stats()
+    assert stats['coalesced'] == 2 and stats['processed'] == 3 and stats['queue_depth'] == 0
+    assert stats['stages']['compare']['count'] == 3
+
+
+def test_pipeline_runs_different_work_for_one_file_in_sequence():
+    """
+    測試同一檔案的不同工作（修改事件與輪詢比較）：不互相取代、依排入順序執行且不並行
+    """
+    pipeline = EventPipeline(workers=3, max_pending=10)
+    lock = threading.Lock()
+    running = []
+    overlap = []
+    done = []
+    release = threading.Event()
+
+    def step(name):
+        with lock:
+            if running:
+                overlap.append(name)
+            running.append(name)
+        if name == 'modified-1':
+            release.wait(5)
+        time.sleep(0.01)
+        with lock:
+            running.remove(name)
+            done.append(name)
+
+    def modified(n):
+        step(f'modified-{n}')
+
+    def poll_compare():
+        step('poll')
+
+    pipeline.submit('book.xlsx', modified, 1)
+    time.sleep(0.05)
+    pipeline.submit('book.xlsx', poll_compare)
+    pipeline.submit('book.xlsx', modified, 2)
+    pipeline.submit('book.xlsx', modified, 3)
+    release.set()
+    deadline = time.time() + 5
+    while len(done) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    pipeline.stop(wait=True, timeout=5)
+
+    assert not overlap
+    assert done == ['modified-1', 'poll', 'modified-3']
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,99 @@
+import pytest
+import os
+import sys
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+pytest.importorskip('psutil')
+pytest.importorskip('openpyxl')
+
+import core.excel_parser as excel_parser
+
+
+class _ReadOnlySheet:
+    title = 'Sheet1'
+
+    def _get_source(self):
+        raise AttributeError('_get_source')
+
+
+CELLS = [(1, 1, None, 'a'), (1, 3, '=A1', 'a'), (2, 2, None, 2), (5, 1, None, 'z')]
+
+
+def _dense(ws):
+    yield from CELLS
+
+
+def test_iter_sheet_cells_falls_back_when_sparse_fails_while_iterating(monkeypatch):
+    """
+    測試 sparse 走訪在走訪中才失敗（openpyxl 內部介面不相容）時，改以逐格走訪接續且不重複產出
+    """
+    monkeypatch.setattr(excel_parser, '_iter_sheet_cells_dense', _dense)
+    ws = _ReadOnlySheet()
+    assert list(excel_parser._iter_sheet_cells(ws)) == CELLS
+
+    def partly_sparse(ws):
+        yield from CELLS[:2]
+        raise TypeError("unexpected keyword argument 'date_formats'")
+
+    monkeypatch.setattr(excel_parser, '_iter_sheet_cells_sparse', partly_sparse)
+    assert list(excel_parser._iter_sheet_cells(ws)) == CELLS
+    assert list(excel_parser._iter_sheet_cells(ws, sparse=False)) == CELLS
+
+
+def _multi_sheet_workbook(path):
+    from openpyxl import Workbook
+    wb = Workbook()
+    for i in range(3):
+        ws = wb.active if i == 0 else wb.create_sheet()
+        ws.title = f'S{i}'
+        for r in range(1, 30 * (i + 1)):
+            ws.cell(row=r, column=1, value=r * i)
+            ws.cell(row=r, column=2, value=f'=A{r}*2')
+    wb.save(path)
+
+
+def test_openpyxl_engine_parallel_sheets_match_serial(tmp_path, monkeypatch, caplog):
+    """
+    測試 FORMULA_ENGINE='openpyxl' 逐表平行解析的結果與單行程一致且依活頁簿順序；行程池失敗時記錄警告並退回單行程
+    """
+    path = str(tmp_path / 'multi.xlsx')
+    _multi_sheet_workbook(path)
+    monkeypatch.setattr(excel_parser.settings, 'FORMULA_ENGINE', 'openpyxl', raising=False)
+    monkeypatch.setattr(excel_parser.settings, 'VALUE_ENGINE', 'xml', raising=False)
+    monkeypatch.setattr(excel_parser.settings, 'COMPACT_CELL_STORAGE', False, raising=False)
+    monkeypatch.setattr(excel_parser.settings, 'PARALLEL_SHEET_MIN_FILE_MB', 0, raising=False)
+    monkeypatch.setattr(excel_parser.settings, 'MAX_SHEET_WORKERS', 2, raising=False)
+    monkeypatch.setattr(excel_parser.os, 'cpu_count', lambda: 2)
+
+    monkeypatch.setattr(excel_parser.settings, 'PARALLEL_SHEET_PARSING', False, raising=False)
+    serial = excel_parser.dump_excel_cells_with_timeout(path, silent=True, local_path=path)
+    assert serial and serial['S1']['B2']['formula'] == '=A2*2'
+
+    monkeypatch.setattr(excel_parser.settings, 'PARALLEL_SHEET_PARSING', True, raising=False)
+    calls = []
+    real_pool = excel_parser._scan_sheets_in_pool
+
+    def counting_pool(*args, **kwargs):
+        calls.append(args[1])
+        return real_pool(*args, **kwargs)
+
+    monkeypatch.setattr(excel_parser, '_scan_sheets_in_pool', counting_pool)
+    parallel = excel_parser.dump_excel_cells_with_timeout(path, silent=True, local_path=path)
+    assert calls == [['S0', 'S1', 'S2']]
+    assert parallel == serial
+    assert list(parallel.keys()) == ['S0', 'S1', 'S2']
+
+    def broken_pool(*args, **kwargs):
+        raise OSError('no semaphores')
+
+    monkeypatch.setattr(excel_parser, '_scan_sheets_in_pool', broken_pool)
+    with caplog.at_level('WARNING'):
+        assert excel_parser.dump_excel_cells_with_timeout(path, silent=True, local_path=path) == serial
+    assert 'no semaphores' in caplog.text
+
+
+if __name__ == "__main__":
+    pytest.main()
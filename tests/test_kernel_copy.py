@@ -0,0 +1,55 @@
+import pytest
+import os
+import sys
+import csv
+import glob
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import config.settings as settings
+import utils.cache as cache
+from utils.kernel_copy import kernel_copy
+
+
+def test_kernel_copy_engine_logs_rate_and_honours_stop(tmp_path, monkeypatch):
+    """
+    測試核心輔助複製：內容一致並保留 mtime、成功紀錄包含傳輸速率；停止時中斷並刪除未完成的副本
+    """
+    share = tmp_path / 'share'
+    share.mkdir()
+    src = share / 'big.xlsx'
+    data = os.urandom(3 * 1024 * 1024 + 123)
+    src.write_bytes(data)
+    os.utime(src, (1_500_000_000, 1_500_000_000))
+
+    monkeypatch.setattr(settings, 'USE_LOCAL_CACHE', True, raising=False)
+    monkeypatch.setattr(settings, 'CACHE_FOLDER', str(tmp_path / 'cache'), raising=False)
+    monkeypatch.setattr(settings, 'LOG_FOLDER', str(tmp_path / 'logs'), raising=False)
+    monkeypatch.setattr(settings, 'COPY_STABILITY_CHECKS', 1, raising=False)
+    monkeypatch.setattr(settings, 'COPY_POST_SLEEP_SEC', 0, raising=False)
+    monkeypatch.setattr(settings, 'COPY_CHUNK_SIZE_MB', 1, raising=False)
+    monkeypatch.setattr(settings, 'COPY_ENGINE', 'kernel', raising=False)
+    monkeypatch.setattr(settings, 'CACHE_MAX_SIZE_MB', 0, raising=False)
+
+    cached = cache.copy_to_cache(str(src), silent=True)
+    assert open(cached, 'rb').read() == data
+    assert os.path.getmtime(cached) == os.path.getmtime(src)
+
+    log = glob.glob(os.path.join(str(tmp_path / 'logs'), 'ops_log', 'copy_success_*.csv'))[0]
+    with open(log, encoding='utf-8') as f:
+        row = list(csv.DictReader(f))[-1]
+    assert row['Engine'].startswith('kernel:')
+    assert int(row['BytesCopied']) == len(data)
+    assert row['MBPerSec'] != ''
+
+    monkeypatch.setattr(settings, 'force_stop', True, raising=False)
+    dst = tmp_path / 'partial.xlsx'
+    with pytest.raises(OSError):
+        kernel_copy(str(src), str(dst), chunk_mb=1)
+    assert not dst.exists()
+
+
+if __name__ == "__main__":
+    pytest.main()
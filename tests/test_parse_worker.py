@@ -0,0 +1,99 @@
+import pytest
+import os
+import sys
+import time
+import threading
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+import config.settings as settings
+import core.parse_worker as parse_worker
+from core.parse_worker import run_in_worker, ParseTimeout
+
+
+def test_run_in_worker_returns_result():
+    """
+    測試子行程的返回值會經由結果通道送回父行程。
+    """
+    assert run_in_worker(divmod, (17, 5), timeout=60) == (3, 2)
+
+
+def test_run_in_worker_kills_on_timeout():
+    """
+    測試超過期限時子行程被強制終止，而非等待其自行結束。
+    """
+    start = time.time()
+    with pytest.raises(ParseTimeout):
+        run_in_worker(time.sleep, (60,), timeout=2)
+    assert time.time() - start < 30
+
+
+def test_run_in_worker_reports_child_error():
+    """
+    測試子行程內的例外會轉為 RuntimeError 回報。
+    """
+    with pytest.raises(RuntimeError):
+        run_in_worker(int, ('not-a-number',), timeout=60)
+
+
+def test_run_in_worker_reuses_process_until_killed():
+    """
+    測試子行程常駐重用：連續解析使用同一個子行程；逾時被終止後改用新的子行程。
+    """
+    pid = run_in_worker(os.getpid, timeout=60)
+    assert run_in_worker(os.getpid, timeout=60) == pid
+    with pytest.raises(RuntimeError):
+        run_in_worker(int, ('not-a-number',), timeout=60)
+    assert run_in_worker(os.getpid, timeout=60) == pid  # 子行程內的例外不需重啟
+    with pytest.raises(ParseTimeout):
+        run_in_worker(time.sleep, (60,), timeout=1)
+    assert run_in_worker(os.getpid, timeout=60) != pid
+
+
+def test_isolated_parse_status_is_per_thread(monkeypatch):
+    """
+    測試目前處理檔案依執行緒記錄：並行解析時兩個檔案都看得到，且不動全域的 current_processing_file。
+    """
+    monkeypatch.setattr(settings, 'ISOLATE_PARSE_PROCESS', True, raising=False)
+    monkeypatch.setattr(settings, 'current_processing_file', None, raising=False)
+    barrier = threading.Barrier(2)
+    seen = []
+
+    def fake_run(target, args=(), kwargs=None, timeout=None):
+        barrier.wait(5)
+        seen.append(sorted(parse_worker.current_parses()))
+        barrier.wait(5)
+        return {'Sheet1': {}}
+
+    monkeypatch.setattr(parse_worker, 'run_in_worker', fake_run)
+    threads = [threading.Thread(target=parse_worker.dump_excel_cells_isolated, args=(p,), kwargs={'silent': True})
+               for p in ('a.xlsx', 'b.xlsx')]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert seen == [['a.xlsx', 'b.xlsx']] * 2
+    assert parse_worker.current_parses() == []
+    assert settings.current_processing_file is None
+
+
+def test_isolated_parse_timeout_can_be_raised(monkeypatch):
+    """
+    測試逾時預設返回 None；raise_timeout=True 時拋出 ParseTimeout 讓呼叫方回報 TIMEOUT。
+    """
+    monkeypatch.setattr(settings, 'ISOLATE_PARSE_PROCESS', True, raising=False)
+
+    def timed_out(target, args=(), kwargs=None, timeout=None):
+        raise ParseTimeout('解析超過 1s')
+
+    monkeypatch.setattr(parse_worker, 'run_in_worker', timed_out)
+    assert parse_worker.dump_excel_cells_isolated('a.xlsx', silent=True) is None
+    with pytest.raises(ParseTimeout):
+        parse_worker.dump_excel_cells_isolated('a.xlsx', silent=True, raise_timeout=True)
+    assert parse_worker.current_parses() == []
+
+
+if __name__ == "__main__":
+    pytest.main()
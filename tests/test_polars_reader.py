@@ -0,0 +1,97 @@
+import pytest
+import os
+import sys
+import zipfile
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+pl = pytest.importorskip('polars')
+
+from utils.value_engines.polars_reader import _frame_to_cells, _xlsx2csv_in_process
+from utils.value_engines.stream_reader import col_letters
+
+
+def _row_loop(df):
+    # 改寫前逐列 df.row() 的實作
+    addrs, values = [], []
+    for r in range(df.height):
+        row = df.row(r)
+        for c, v in enumerate(row):
+            if v is None or (isinstance(v, str) and v == ''):
+                continue
+            addrs.append(f"{col_letters(c + 1)}{r + 1}")
+            values.append(v)
+    return addrs, values
+
+
+def test_frame_to_cells_matches_row_loop():
+    """
+    測試逐欄的 Polars 運算與原本的逐列迴圈結果一致：地址、逐列順序、各欄型別與空白過濾
+    """
+    df = pl.DataFrame({
+        'a': [1, None, 3, 4],
+        'b': ['x', '', None, 'y'],
+        'c': [1.5, 2.0, None, 0.0],
+        'd': [None, None, None, None],
+    }, schema={'a': pl.Int64, 'b': pl.Utf8, 'c': pl.Float64, 'd': pl.Utf8})
+    addrs, values = _frame_to_cells(df)
+    expected_addrs, expected_values = _row_loop(df)
+    assert addrs == expected_addrs
+    assert values == expected_values
+    assert [type(v) for v in values] == [type(v) for v in expected_values]
+    assert addrs[:4] == ['A1', 'B1', 'C1', 'C2']
+
+
+_SHEET = ('<?xml version="1.0" encoding="UTF-8"?>'
+          '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+          '<row r="1"><c r="A1" t="inlineStr"><is><t>name</t></is></c><c r="B1"><v>{v}</v></c></row>'
+          '</sheetData></worksheet>')
+
+
+def _write_xlsx(path):
+    ns = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+    rel = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('[Content_Types].xml',
+                   '<?xml version="1.0" encoding="UTF-8"?>'
+                   '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                   '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                   '<Default Extension="xml" ContentType="application/xml"/>'
+                   '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                   '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                   '<Override PartName="/xl/worksheets/sheet2.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                   '</Types>')
+        z.writestr('_rels/.rels',
+                   '<?xml version="1.0" encoding="UTF-8"?>'
+                   '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                   f'<Relationship Id="rId1" Type="{rel}/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+        z.writestr('xl/workbook.xml',
+                   f'<?xml version="1.0" encoding="UTF-8"?><workbook xmlns="{ns}" xmlns:r="{rel}"><sheets>'
+                   '<sheet name="First" sheetId="1" r:id="rId1"/><sheet name="Second" sheetId="2" r:id="rId2"/>'
+                   '</sheets></workbook>')
+        z.writestr('xl/_rels/workbook.xml.rels',
+                   '<?xml version="1.0" encoding="UTF-8"?>'
+                   '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                   f'<Relationship Id="rId1" Type="{rel}/worksheet" Target="worksheets/sheet1.xml"/>'
+                   f'<Relationship Id="rId2" Type="{rel}/worksheet" Target="worksheets/sheet2.xml"/></Relationships>')
+        z.writestr('xl/worksheets/sheet1.xml', _SHEET.format(v=1))
+        z.writestr('xl/worksheets/sheet2.xml', _SHEET.format(v=2))
+
+
+def test_xlsx2csv_in_process_converts_every_sheet(tmp_path):
+    """
+    測試以 xlsx2csv 函式庫在同一行程轉換每張工作表，表名與內容對應正確
+    """
+    pytest.importorskip('xlsx2csv')
+    path = str(tmp_path / 'book.xlsx')
+    _write_xlsx(path)
+    sheets = _xlsx2csv_in_process(path)
+    assert list(sheets) == ['First', 'Second']
+    assert sheets['First'].decode('utf-8').strip() == 'name,1'
+    assert sheets['Second'].decode('utf-8').strip() == 'name,2'
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,40 @@
+import pytest
+import os
+import sys
+import time
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.stability import StabilityTracker
+
+
+def test_tracker_skips_copy_wait_after_polling_window(tmp_path):
+    """
+    測試穩定度追蹤：輪詢判定穩定後，複製前預檢只需一次 stat；新的事件讓穩定窗口重新起算
+    """
+    f = tmp_path / 'book.xlsx'
+    f.write_bytes(b'data')
+    st = os.stat(f)
+    sig = (st.st_mtime, st.st_size)
+    tracker = StabilityTracker()
+
+    tracker.note_event(str(f))
+    for _ in range(3):
+        tracker.observe(str(f), sig)
+    assert not tracker.is_stable(str(f), sig, checks=3, interval=10)  # 次數夠但時間窗口未滿
+    tracker.mark_stable(str(f), sig)
+
+    started = time.time()
+    assert tracker.wait_until_stable(str(f), checks=5, interval=1.0, max_wait=12)
+    assert time.time() - started < 0.5
+
+    # 新的寫入事件：已知穩定的紀錄作廢，需重新等待
+    tracker.note_event(str(f))
+    assert not tracker.wait_until_stable(str(f), checks=5, interval=0.05, max_wait=0.1)
+    assert tracker.wait_until_stable(str(f), checks=3, interval=0.05, max_wait=1)
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,161 @@
+import pytest
+import os
+import sys
+import zipfile
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.value_engines.stream_reader import (
+    read_cells_from_xlsx_via_stream, workbook_sheet_members, read_zip_fingerprints, sheets_needing_parse
+)
+
+NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+NS_PR = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+
+def _make_xlsx(path, sheets, shared_strings=None):
+    """
+    以最小結構建立 .xlsx：sheets 為 [(name, sheet_xml_body), ...]
+    故意讓 rId 與 sheetN.xml 的編號錯開，驗證以 rels 對應工作表。
+    """
+    with zipfile.ZipFile(path, 'w') as z:
+        wb = [f'<workbook xmlns="{NS}" xmlns:r="{NS_R}"><sheets>']
+        rels = [f'<Relationships xmlns="{NS_PR}">']
+        n = len(sheets)
+        for i, (name, body) in enumerate(sheets, start=1):
+            file_no = n - i + 1
+            wb.append(f'<sheet name="{name}" sheetId="{i}" r:id="rId{i}"/>')
+            rels.append(f'<Relationship Id="rId{i}" Type="{NS_R}/worksheet" Target="worksheets/sheet{file_no}.xml"/>')
+            z.writestr(f'xl/worksheets/sheet{file_no}.xml', f'<worksheet xmlns="{NS}"><sheetData>{body}</sheetData></worksheet>')
+        wb.append('</sheets></workbook>')
+        rels.append('</Relationships>')
+        z.writestr('xl/workbook.xml', ''.join(wb))
+        z.writestr('xl/_rels/workbook.xml.rels', ''.join(rels))
+        if shared_strings is not None:
+            items = ''.join(f'<si><t>{s}</t></si>' for s in shared_strings)
+            z.writestr('xl/sharedStrings.xml', f'<sst xmlns="{NS}">{items}</sst>')
+
+
+def test_stream_reader_formula_and_values(tmp_path):
+    """
+    測試公式、shared string、布林、inline string 與數值是否一次讀出。
+    """
+    body = (
+        '<row r="1">'
+        '<c r="A1" t="s"><v>0</v></c>'
+        '<c r="B1"><v>1.5</v></c>'
+        '<c r="C1"><f>SUM(B1:B2)</f><v>3</v></c>'
+        '</row>'
+        '<row r="3">'
+        '<c r="A3" t="b"><v>1</v></c>'
+        '<c r="B3" t="inlineStr"><is><t>hello</t></is></c>'
+        '<c r="C3" s="1"/>'
+        '</row>'
+    )
+    path = tmp_path / 'book.xlsx'
+    _make_xlsx(str(path), [('Data', body)], shared_strings=['名稱'])
+    cells = read_cells_from_xlsx_via_stream(str(path))
+
+    ws = cells['Data']
+    assert ws['A1'] == {'formula': None, 'value': '名稱', 'cached_value': '名稱'}
+    assert ws['B1']['value'] == '1.5'
+    assert ws['C1']['formula'] == '=SUM(B1:B2)'
+    assert ws['C1']['cached_value'] == '3'
+    assert ws['A3']['value'] is True
+    assert ws['B3']['value'] == 'hello'
+    # 只有樣式、沒有內容的儲存格不應出現
+    assert 'C3' not in ws
+
+
+def test_stream_reader_sheet_order_follows_rels(tmp_path):
+    """
+    測試工作表名稱與 XML 檔案的對應以 workbook.xml.rels 為準，且保留活頁簿順序。
+    """
+    path = tmp_path / 'order.xlsx'
+    _make_xlsx(str(path), [
+        ('First', '<row r="1"><c r="A1"><v>1</v></c></row>'),
+        ('Second', '<row r="1"><c r="A1"><v>2</v></c></row>'),
+    ])
+    with zipfile.ZipFile(str(path)) as z:
+        members = workbook_sheet_members(z)
+    assert members == [('First', 'xl/worksheets/sheet2.xml'), ('Second', 'xl/worksheets/sheet1.xml')]
+
+    cells = read_cells_from_xlsx_via_stream(str(path))
+    assert list(cells.keys()) == ['First', 'Second']
+    assert cells['First']['A1']['value'] == '1'
+    assert cells['Second']['A1']['value'] == '2'
+
+
+def test_stream_reader_formula_transform(tmp_path):
+    """
+    測試公式後處理回呼只作用於有公式的儲存格。
+    """
+    path = tmp_path / 'ext.xlsx'
+    _make_xlsx(str(path), [('S', '<row r="1"><c r="A1"><f>[1]Sheet1!A1</f><v>5</v></c><c r="B1"><v>7</v></c></row>')])
+    cells = read_cells_from_xlsx_via_stream(str(path), formula_transform=lambda f: f.replace('[1]', "'C:\\x\\[a.xlsx]"))
+    assert cells['S']['A1']['formula'] == "='C:\\x\\[a.xlsx]Sheet1!A1"
+    assert cells['S']['B1']['formula'] is None
+
+
+def test_stream_reader_parallel_matches_serial(tmp_path):
+    """
+    測試多行程逐表解析的結果與單行程完全一致，且依活頁簿順序合併。
+    """
+    path = tmp_path / 'multi.xlsx'
+    sheets = []
+    for i in range(4):
+        rows = ''.join(f'<row r="{r}"><c r="A{r}"><v>{r * i}</v></c><c r="B{r}"><f>A{r}*2</f><v>{r * i * 2}</v></c></row>' for r in range(1, 50 * (i + 1)))
+        sheets.append((f'S{i}', rows))
+    _make_xlsx(str(path), sheets)
+    serial = read_cells_from_xlsx_via_stream(str(path))
+    parallel = read_cells_from_xlsx_via_stream(str(path), workers=2)
+    assert parallel == serial
+    assert read_cells_from_xlsx_via_stream(str(path), compact=True) == serial
+    assert list(parallel.keys()) == ['S0', 'S1', 'S2', 'S3']
+
+
+def test_stream_reader_pool_failure_is_logged(tmp_path, monkeypatch, caplog):
+    """
+    測試行程池失敗時記錄警告並退回單行程解析，結果不變。
+    """
+    import utils.value_engines.stream_reader as stream_reader
+    path = tmp_path / 'multi.xlsx'
+    _make_xlsx(str(path), [(f'S{i}', f'<row r="1"><c r="A1"><v>{i}</v></c></row>') for i in range(3)])
+    serial = read_cells_from_xlsx_via_stream(str(path))
+
+    def broken_pool(*args, **kwargs):
+        raise OSError('no semaphores')
+
+    monkeypatch.setattr(stream_reader, '_parse_sheets_in_pool', broken_pool)
+    with caplog.at_level('WARNING'):
+        assert read_cells_from_xlsx_via_stream(str(path), workers=2) == serial
+    assert 'no semaphores' in caplog.text
+
+
+def test_zip_fingerprints_detect_changed_sheets(tmp_path):
+    """
+    測試 zip CRC fingerprint 只標記內容有變動的工作表；共用字串表變動則要求整本重新解析。
+    """
+    a = tmp_path / 'a.xlsx'
+    b = tmp_path / 'b.xlsx'
+    c = tmp_path / 'c.xlsx'
+    _make_xlsx(str(a), [('S1', '<row r="1"><c r="A1"><v>1</v></c></row>'), ('S2', '<row r="1"><c r="A1"><v>2</v></c></row>')], shared_strings=['x'])
+    _make_xlsx(str(b), [('S1', '<row r="1"><c r="A1"><v>1</v></c></row>'), ('S2', '<row r="1"><c r="A1"><v>9</v></c></row>')], shared_strings=['x'])
+    _make_xlsx(str(c), [('S1', '<row r="1"><c r="A1"><v>1</v></c></row>'), ('S2', '<row r="1"><c r="A1"><v>2</v></c></row>')], shared_strings=['y'])
+    fa, fb, fc = (read_zip_fingerprints(str(p)) for p in (a, b, c))
+
+    assert sheets_needing_parse(fa, read_zip_fingerprints(str(a))) == set()
+    assert sheets_needing_parse(fa, fb) == {'S2'}
+    assert sheets_needing_parse(fa, fc) is None
+    assert sheets_needing_parse(None, fa) is None
+
+    partial = read_cells_from_xlsx_via_stream(str(b), only_sheets={'S2'})
+    assert list(partial.keys()) == ['S2']
+    assert partial['S2']['A1']['value'] == '9'
+
+
+if __name__ == "__main__":
+    pytest.main()
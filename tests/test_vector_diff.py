@@ -0,0 +1,65 @@
+import pytest
+import os
+import sys
+
+# 將專案根目錄添加到 sys.path，以解決模組匯入問題
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+pytest.importorskip('polars')
+
+from core.vector_diff import diff_sheet_vectorized
+from utils.cell_store import SheetCells
+
+
+# 外部參照的判定與 has_external_reference 相同（含 "['" 或 "!'"）
+EXT = "=['x.xlsx']S!A1"
+
+
+def _cell(formula=None, value=None, cached=None):
+    return {'formula': formula, 'value': value, 'cached_value': cached}
+
+
+def test_diff_sheet_vectorized_classification():
+    """
+    測試向量化比對的分類、計數與過濾和逐格規則一致
+    """
+    old = {
+        'A1': _cell(value=1),
+        'A2': _cell('=B1', 2, 2),
+        'A3': _cell(EXT, 3, 3),
+        'A4': _cell('=C1', 4, 4),
+        'A5': _cell(value='same'),
+        'A6': _cell(value='gone'),
+    }
+    new = {
+        'A1': _cell(value=1.0),                     # 1 == 1.0 -> 無變更
+        'A2': _cell('=B2', 2, 2),                   # 內部公式變更
+        'A3': _cell(EXT, 3, 30),      # 外部 refresh
+        'A4': _cell('=C1', 4, 40),                  # 間接變更
+        'A5': _cell(value='other'),                 # 直接值變更
+        'B9': _cell(value='new'),                   # 新增
+    }
+    flags = {'suppress_internal_same_value': False, 'show_external_refresh': True, 'formula_only_mode': False}
+
+    rows, counts = diff_sheet_vectorized(SheetCells.from_dict(old), new, flags, ['NO_CHANGE'])
+
+    assert dict(rows) == {
+        'A2': 'FORMULA_CHANGE_INTERNAL',
+        'A3': 'EXTERNAL_REFRESH_UPDATE',
+        'A4': 'INDIRECT_CHANGE',
+        'A5': 'DIRECT_VALUE_CHANGE',
+        'A6': 'CELL_DELETED',
+        'B9': 'CELL_ADDED',
+    }
+    assert [addr for addr, _ in rows] == ['A2', 'A3', 'A4', 'A5', 'A6', 'B9']
+    assert sum(counts.values()) == 6
+
+    flags['formula_only_mode'] = True
+    rows, counts = diff_sheet_vectorized(old, new, flags, ['NO_CHANGE', 'CELL_ADDED'])
+    assert 'A5' not in dict(rows) and 'B9' not in dict(rows)
+    assert counts['DIRECT_VALUE_CHANGE'] == 1
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -82,6 +82,20 @@ PARAMS_SPEC = [
         'help': '開啟後，啟動時會掃描 WATCH_FOLDERS 內所有支援檔案並建立初始基準線。關閉可縮短大型磁碟啟動時間。',
         'type': 'bool',
     },
+    {
+        'key': 'DISCOVERY_WORKERS',
+        'priority': 3,
+        'label': '啟動掃描並行數',
+        'help': '啟動掃描以多個執行緒同時列出資料夾內容（os.scandir），找到的檔案立即交給基準線流程。網路磁碟可調高；1 表示逐一走訪。',
+        'type': 'int',
+    },
+    {
+        'key': 'DISCOVERY_DIR_CACHE',
+        'priority': 3,
+        'label': '啟動掃描沿用資料夾快取',
+        'help': '記錄每個資料夾的修改時間與其中的 Excel 檔名（LOG_FOLDER/discovery_cache.json）；資料夾修改時間未變時不重新列出內容。檔案新增、刪除、改名都會更新資料夾的修改時間。',
+        'type': 'bool',
+    },
 
     # 快取與暫存
     {
@@ -98,6 +112,20 @@ PARAMS_SPEC = [
         'type': 'path',
         'path_kind': 'dir',
     },
+    {
+        'key': 'CACHE_MAX_SIZE_MB',
+        'priority': 3,
+        'label': '本地快取容量上限 (MB)',
+        'help': '快取副本總大小超過上限時，優先淘汰「又大又久未使用」的副本（使用中的不會刪除）。索引記錄於 CACHE_FOLDER/_cache_index.sqlite。0 表示不限制。',
+        'type': 'int',
+    },
+    {
+        'key': 'CACHE_DEDUP',
+        'priority': 3,
+        'label': '快取去重（相同內容共用一份）',
+        'help': '複製後若已有同大小的副本才計算內容雜湊；與既有副本完全相同（例如同一份活頁簿放在不同路徑）時以硬連結共用，只佔一份空間。不支援硬連結的磁碟會自動保留獨立副本。',
+        'type': 'bool',
+    },
 
     # 超時/記憶體/恢復
     {
@@ -112,6 +140,12 @@ PARAMS_SPEC = [
         'help': '超過此秒數仍未完成讀取/比較會視為超時。',
         'type': 'int',
     },
+    {
+        'key': 'ISOLATE_PARSE_PROCESS',
+        'label': '在獨立子行程解析 Excel',
+        'help': '解析在可被強制終止的常駐子行程執行（子行程重複使用，只有逾時或停止時才終止並重新啟動）；超過 FILE_TIMEOUT_SECONDS 或按下停止時會真正中止解析，避免單一異常檔案拖住基準線建立或監控執行緒。停用則在主行程解析（逾時無法中止）。',
+        'type': 'bool',
+    },
     {
         'key': 'ENABLE_MEMORY_MONITOR',
         'label': '啟用記憶體監控',
@@ -130,6 +164,36 @@ PARAMS_SPEC = [
         'help': '建立大量基準線時，將進度寫入 RESUME_LOG_FILE，重新啟動可續傳。',
         'type': 'bool',
     },
+    {
+        'key': 'STARTUP_SKIP_BY_STAT',
+        'label': '啟動時以 mtime/size 快速略過',
+        'help': '建立基準線前，以基準線清單（LOG_FOLDER/baseline_manifest.sqlite，一次查詢）比對來源檔的修改時間與大小；一致者直接略過，不複製、不解析，也不開啟基準線檔案。容差沿用 MTIME_TOLERANCE_SEC。',
+        'type': 'bool',
+    },
+    {
+        'key': 'BASELINE_BUILD_WORKERS',
+        'label': '並行建立基準線數量',
+        'help': '大於 1 時啟用並行建立：網路複製與解析重疊進行，檔案由大到小排程，進度逐檔記錄（續傳時只處理未完成的檔案）。1 為逐一處理。建議搭配「在獨立子行程解析 Excel」以真正利用多核心。',
+        'type': 'int',
+    },
+    {
+        'key': 'BASELINE_COPY_WORKERS',
+        'label': '並行複製數量',
+        'help': '並行建立基準線時，同時複製到本地快取的檔案數（I/O 為主）。',
+        'type': 'int',
+    },
+    {
+        'key': 'BASELINE_MEMORY_BUDGET_MB',
+        'label': '並行建立記憶體預算 (MB)',
+        'help': '同時解析的檔案估計用量加總不超過此值，超出時等待其他檔案完成，而非暫停 10 秒。0 = 沿用記憶體上限。',
+        'type': 'int',
+    },
+    {
+        'key': 'BASELINE_MEMORY_PER_FILE_FACTOR',
+        'label': '每檔記憶體估計倍數',
+        'help': '估計解析一個檔案所需記憶體 = 檔案大小 × 此倍數（可輸入小數），用於記憶體預算排程。',
+        'type': 'text',
+    },
     {
         'key': 'RESUME_LOG_FILE',
         'priority': 4,
@@ -146,6 +210,27 @@ PARAMS_SPEC = [
         'help': '相同檔案在短時間內多次事件，會合併為一次。',
         'type': 'int',
     },
+    {
+        'key': 'EVENT_WORKERS',
+        'priority': 3,
+        'label': '事件處理執行緒數',
+        'help': '檔案事件排入佇列後由這些執行緒複製、解析與比較；同一檔案一次只由一個執行緒處理，處理中再收到的事件會合併。1 表示逐一處理（但仍不佔用監控執行緒）。',
+        'type': 'int',
+    },
+    {
+        'key': 'EVENT_QUEUE_MAX',
+        'priority': 3,
+        'label': '事件佇列上限',
+        'help': '等待處理的不同檔案數上限；達到上限時暫停接收新事件直到有空位，不會丟棄事件。',
+        'type': 'int',
+    },
+    {
+        'key': 'PIPELINE_STATS_INTERVAL_SEC',
+        'priority': 3,
+        'label': '事件管線統計輸出間隔 (秒)',
+        'help': '監控期間每隔此秒數輸出一次事件管線統計（佇列深度、各階段平均/最大耗時）；期間沒有新事件時不輸出。0 表示只在停止時輸出。',
+        'type': 'int',
+    },
 
     # 比較邏輯
     {
@@ -196,6 +281,19 @@ PARAMS_SPEC = [
         'help': '限制 console 表格一次展示的變更數，有助於大檔案閱讀。',
         'type': 'int',
     },
+    {
+        'key': 'DIFF_ENGINE',
+        'label': '差異比對引擎',
+        'help': 'python：逐格比對（預設）。polars：對大型工作表以 Polars 一次完成 outer join、相等比較與變更分類，只為有變更的儲存格建立輸出；需安裝 polars，未安裝或失敗時自動退回 python。',
+        'type': 'choice',
+        'choices': ['python','polars']
+    },
+    {
+        'key': 'VECTOR_DIFF_MIN_CELLS',
+        'label': '向量化比對門檻（儲存格數）',
+        'help': '新舊兩邊儲存格合計達此數量才使用 polars 比對；較小的工作表逐格比對反而較快。',
+        'type': 'int',
+    },
     # Console 比較表格顯示
     {
         'key': 'ADDRESS_COL_WIDTH',
@@ -220,9 +318,21 @@ PARAMS_SPEC = [
     {
         'key': 'FORMULA_ENGINE',
         'label': '公式讀取引擎（openpyxl/xml）',
-        'help': '目前預設 openpyxl 讀取公式；未來可提供 xml 讀公式以進一步提速。',
+        'help': 'openpyxl：以 openpyxl 讀取公式，值由「值讀取引擎」另外讀取（每張表會被解析兩次）。xml：以串流方式單次解析每張 worksheet XML，同時取得公式與 cached 值，不再使用值讀取引擎；大型檔案可明顯縮短時間與降低記憶體。',
         'type': 'choice',
-        'choices': ['openpyxl']
+        'choices': ['openpyxl','xml']
+    },
+    {
+        'key': 'SPARSE_CELL_ITERATION',
+        'label': '稀疏儲存格走訪（openpyxl 模式）',
+        'help': '開啟後只處理工作表 XML 中實際存在的儲存格，不再依 max_row × max_column 逐格掃描；可避免遠處零星格式化儲存格（例如 XFD1048576）令掃描暴增而超時。',
+        'type': 'bool',
+    },
+    {
+        'key': 'COMPACT_CELL_STORAGE',
+        'label': '緊湊儲存格結構（省記憶體）',
+        'help': '解析結果與載入的基準線以整數陣列 + 共用公式/值池保存，相同公式或值只存一份；對外仍提供與原本相同的 dict 介面，寫檔格式不變。大型活頁簿可大幅降低記憶體用量。',
+        'type': 'bool',
     },
     {
         'key': 'CSV_PERSIST',
@@ -236,6 +346,18 @@ PARAMS_SPEC = [
         'help': '允許同時處理多個 worksheet 的數目（建議 4 或 CPU 核心數）。併發可顯著縮短大型檔案讀取時間。',
         'type': 'int',
     },
+    {
+        'key': 'PARALLEL_SHEET_PARSING',
+        'label': '逐表平行解析（多行程）',
+        'help': '開啟後，多工作表的大型檔案會以行程池逐表平行解析（每個行程獨立開啟快取檔；openpyxl 與 xml 公式引擎皆適用），行程數上限為「最大並發 Sheet 讀取數」。',
+        'type': 'bool',
+    },
+    {
+        'key': 'PARALLEL_SHEET_MIN_FILE_MB',
+        'label': '平行解析的最小檔案大小（MB）',
+        'help': '小於此大小的檔案維持單行程解析，避免啟動行程池的額外成本。',
+        'type': 'int',
+    },
     {
         'key': 'HEADER_INFO_SECOND_LINE',
         'label': '將標頭時間/作者資訊移至下一行',
@@ -263,6 +385,19 @@ PARAMS_SPEC = [
         'type': 'choice',
         'choices': ['lz4','zstd','gzip']
     },
+    {
+        'key': 'BASELINE_STORAGE_FORMAT',
+        'label': '基準線儲存格式',
+        'help': 'json：整份基準線序列化為 JSON 後壓縮（相容舊版）。columnar：.wdc 檔，每張工作表一個獨立壓縮的欄式區塊，檔頭附索引；載入時不需整份 json.loads，可只解碼需要的工作表。區塊壓縮沿用「基準線壓縮格式」。兩種格式皆可讀取，下次保存時自動轉為所選格式。',
+        'type': 'choice',
+        'choices': ['json','columnar']
+    },
+    {
+        'key': 'LAZY_BASELINE_LOADING',
+        'label': '延遲載入基準線工作表（columnar）',
+        'help': '僅對 columnar 基準線有效：載入時只讀檔頭（工作表名稱、各表 digest 與 metadata），每張工作表在第一次被比較或讀取時才解壓與解碼；未變更的工作表重新保存時直接沿用原壓縮區塊。',
+        'type': 'bool',
+    },
     {
         'key': 'LZ4_COMPRESSION_LEVEL',
         'label': 'LZ4 壓縮等級 (0-16)',
@@ -398,7 +533,7 @@ PARAMS_SPEC = [
     {
         'key': 'COPY_RETRY_BACKOFF_SEC',
         'label': '重試退避（秒）',
-        'help': '兩次重試之間的等待秒數（可輸入小數）。會按嘗試次數逐步增加等待，例如 1.0 → 2.0 → 3.0 秒。',
+        'help': '兩次重試之間的等待秒數（可輸入小數）。每次失敗後加倍（上限 10 秒），例如 1.0 → 2.0 → 4.0 秒；等待期間不佔用複製名額。',
         'type': 'text',
     },
     {
@@ -407,6 +542,18 @@ PARAMS_SPEC = [
         'help': '以較小區塊逐段讀寫來源檔，可降低一次性長時間把持來源句柄的風險。0 表示關閉。',
         'type': 'int',
     },
+    {
+        'key': 'COPY_WORKERS',
+        'label': '複製排程執行緒數',
+        'help': '集中處理所有複製的執行緒數；同一檔案同時只複製一次，最近修改與小檔優先。0 表示不用排程器、在需要檔案的執行緒內直接複製。',
+        'type': 'int',
+    },
+    {
+        'key': 'COPY_MAX_PER_SHARE',
+        'label': '每個共享同時複製上限',
+        'help': '同一台伺服器/共享（例如 \\\\server\\share 或磁碟代號）同時進行的複製數上限，避免大量建立基準線或事件暴增時壓垮檔案伺服器。',
+        'type': 'int',
+    },
     {
         'key': 'COPY_POST_SLEEP_SEC',
         'label': '複製完成後短暫等待（秒）',
@@ -416,7 +563,7 @@ PARAMS_SPEC = [
     {
         'key': 'COPY_STABILITY_CHECKS',
         'label': '複製前穩定性檢查次數',
-        'help': '開始複製前，連續 N 次檢查來源檔的修改時間（mtime）一致才開始複製。',
+        'help': '開始複製前，連續 N 次檢查來源檔的修改時間（mtime）與大小一致才開始複製。輪詢已判定穩定的版本只需再確認一次即可複製。',
         'type': 'int',
     },
     {
@@ -444,6 +591,12 @@ PARAMS_SPEC = [
         'help': '快速跳過時允許的修改時間容差（秒，可輸入小數）。',
         'type': 'text',
     },
+    {
+        'key': 'SKIP_UNCHANGED_SHEETS_BY_CRC',
+        'label': '只重新解析有變動的工作表（zip CRC）',
+        'help': '基準線會記錄每張工作表在 zip 內的 CRC32 與大小；比較時只重新解析 CRC 有變動的工作表，其餘直接沿用基準線內容。若共用字串表或外部連結有變動，則整本重新解析。',
+        'type': 'bool',
+    },
     {
         'key': 'SKIP_WHEN_TEMP_LOCK_PRESENT',
         'label': '偵測暫存鎖檔 (~$) 時延後觸碰',
@@ -454,9 +607,9 @@ PARAMS_SPEC = [
     {
         'key': 'COPY_ENGINE',
         'label': '複製引擎（Windows）',
-        'help': '選擇複製檔案所使用的引擎：python（內建）、powershell（Copy-Item）、robocopy（穩定、對網路良好）。',
+        'help': '選擇複製檔案所使用的引擎：python（內建）、powershell（Copy-Item）、robocopy（穩定、對網路良好）、delta（差異複製：以上一份快取副本為底，只從網路讀取變動的工作表/成員，適合大型 .xlsx/.xlsm；整份重寫時自動改完整複製）、kernel（核心輔助複製：以 reflink / copy_file_range / sendfile 複製，資料不經過 Python 緩衝區，適合 Linux 掛載的 CIFS 共享；不支援時自動退回分塊複製）。',
         'type': 'choice',
-        'choices': ['python','powershell','robocopy']
+        'choices': ['python','powershell','robocopy','delta','kernel']
     },
     {
         'key': 'PREFER_SUBPROCESS_FOR_XLSM',
@@ -603,25 +756,25 @@ class SettingsDialog(tk.Toplevel):
         TABS = [
             ('監控範圍與啟動掃描', [
                 'WATCH_FOLDERS','WATCH_EXCLUDE_FOLDERS','MONITOR_ONLY_FOLDERS','MONITOR_ONLY_EXCLUDE_FOLDERS',
-                'SCAN_TARGET_FOLDERS','AUTO_SYNC_SCAN_TARGETS','SCAN_ALL_MODE','SUPPORTED_EXTS','MANUAL_BASELINE_TARGET'
+                'SCAN_TARGET_FOLDERS','AUTO_SYNC_SCAN_TARGETS','SCAN_ALL_MODE','DISCOVERY_WORKERS','DISCOVERY_DIR_CACHE','SUPPORTED_EXTS','MANUAL_BASELINE_TARGET'
             ]),
             ('輪巡與事件控制', [
-                'DEBOUNCE_INTERVAL_SEC','POLLING_SIZE_THRESHOLD_MB','DENSE_POLLING_INTERVAL_SEC','DENSE_POLLING_DURATION_SEC',
-                'SPARSE_POLLING_INTERVAL_SEC','SPARSE_POLLING_DURATION_SEC','QUICK_SKIP_BY_STAT','MTIME_TOLERANCE_SEC',
+                'DEBOUNCE_INTERVAL_SEC','EVENT_WORKERS','EVENT_QUEUE_MAX','PIPELINE_STATS_INTERVAL_SEC','POLLING_SIZE_THRESHOLD_MB','DENSE_POLLING_INTERVAL_SEC','DENSE_POLLING_DURATION_SEC',
+                'SPARSE_POLLING_INTERVAL_SEC','SPARSE_POLLING_DURATION_SEC','QUICK_SKIP_BY_STAT','SKIP_UNCHANGED_SHEETS_BY_CRC','MTIME_TOLERANCE_SEC',
                 'SKIP_WHEN_TEMP_LOCK_PRESENT','POLLING_STABLE_CHECKS','POLLING_COOLDOWN_SEC'
             ]),
             ('複製與快取', [
-                'USE_LOCAL_CACHE','STRICT_NO_ORIGINAL_READ','CACHE_FOLDER','IGNORE_CACHE_FOLDER','COPY_RETRY_COUNT','COPY_RETRY_BACKOFF_SEC',
-                'COPY_CHUNK_SIZE_MB','COPY_STABILITY_CHECKS','COPY_STABILITY_INTERVAL_SEC','COPY_STABILITY_MAX_WAIT_SEC','COPY_POST_SLEEP_SEC',
+                'USE_LOCAL_CACHE','STRICT_NO_ORIGINAL_READ','CACHE_FOLDER','CACHE_MAX_SIZE_MB','CACHE_DEDUP','IGNORE_CACHE_FOLDER','COPY_RETRY_COUNT','COPY_RETRY_BACKOFF_SEC',
+                'COPY_CHUNK_SIZE_MB','COPY_WORKERS','COPY_MAX_PER_SHARE','COPY_STABILITY_CHECKS','COPY_STABILITY_INTERVAL_SEC','COPY_STABILITY_MAX_WAIT_SEC','COPY_POST_SLEEP_SEC',
                 'COPY_ENGINE','PREFER_SUBPROCESS_FOR_XLSM','SUBPROCESS_ENGINE_FOR_XLSM'
             ]),
             ('比較與變更檢測', [
                 'FORMULA_ONLY_MODE','TRACK_DIRECT_VALUE_CHANGES','TRACK_FORMULA_CHANGES','ENABLE_FORMULA_VALUE_CHECK','MAX_FORMULA_VALUE_CELLS',
-                'TRACK_EXTERNAL_REFERENCES','IGNORE_INDIRECT_CHANGES','MAX_CHANGES_TO_DISPLAY','AUTO_UPDATE_BASELINE_AFTER_COMPARE',
+                'TRACK_EXTERNAL_REFERENCES','IGNORE_INDIRECT_CHANGES','MAX_CHANGES_TO_DISPLAY','DIFF_ENGINE','VECTOR_DIFF_MIN_CELLS','AUTO_UPDATE_BASELINE_AFTER_COMPARE',
                 'ADDRESS_COL_WIDTH','CONSOLE_TERM_WIDTH_OVERRIDE','HEADER_INFO_SECOND_LINE','DIFF_HIGHLIGHT_ENABLED'
             ]),
             ('基準線與壓縮/歸檔', [
-                'DEFAULT_COMPRESSION_FORMAT','LZ4_COMPRESSION_LEVEL','ZSTD_COMPRESSION_LEVEL','GZIP_COMPRESSION_LEVEL',
+                'DEFAULT_COMPRESSION_FORMAT','BASELINE_STORAGE_FORMAT','LAZY_BASELINE_LOADING','LZ4_COMPRESSION_LEVEL','ZSTD_COMPRESSION_LEVEL','GZIP_COMPRESSION_LEVEL',
                 'ENABLE_ARCHIVE_MODE','ARCHIVE_AFTER_DAYS','ARCHIVE_COMPRESSION_FORMAT','SHOW_COMPRESSION_STATS'
             ]),
             ('日誌與輸出', [
@@ -632,14 +785,15 @@ class SettingsDialog(tk.Toplevel):
                 'ENABLE_BLACK_CONSOLE','CONSOLE_POPUP_ON_COMPARISON','CONSOLE_ALWAYS_ON_TOP','CONSOLE_TEMP_TOPMOST_DURATION','CONSOLE_INITIAL_TOPMOST_DURATION'
             ]),
            ('值/公式讀取引擎', [
-               'VALUE_ENGINE','FORMULA_ENGINE','CSV_PERSIST','MAX_SHEET_WORKERS'
+               'VALUE_ENGINE','FORMULA_ENGINE','SPARSE_CELL_ITERATION','COMPACT_CELL_STORAGE','CSV_PERSIST','MAX_SHEET_WORKERS','PARALLEL_SHEET_PARSING','PARALLEL_SHEET_MIN_FILE_MB'
            ]),
             ('時間線 / Timeline', [
                'UI_TIMELINE_DEFAULT_DAYS','UI_TIMELINE_PAGE_SIZE','UI_TIMELINE_MAX_PAGE_SIZE','UI_TIMELINE_WARN_DAYS',
                'UI_TIMELINE_GROUP_BY_BASEKEY','PATH_MAPPINGS','ENABLE_TIMELINE_SERVER','TIMELINE_SERVER_HOST','TIMELINE_SERVER_PORT','OPEN_TIMELINE_ON_START'
             ]),
             ('可靠性與資源', [
-                'ENABLE_TIMEOUT','FILE_TIMEOUT_SECONDS','ENABLE_MEMORY_MONITOR','MEMORY_LIMIT_MB','ENABLE_RESUME','RESUME_LOG_FILE',
+                'ENABLE_TIMEOUT','FILE_TIMEOUT_SECONDS','ISOLATE_PARSE_PROCESS','ENABLE_MEMORY_MONITOR','MEMORY_LIMIT_MB','ENABLE_RESUME','RESUME_LOG_FILE',
+                'STARTUP_SKIP_BY_STAT','BASELINE_BUILD_WORKERS','BASELINE_COPY_WORKERS','BASELINE_MEMORY_BUDGET_MB','BASELINE_MEMORY_PER_FILE_FACTOR',
                 'MAX_RETRY','RETRY_INTERVAL_SEC','WHITELIST_USERS','LOG_WHITELIST_USER_CHANGE','FORCE_BASELINE_ON_FIRST_SEEN','SHOW_DEBUG_MESSAGES'
             ]),
         ]
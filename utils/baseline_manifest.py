@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite 基準線清單（baseline manifest）
+- 每個基準線一列（以 _baseline_key_for_path 為鍵）：來源檔 mtime/size、內容雜湊、zip fingerprint，
+  以及基準線檔案本身的路徑、格式、大小與修改時間；保存基準線時以單一交易更新。
+- 啟動掃描時一次查詢整份清單，就能判斷哪些檔案自上次建立後未變動，不需逐一開啟基準線檔案；
+  查找/歸檔基準線時直接取得實際路徑，不需對每種副檔名做 os.path.exists（LOG_FOLDER 在網路磁碟時每次都是一次往返）。
+"""
+from __future__ import annotations
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional, Dict, Any
+import config.settings as settings
+
+DEFAULT_DB_NAME = 'baseline_manifest.sqlite'
+
+_EXTRA_COLUMNS = (
+    ('storage_path', 'TEXT'),
+    ('storage_format', 'TEXT'),
+    ('stored_size', 'INTEGER'),
+    ('stored_mtime', 'REAL'),
+    ('zip_fingerprints', 'TEXT'),
+)
+
+_ensured = set()
+_ensure_lock = threading.Lock()
+_KEEP = object()  # upsert_entry：未傳入 zip_fingerprints 時保留原值
+
+
+def get_manifest_path(preferred: Optional[str] = None) -> str:
+    if preferred and preferred.strip():
+        return preferred
+    # 預設與基準線放在一起（LOG_FOLDER）
+    try:
+        return os.path.join(settings.LOG_FOLDER, DEFAULT_DB_NAME)
+    except Exception:
+        return os.path.abspath(DEFAULT_DB_NAME)
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # 並行建立基準線時多個執行緒同時寫入，等待鎖而不是立即失敗
+    return sqlite3.connect(path, timeout=30)
+
+
+def ensure_manifest(db_path: Optional[str] = None) -> str:
+    path = get_manifest_path(db_path)
+    if path in _ensured:
+        return path
+    with _ensure_lock:
+        if path in _ensured:
+            return path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = _connect(path)
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS baselines (
+                  base_key TEXT PRIMARY KEY,
+                  source_mtime REAL,
+                  source_size INTEGER,
+                  content_hash TEXT,
+                  updated_at TEXT
+                )
+                """
+            )
+            # 舊版清單補上新增欄位
+            existing = {row[1] for row in cur.execute("PRAGMA table_info(baselines)")}
+            for col, decl in _EXTRA_COLUMNS:
+                if col not in existing:
+                    cur.execute(f"ALTER TABLE baselines ADD COLUMN {col} {decl}")
+            conn.commit()
+        finally:
+            conn.close()
+        _ensured.add(path)
+    return path
+
+
+def upsert_entry(base_key: str, source_mtime: Optional[float], source_size: Optional[int],
+                 content_hash: Optional[str] = None, *, storage_path: Optional[str] = None,
+                 storage_format: Optional[str] = None, stored_size: Optional[int] = None,
+                 stored_mtime: Optional[float] = None, zip_fingerprints: Any = _KEEP,
+                 db_path: Optional[str] = None) -> None:
+    """
+    寫入/更新一筆基準線記錄（單一交易）。來源 mtime/size 與內容雜湊一律覆寫；
+    基準線檔案資訊為 None 時保留原值。
+    zip fingerprint 必須描述目前保存的儲存格：有傳入時一律覆寫（None 寫入 NULL），未傳入（內容未變只更新 stat）才保留原值。
+    """
+    path = ensure_manifest(db_path)
+    replace_fp = zip_fingerprints is not _KEEP
+    fp_text = json.dumps(zip_fingerprints, ensure_ascii=False, separators=(',', ':')) if replace_fp and zip_fingerprints else None
+    conn = _connect(path)
+    try:
+        conn.execute(
+            """
+            INSERT INTO baselines (base_key, source_mtime, source_size, content_hash, updated_at,
+                                   storage_path, storage_format, stored_size, stored_mtime, zip_fingerprints)
+            VALUES (?,?,?,?,?,?,?,?,?,?)
+            ON CONFLICT(base_key) DO UPDATE SET
+              source_mtime=excluded.source_mtime,
+              source_size=excluded.source_size,
+              content_hash=excluded.content_hash,
+              updated_at=excluded.updated_at,
+              storage_path=COALESCE(excluded.storage_path, baselines.storage_path),
+              storage_format=COALESCE(excluded.storage_format, baselines.storage_format),
+              stored_size=COALESCE(excluded.stored_size, baselines.stored_size),
+              stored_mtime=COALESCE(excluded.stored_mtime, baselines.stored_mtime),
+              zip_fingerprints=CASE WHEN ? THEN excluded.zip_fingerprints ELSE baselines.zip_fingerprints END
+            """,
+            (base_key, source_mtime, source_size, content_hash, datetime.now().isoformat(),
+             storage_path, storage_format, stored_size, stored_mtime, fp_text, int(replace_fp)),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def record_storage(base_key: str, storage_path: Optional[str], storage_format: Optional[str] = None,
+                   stored_size: Optional[int] = None, stored_mtime: Optional[float] = None,
+                   db_path: Optional[str] = None) -> None:
+    """只更新基準線檔案資訊（探測到的舊基準線、格式遷移/歸檔後）；storage_path 為 None 表示檔案已不存在。"""
+    path = ensure_manifest(db_path)
+    conn = _connect(path)
+    try:
+        conn.execute(
+            """
+            INSERT INTO baselines (base_key, updated_at, storage_path, storage_format, stored_size, stored_mtime)
+            VALUES (?,?,?,?,?,?)
+            ON CONFLICT(base_key) DO UPDATE SET
+              storage_path=excluded.storage_path,
+              storage_format=excluded.storage_format,
+              stored_size=excluded.stored_size,
+              stored_mtime=excluded.stored_mtime
+            """,
+            (base_key, datetime.now().isoformat(), storage_path, storage_format, stored_size, stored_mtime),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def remove_entry(base_key: str, db_path: Optional[str] = None) -> None:
+    path = ensure_manifest(db_path)
+    conn = _connect(path)
+    try:
+        conn.execute("DELETE FROM baselines WHERE base_key=?", (base_key,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _row_to_dict(row) -> Dict[str, Any]:
+    entry = dict(row)
+    fp = entry.get('zip_fingerprints')
+    if fp:
+        try:
+            entry['zip_fingerprints'] = json.loads(fp)
+        except ValueError:
+            entry['zip_fingerprints'] = None
+    return entry
+
+
+def get_entry(base_key: str, db_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    path = ensure_manifest(db_path)
+    conn = _connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        row = conn.execute("SELECT * FROM baselines WHERE base_key=?", (base_key,)).fetchone()
+        return _row_to_dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def load_manifest(db_path: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """一次讀取整份清單：{ base_key: 記錄 }"""
+    path = ensure_manifest(db_path)
+    conn = _connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return {row['base_key']: _row_to_dict(row) for row in conn.execute("SELECT * FROM baselines")}
+    finally:
+        conn.close()
+
+
+def stat_matches(entry: Optional[Dict[str, Any]], source_mtime: float, source_size: int,
+                 tolerance: Optional[float] = None) -> bool:
+    """來源檔目前的 mtime/size 是否與清單記錄一致（mtime 容差同 QUICK_SKIP_BY_STAT）。"""
+    if not entry or entry.get('source_mtime') is None or entry.get('source_size') is None:
+        return False
+    if tolerance is None:
+        tolerance = float(getattr(settings, 'MTIME_TOLERANCE_SEC', 2.0))
+    return int(entry['source_size']) == int(source_size) and abs(float(entry['source_mtime']) - float(source_mtime)) <= tolerance
@@ -6,8 +6,17 @@ import logging
 import re
 import io
 import csv
+import zipfile
+import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 import config.settings as settings
+from utils import cache_index
+from utils.delta_copy import delta_copy
+from utils.kernel_copy import kernel_copy
+from utils.copy_scheduler import CopyScheduler, CopyDeferred, run_inline
+from utils.stability import stability_tracker
 
 _MAX_WIN_FILENAME = 240  # conservative cap to avoid MAX_PATH issues
 _HASH_LEN = 16
@@ -81,7 +90,8 @@ def _ops_log_copy_failure(network_path: str, error: Exception, attempts: int, st
     except Exception:
         pass
 
-def _ops_log_copy_success(network_path: str, duration: float, attempts: int, engine: str, chunk_mb: int):
+def _ops_log_copy_success(network_path: str, duration: float, attempts: int, engine: str, chunk_mb: int,
+                          nbytes: int = None, transfer_sec: float = None):
     try:
         base_dir = os.path.join(settings.LOG_FOLDER, 'ops_log')
         os.makedirs(base_dir, exist_ok=True)
@@ -91,8 +101,11 @@ def _ops_log_copy_success(network_path: str, duration: float, attempts: int, eng
         with open(fpath, 'a', encoding='utf-8', newline='') as f:
             w = csv.writer(f)
             if new_file:
-                w.writerow(['Timestamp','Path','SizeMB','DurationSec','Attempts','Engine','ChunkMB','StabilityChecks','StabilityInterval','StabilityMaxWait','STRICT_NO_ORIGINAL_READ'])
+                w.writerow(['Timestamp','Path','SizeMB','DurationSec','Attempts','Engine','ChunkMB','StabilityChecks','StabilityInterval','StabilityMaxWait','STRICT_NO_ORIGINAL_READ','BytesCopied','MBPerSec'])
             size_mb = os.path.getsize(network_path)/(1024*1024) if os.path.exists(network_path) else ''
+            # 傳輸速率以實際從來源讀取的位元組與傳輸耗時（不含複製後等待）計算
+            secs = transfer_sec if transfer_sec is not None else duration
+            mbps = f"{nbytes/(1024*1024)/secs:.2f}" if nbytes is not None and secs > 0 else ''
             w.writerow([
                 datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                 network_path,
@@ -105,45 +118,35 @@ def _ops_log_copy_success(network_path: str, duration: float, attempts: int, eng
                 float(getattr(settings, 'COPY_STABILITY_INTERVAL_SEC', 0.0)),
                 float(getattr(settings, 'COPY_STABILITY_MAX_WAIT_SEC', 0.0)),
                 bool(getattr(settings, 'STRICT_NO_ORIGINAL_READ', False)),
+                nbytes if nbytes is not None else '',
+                mbps,
             ])
     except Exception:
         pass
 
 
-def _wait_for_stable_mtime(path: str, checks: int, interval: float, max_wait: float) -> bool:
-    try:
-        if checks <= 1:
-            return True
-        last = None
-        same = 0
-        start = time.time()
-        while True:
-            # 允許在停止時立即退出等待
-            try:
-                if getattr(settings, 'force_stop', False):
-                    return False
-            except Exception:
-                pass
-            try:
-                cur = os.path.getmtime(path)
-            except Exception:
-                return False
-            if last is None:
-                last = cur
-                same = 1
-            else:
-                if cur == last:
-                    same += 1
-                else:
-                    same = 1
-                    last = cur
-            if same >= checks:
-                return True
-            if max_wait is not None and (time.time() - start) >= max_wait:
-                return False
-            time.sleep(max(0.0, interval))
-    except Exception:
-        return False
+def _check_stable(path: str, attempt: int, retry: int, wait_state: dict, silent: bool) -> None:
+    """
+    複製前穩定性預檢（不睡眠）：stat 一次並記入穩定度追蹤（與輪詢共用，輪詢已判定穩定的版本立即通過）。
+    尚未穩定時拋出帶 delay 的 CopyDeferred，由排程器在 COPY_STABILITY_INTERVAL_SEC 後重新檢查，等待期間不佔用傳輸名額；
+    同一次嘗試等待超過 COPY_STABILITY_MAX_WAIT_SEC 仍未穩定時拋出一般的 CopyDeferred（計入重試次數）。
+    """
+    checks = max(1, int(getattr(settings, 'COPY_STABILITY_CHECKS', 2)))
+    if checks <= 1:
+        return
+    interval = max(0.0, float(getattr(settings, 'COPY_STABILITY_INTERVAL_SEC', 1.0)))
+    max_wait = float(getattr(settings, 'COPY_STABILITY_MAX_WAIT_SEC', 3.0))
+    st = os.stat(path)
+    sig = (st.st_mtime, st.st_size)
+    stability_tracker.observe(path, sig)
+    if stability_tracker.is_stable(path, sig, checks, interval):
+        return
+    started = wait_state.setdefault(attempt, time.time())
+    if time.time() - started < max_wait:
+        raise CopyDeferred('源檔案尚未穩定', delay=interval)
+    if not silent:
+        print(f"      ⏳ 源檔案仍在變動，延後複製（第 {attempt}/{retry} 次）")
+    raise CopyDeferred('源檔案仍在變動')
 
 
 def _run_subprocess_copy(src: str, dst: str, engine: str = 'robocopy'):
@@ -262,6 +265,184 @@ def _run_subprocess_copy(src: str, dst: str, engine: str = 'robocopy'):
         raise ValueError(f"Unknown subprocess copy engine: {engine}")
 
 
+def _cache_is_fresh(cache_file, network_path):
+    """
+    副本是否仍對應來源目前的版本：以快取索引記錄的來源 mtime/size 判斷
+    （去重後的副本是硬連結，檔案本身的 mtime 屬於另一個來源）；沒有記錄時比較檔案 mtime。
+    """
+    src = os.stat(network_path)
+    entry = None
+    try:
+        entry = cache_index.get_entry(cache_file)
+    except sqlite3.Error as e:
+        logging.warning(f"讀取快取索引失敗: {e}")
+    if entry and entry.get('source_mtime') is not None:
+        fresh = entry.get('source_size') == src.st_size and float(entry['source_mtime']) == src.st_mtime
+    else:
+        fresh = os.path.getmtime(cache_file) >= src.st_mtime
+    if fresh and entry:
+        try:
+            cache_index.touch(cache_file)
+        except sqlite3.Error:
+            pass
+    return fresh
+
+
+def _unlink_stale(cache_file):
+    """過期副本先刪除再複製：副本可能是與其他副本共用的硬連結，原地覆寫會改到另一份。"""
+    try:
+        os.remove(cache_file)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        try:
+            if os.stat(cache_file).st_nlink > 1:
+                raise OSError(f"無法刪除共用的快取副本: {e}")
+        except FileNotFoundError:
+            pass
+
+
+def _after_copy(network_path, cache_file):
+    """
+    複製完成後：登錄快取索引、與內容相同的既有副本去重（硬連結），並在超過 CACHE_MAX_SIZE_MB 時淘汰副本。
+    索引失敗不影響複製結果。
+    """
+    try:
+        cache_index.sync_with_folder()
+        try:
+            src = os.stat(network_path)
+            src_mtime, src_size = src.st_mtime, src.st_size
+        except OSError:
+            src_mtime = src_size = None
+        content_hash = None
+        if getattr(settings, 'CACHE_DEDUP', True):
+            # 只有索引中已有同大小的副本時才計算雜湊
+            other, content_hash = cache_index.find_duplicate(cache_file, os.path.getsize(cache_file))
+            if other:
+                tmp = cache_file + '.tmp'
+                try:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                    os.link(other, tmp)
+                    os.replace(tmp, cache_file)
+                except OSError as e:
+                    # 不支援硬連結（例如 FAT）時保留獨立副本
+                    logging.debug(f"快取去重失敗，保留獨立副本: {e}")
+                    try:
+                        os.remove(tmp)
+                    except OSError:
+                        pass
+        cache_index.record_copy(cache_file, network_path, src_mtime, src_size, content_hash, os.path.getsize(cache_file))
+        budget_mb = float(getattr(settings, 'CACHE_MAX_SIZE_MB', 0) or 0)
+        if budget_mb > 0:
+            protect = {cache_file} | _leased_paths()
+            removed = cache_index.evict_to_budget(int(budget_mb * 1024 * 1024), protect=protect)
+            if removed:
+                logging.info(f"快取超過 {budget_mb:.0f} MB，已淘汰 {len(removed)} 個副本")
+    except (sqlite3.Error, OSError) as e:
+        logging.warning(f"更新快取索引失敗: {e}")
+
+
+def _copy_attempt(network_path, cache_file, attempt, retry, chunk_mb, silent, wait_state=None):
+    """
+    單次複製嘗試（由複製排程器或 run_inline 呼叫）：返回 (cache_file, 從來源讀取的位元組)。
+    來源仍在變動時拋出 CopyDeferred、複製失敗拋出 OSError，交由呼叫端退避後重試。
+    wait_state：同一個複製工作跨多次呼叫共用的 dict，記錄每次嘗試開始等待穩定的時間。
+    """
+    # 複製前穩定性預檢
+    _check_stable(network_path, attempt, retry, wait_state if wait_state is not None else {}, silent)
+
+    copy_start = time.time()
+    try:
+        # 子程序複製策略：.xlsm 或設定指定時優先（明確選擇差異複製或核心複製時除外）
+        use_sub = False
+        sub_engine = getattr(settings, 'COPY_ENGINE', 'python')
+        prefer_xlsm = bool(getattr(settings, 'PREFER_SUBPROCESS_FOR_XLSM', False))
+        if sub_engine in ('robocopy', 'powershell'):
+            use_sub = True
+        elif sub_engine not in ('delta', 'kernel') and prefer_xlsm and str(network_path).lower().endswith('.xlsm'):
+            sub_engine = getattr(settings, 'SUBPROCESS_ENGINE_FOR_XLSM', 'robocopy')
+            use_sub = True
+
+        used_engine = 'python'
+        fetched = None
+        if sub_engine == 'delta':
+            # 以舊副本為底組出新檔後以 os.replace 換上，不需先刪除舊副本
+            stats = delta_copy(network_path, cache_file, chunk_mb=chunk_mb or 4)
+            used_engine = 'delta' if stats['mode'] == 'delta' else 'delta-full'
+            fetched = stats['fetched']
+            if not silent and stats['mode'] == 'delta':
+                print(f"      差異複製：沿用 {stats['reused']/(1024*1024):.1f} MB，從來源讀取 {stats['fetched']/(1024*1024):.1f} MB")
+        elif sub_engine == 'kernel':
+            _unlink_stale(cache_file)
+            fetched, method = kernel_copy(network_path, cache_file, chunk_mb=chunk_mb or 4)
+            used_engine = f'kernel:{method}'
+        elif use_sub:
+            _unlink_stale(cache_file)
+            _run_subprocess_copy(network_path, cache_file, engine=sub_engine)
+            used_engine = sub_engine
+        else:
+            _unlink_stale(cache_file)
+            if chunk_mb > 0:
+                _chunked_copy(network_path, cache_file, chunk_mb=chunk_mb)
+            else:
+                shutil.copy2(network_path, cache_file)
+        transfer_sec = time.time() - copy_start
+        if fetched is None:
+            fetched = os.path.getsize(cache_file)
+        # 短暫等待，給檔案系統穩定
+        time.sleep(getattr(settings, 'COPY_POST_SLEEP_SEC', 0.2))
+        duration = time.time() - copy_start
+        if not silent:
+            rate = f"，{fetched/(1024*1024)/transfer_sec:.1f} MB/s" if transfer_sec > 0 else ""
+            print(f"      複製完成，耗時 {duration:.1f} 秒{rate}（第 {attempt}/{retry} 次嘗試）")
+        try:
+            _ops_log_copy_success(network_path, duration, attempt, engine=used_engine, chunk_mb=chunk_mb,
+                                  nbytes=fetched, transfer_sec=transfer_sec)
+        except Exception:
+            pass
+        _after_copy(network_path, cache_file)
+        return cache_file, fetched
+    except (PermissionError, OSError) as e:
+        if not silent:
+            print(f"      ↻ 第 {attempt}/{retry} 次複製失敗：{e}")
+        raise
+
+
+def _copy_failed(network_path, last_err, attempts, silent):
+    """重試用盡：嚴格模式返回 None（不讀原檔），否則回退為直接使用原檔"""
+    if getattr(settings, 'STRICT_NO_ORIGINAL_READ', False):
+        logging.error(f"嚴格模式：無法複製到緩存，跳過原檔讀取：{last_err}")
+        try:
+            _ops_log_copy_failure(network_path, last_err, attempts, True)
+        except Exception:
+            pass
+        if not silent:
+            print("   ❌ 複製到快取失敗（嚴格模式：不讀原檔），略過。")
+        return None
+    logging.error(f"緩存失敗 - 將回退為直接使用原檔（非嚴格模式）：{last_err}")
+    try:
+        _ops_log_copy_failure(network_path, last_err, attempts, False)
+    except Exception:
+        pass
+    if not silent:
+        print("   ⚠️ 緩存失敗：回退為直接讀原檔（非嚴格模式）")
+    return network_path
+
+
+_copy_scheduler = None
+_copy_scheduler_lock = threading.Lock()
+
+
+def get_copy_scheduler():
+    """全域複製排程器（第一次使用時依 COPY_WORKERS / COPY_MAX_PER_SHARE 建立）"""
+    global _copy_scheduler
+    with _copy_scheduler_lock:
+        if _copy_scheduler is None:
+            _copy_scheduler = CopyScheduler()
+        return _copy_scheduler
+
+
 def copy_to_cache(network_path, silent=False):
     # 嚴格模式下，如果不使用本地快取，直接返回 None（不讀原檔）
     if not settings.USE_LOCAL_CACHE:
@@ -285,10 +466,10 @@ def copy_to_cache(network_path, silent=False):
 
         cache_file = os.path.join(settings.CACHE_FOLDER, _safe_cache_basename(network_path))
 
-        # 若快取已新於來源，直接用快取檔
+        # 若快取仍對應來源目前的版本，直接用快取檔
         if os.path.exists(cache_file):
             try:
-                if os.path.getmtime(cache_file) >= os.path.getmtime(network_path):
+                if _cache_is_fresh(cache_file, network_path):
                     return cache_file
             except OSError as e:
                 logging.warning(f"獲取緩存檔案時間失敗: {e}")
@@ -306,86 +487,21 @@ def copy_to_cache(network_path, silent=False):
         backoff = max(0.0, float(getattr(settings, 'COPY_RETRY_BACKOFF_SEC', 0.5)))
         chunk_mb = max(0, int(getattr(settings, 'COPY_CHUNK_SIZE_MB', 0)))
 
-        last_err = None
-        for attempt in range(1, retry + 1):
-            # 若正在停止，立即中止循環
-            try:
-                if getattr(settings, 'force_stop', False):
-                    last_err = OSError('Operation cancelled: stopping')
-                    break
-            except Exception:
-                pass
-            # 複製前穩定性預檢
-            st_checks = max(1, int(getattr(settings, 'COPY_STABILITY_CHECKS', 2)))
-            st_interval = max(0.0, float(getattr(settings, 'COPY_STABILITY_INTERVAL_SEC', 1.0)))
-            st_maxwait = float(getattr(settings, 'COPY_STABILITY_MAX_WAIT_SEC', 3.0))
-            if st_checks > 1:
-                stable_ok = _wait_for_stable_mtime(network_path, st_checks, st_interval, st_maxwait)
-                if not stable_ok:
-                    if not silent:
-                        print(f"      ⏳ 源檔案仍在變動，延後複製（第 {attempt}/{retry} 次）")
-                    time.sleep(backoff * attempt)
-                    continue
-
-            copy_start = time.time()
-            try:
-                # 子程序複製策略：.xlsm 或設定指定時優先
-                use_sub = False
-                sub_engine = getattr(settings, 'COPY_ENGINE', 'python')
-                prefer_xlsm = bool(getattr(settings, 'PREFER_SUBPROCESS_FOR_XLSM', False))
-                if sub_engine in ('robocopy', 'powershell'):
-                    use_sub = True
-                elif prefer_xlsm and str(network_path).lower().endswith('.xlsm'):
-                    sub_engine = getattr(settings, 'SUBPROCESS_ENGINE_FOR_XLSM', 'robocopy')
-                    use_sub = True
-
-                used_engine = 'python'
-                if use_sub:
-                    _run_subprocess_copy(network_path, cache_file, engine=sub_engine)
-                    used_engine = sub_engine
-                else:
-                    if chunk_mb > 0:
-                        _chunked_copy(network_path, cache_file, chunk_mb=chunk_mb)
-                    else:
-                        shutil.copy2(network_path, cache_file)
-                # 短暫等待，給檔案系統穩定
-                time.sleep(getattr(settings, 'COPY_POST_SLEEP_SEC', 0.2))
-                duration = time.time() - copy_start
-                if not silent:
-                    print(f"      複製完成，耗時 {duration:.1f} 秒（第 {attempt}/{retry} 次嘗試）")
-                try:
-                    _ops_log_copy_success(network_path, duration, attempt, engine=used_engine, chunk_mb=chunk_mb)
-                except Exception:
-                    pass
-                return cache_file
-            except (PermissionError, OSError) as e:
-                last_err = e
-                if not silent:
-                    print(f"      ↻ 第 {attempt}/{retry} 次複製失敗：{e}")
-                if attempt < retry:
-                    time.sleep(backoff * attempt)
-                else:
-                    break
+        wait_state = {}
 
-        # 若最終複製失敗
-        if getattr(settings, 'STRICT_NO_ORIGINAL_READ', False):
-            logging.error(f"嚴格模式：無法複製到緩存，跳過原檔讀取：{last_err}")
-            try:
-                _ops_log_copy_failure(network_path, last_err, attempt, True)
-            except Exception:
-                pass
-            if not silent:
-                print("   ❌ 複製到快取失敗（嚴格模式：不讀原檔），略過。")
-            return None
-        else:
-            logging.error(f"緩存失敗 - 將回退為直接使用原檔（非嚴格模式）：{last_err}")
-            try:
-                _ops_log_copy_failure(network_path, last_err, attempt, False)
-            except Exception:
-                pass
-            if not silent:
-                print("   ⚠️ 緩存失敗：回退為直接讀原檔（非嚴格模式）")
-            return network_path
+        def attempt_fn(attempt):
+            return _copy_attempt(network_path, cache_file, attempt, retry, chunk_mb, silent, wait_state)
+
+        def on_fail(last_err, attempts):
+            return _copy_failed(network_path, last_err, attempts, silent)
+
+        if int(getattr(settings, 'COPY_WORKERS', 4) or 0) <= 0:
+            return run_inline(attempt_fn, on_fail, retry, backoff)
+        try:
+            mtime = os.path.getmtime(network_path)
+        except OSError:
+            mtime = None
+        return get_copy_scheduler().submit(network_path, attempt_fn, on_fail, size=network_size, mtime=mtime).result()
 
     except FileNotFoundError as e:
         logging.error(f"緩存失敗 - 檔案未找到: {e}")
@@ -401,4 +517,99 @@ def copy_to_cache(network_path, silent=False):
         logging.error(f"緩存失敗 - 複製緩存檔案時發生 I/O 錯誤: {e}")
         if not silent:
             print(f"   ❌ 緩存失敗: {e}")
-        return None if getattr(settings, 'STRICT_NO_ORIGINAL_READ', False) else network_path
\ No newline at end of file
+        return None if getattr(settings, 'STRICT_NO_ORIGINAL_READ', False) else network_path
+
+
+# 快取租約持有中的副本（淘汰時略過）：{ 本地路徑: 持有數 }
+_leased = {}
+_leased_lock = threading.Lock()
+
+
+def _leased_paths():
+    with _leased_lock:
+        return set(_leased)
+
+
+class CacheLease:
+    """
+    一次事件（或一次基準線建立）取得一次的本地快取租約：
+    - local_path：第一次使用時才呼叫 copy_to_cache（快速略過的事件完全不複製）；之後作者查詢、zip fingerprint、
+      解析都沿用同一個副本，不再各自 stat 來源與重跑穩定性檢查。
+    - source_stat：複製前的來源 (mtime, size)，保存基準線時沿用，確保與副本內容一致。
+    - zip()：共用同一個已開啟的 ZipFile（只讀 central directory / 小型 member 的讀者使用）。
+    以 with 使用，結束時關閉 zip handle。
+    """
+
+    def __init__(self, source_path, silent=True):
+        self.source_path = source_path
+        self.silent = silent
+        self.source_stat = None
+        self._local_path = None
+        self._acquired = False
+        self._zip = None
+        self._lock = threading.Lock()
+
+    @property
+    def local_path(self):
+        with self._lock:
+            if not self._acquired:
+                self._acquired = True
+                try:
+                    st = os.stat(self.source_path)
+                    self.source_stat = (st.st_mtime, st.st_size)
+                except OSError:
+                    self.source_stat = None
+                local = copy_to_cache(self.source_path, silent=self.silent)
+                self._local_path = local if local and os.path.exists(local) else None
+                if self._local_path:
+                    with _leased_lock:
+                        _leased[self._local_path] = _leased.get(self._local_path, 0) + 1
+            return self._local_path
+
+    @property
+    def available(self):
+        return self.local_path is not None
+
+    def zip(self):
+        """共用的 ZipFile（唯讀）；副本無法使用時返回 None，非 zip 格式時拋出 zipfile.BadZipFile。"""
+        local = self.local_path
+        if local is None:
+            return None
+        with self._lock:
+            if self._zip is None:
+                self._zip = zipfile.ZipFile(local, 'r')
+            return self._zip
+
+    def close(self):
+        with self._lock:
+            if self._zip is not None:
+                try:
+                    self._zip.close()
+                except Exception:
+                    pass
+                self._zip = None
+            if self._local_path:
+                with _leased_lock:
+                    n = _leased.get(self._local_path, 0) - 1
+                    if n > 0:
+                        _leased[self._local_path] = n
+                    else:
+                        _leased.pop(self._local_path, None)
+                self._local_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+@contextmanager
+def lease_for(network_path, lease=None, silent=True):
+    """沿用呼叫方傳入的租約；未傳入時建立一個只在本次使用的租約。"""
+    if lease is not None:
+        yield lease
+        return
+    with CacheLease(network_path, silent=silent) as own:
+        yield own
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+本地快取索引（SQLite）與容量管理
+- 每個快取副本一列：來源路徑、來源 mtime/size、內容雜湊、副本大小、最後存取時間。
+- 內容相同的副本（不同路徑下的同一份活頁簿）以硬連結共用同一份資料，只佔一份空間。
+- CACHE_MAX_SIZE_MB 為容量上限：超過時依「閒置時間 × 大小」由大到小淘汰（大而久未使用的先淘汰），
+  使用中的副本（快取租約持有中）與剛複製的副本不淘汰。
+"""
+from __future__ import annotations
+import os
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from typing import Optional, Iterable, List, Dict, Any, Tuple
+import config.settings as settings
+
+DEFAULT_DB_NAME = '_cache_index.sqlite'
+_HASH_CHUNK = 1024 * 1024
+
+_ensured = set()
+_synced = set()
+_lock = threading.Lock()
+
+
+def get_index_path(preferred: Optional[str] = None) -> str:
+    if preferred and preferred.strip():
+        return preferred
+    return os.path.join(settings.CACHE_FOLDER, DEFAULT_DB_NAME)
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    return sqlite3.connect(path, timeout=30)
+
+
+def _is_index_file(name: str) -> bool:
+    return name.startswith(DEFAULT_DB_NAME) or name.endswith('.tmp')
+
+
+def ensure_index(db_path: Optional[str] = None) -> str:
+    path = get_index_path(db_path)
+    if path in _ensured:
+        return path
+    with _lock:
+        if path in _ensured:
+            return path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = _connect(path)
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                  cache_file TEXT PRIMARY KEY,
+                  source_path TEXT,
+                  source_mtime REAL,
+                  source_size INTEGER,
+                  content_hash TEXT,
+                  size INTEGER,
+                  last_access REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_hash ON cache_entries(content_hash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_size ON cache_entries(size)")
+            conn.commit()
+        finally:
+            conn.close()
+        _ensured.add(path)
+    return path
+
+
+def file_content_hash(path: str) -> str:
+    """副本內容的雜湊（本地磁碟串流讀取）"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(_HASH_CHUNK)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+
+def record_copy(cache_file: str, source_path: str, source_mtime: Optional[float], source_size: Optional[int],
+                content_hash: Optional[str], size: int, db_path: Optional[str] = None) -> None:
+    path = ensure_index(db_path)
+    conn = _connect(path)
+    try:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO cache_entries
+              (cache_file, source_path, source_mtime, source_size, content_hash, size, last_access)
+            VALUES (?,?,?,?,?,?,?)
+            """,
+            (os.path.basename(cache_file), source_path, source_mtime, source_size, content_hash, size, time.time()),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def touch(cache_file: str, db_path: Optional[str] = None) -> None:
+    path = ensure_index(db_path)
+    conn = _connect(path)
+    try:
+        conn.execute("UPDATE cache_entries SET last_access=? WHERE cache_file=?", (time.time(), os.path.basename(cache_file)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def find_duplicate(cache_file: str, size: int, db_path: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    內容與 cache_file 相同且檔案仍存在的其他副本，返回 (副本完整路徑或 None, cache_file 的內容雜湊或 None)。
+    先以大小篩選：沒有同大小的副本時不讀取檔案計算雜湊；同大小的既有副本尚無雜湊時才補算並寫回索引。
+    """
+    path = ensure_index(db_path)
+    folder = os.path.dirname(path)
+    name = os.path.basename(cache_file)
+    conn = _connect(path)
+    try:
+        rows = conn.execute("SELECT cache_file, content_hash FROM cache_entries WHERE size=? AND cache_file<>?",
+                            (size, name)).fetchall()
+    finally:
+        conn.close()
+    rows = [(n, h) for n, h in rows if os.path.exists(os.path.join(folder, n))]
+    if not rows:
+        return None, None
+    content_hash = file_content_hash(cache_file)
+    for other, other_hash in rows:
+        other_path = os.path.join(folder, other)
+        if not other_hash:
+            other_hash = file_content_hash(other_path)
+            _set_hash(other, other_hash, db_path)
+        if other_hash == content_hash:
+            return other_path, content_hash
+    return None, content_hash
+
+
+def _set_hash(cache_file: str, content_hash: str, db_path: Optional[str] = None) -> None:
+    path = ensure_index(db_path)
+    conn = _connect(path)
+    try:
+        conn.execute("UPDATE cache_entries SET content_hash=? WHERE cache_file=?", (content_hash, os.path.basename(cache_file)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_index(db_path: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    path = ensure_index(db_path)
+    conn = _connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return {row['cache_file']: dict(row) for row in conn.execute("SELECT * FROM cache_entries")}
+    finally:
+        conn.close()
+
+
+def _delete_entries(names: Iterable[str], db_path: Optional[str] = None) -> None:
+    names = list(names)
+    if not names:
+        return
+    path = ensure_index(db_path)
+    conn = _connect(path)
+    try:
+        conn.executemany("DELETE FROM cache_entries WHERE cache_file=?", [(n,) for n in names])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def sync_with_folder(db_path: Optional[str] = None, force: bool = False) -> None:
+    """
+    讓索引與快取資料夾一致（每個行程第一次使用時執行一次）：
+    補登舊版留下、不在索引中的副本（以檔案 mtime 作為最後存取時間），移除檔案已不存在的記錄。
+    """
+    path = ensure_index(db_path)
+    if path in _synced and not force:
+        return
+    _synced.add(path)
+    folder = os.path.dirname(path)
+    index = load_index(db_path)
+    present = {}
+    try:
+        with os.scandir(folder) as it:
+            for de in it:
+                if de.is_file(follow_symlinks=False) and not _is_index_file(de.name):
+                    try:
+                        present[de.name] = de.stat()
+                    except OSError:
+                        continue
+    except OSError as e:
+        logging.warning(f"掃描快取資料夾失敗: {e}")
+        return
+    _delete_entries([n for n in index if n not in present], db_path)
+    missing = [(n, st) for n, st in present.items() if n not in index]
+    if missing:
+        conn = _connect(path)
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO cache_entries (cache_file, size, last_access) VALUES (?,?,?)",
+                [(n, st.st_size, st.st_mtime) for n, st in missing],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def _footprint(entries: Iterable[Dict[str, Any]]) -> int:
+    """實際佔用空間：同一內容雜湊（硬連結共用）只計一次"""
+    seen = set()
+    total = 0
+    for e in entries:
+        key = e.get('content_hash') or ('file', e['cache_file'])
+        if key in seen:
+            continue
+        seen.add(key)
+        total += int(e.get('size') or 0)
+    return total
+
+
+def total_size(db_path: Optional[str] = None) -> int:
+    return _footprint(load_index(db_path).values())
+
+
+def evict_to_budget(budget_bytes: int, protect: Iterable[str] = (), db_path: Optional[str] = None) -> List[str]:
+    """
+    超過容量上限時淘汰副本，返回被刪除的檔名。
+    淘汰順序：閒置時間 × 大小 由大到小；protect 內的副本（使用中、剛複製）不淘汰；刪除失敗（例如被開啟中）則略過。
+    """
+    if budget_bytes <= 0:
+        return []
+    path = ensure_index(db_path)
+    folder = os.path.dirname(path)
+    index = load_index(db_path)
+    total = _footprint(index.values())
+    if total <= budget_bytes:
+        return []
+    protected = {os.path.basename(p) for p in protect if p}
+    now = time.time()
+    candidates = sorted(
+        (e for n, e in index.items() if n not in protected),
+        key=lambda e: (now - float(e.get('last_access') or 0)) * max(1, int(e.get('size') or 0)),
+        reverse=True,
+    )
+    # 同一內容的硬連結全部刪除後才真正釋放空間
+    links = {}
+    for e in index.values():
+        key = e.get('content_hash') or ('file', e['cache_file'])
+        links[key] = links.get(key, 0) + 1
+    removed = []
+    for e in candidates:
+        if total <= budget_bytes:
+            break
+        name = e['cache_file']
+        try:
+            os.remove(os.path.join(folder, name))
+        except FileNotFoundError:
+            pass
+        except OSError as err:
+            logging.warning(f"淘汰快取副本失敗（可能使用中）: {name}: {err}")
+            continue
+        removed.append(name)
+        key = e.get('content_hash') or ('file', name)
+        links[key] -= 1
+        if links[key] == 0:
+            total -= int(e.get('size') or 0)
+    _delete_entries(removed, db_path)
+    return removed
+
+
+def get_entry(cache_file: str, db_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    path = ensure_index(db_path)
+    conn = _connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        row = conn.execute("SELECT * FROM cache_entries WHERE cache_file=?", (os.path.basename(cache_file),)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
@@ -0,0 +1,230 @@
+"""
+緊湊的儲存格資料結構 - 以整數陣列與共用值池取代每格一個 dict
+"""
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional
+
+from utils.value_engines.stream_reader import col_letters, _split_addr, MAX_EXCEL_COLUMNS
+
+# 地址編碼：key = row * MAX_EXCEL_COLUMNS + (col - 1)，遞增排序即為逐列（row-major）順序
+_COL_SPAN = MAX_EXCEL_COLUMNS
+
+
+def _encode_addr(addr: str) -> int:
+    row, col = _split_addr(addr)
+    if row <= 0 or col <= 0 or col > _COL_SPAN:
+        raise KeyError(addr)
+    return row * _COL_SPAN + (col - 1)
+
+
+def _decode_key(key: int) -> str:
+    row, col0 = divmod(key, _COL_SPAN)
+    return f"{col_letters(col0 + 1)}{row}"
+
+
+class CellPool:
+    """
+    公式/值的共用池：相同 (型別, 值) 只保存一份，以整數索引引用；索引 0 固定代表 None。
+    以型別區分，避免 True / 1 / 1.0 被合併成同一個值而產生假差異。
+    """
+    __slots__ = ('_items', '_index')
+
+    def __init__(self):
+        self._items = [None]
+        self._index = {}
+
+    def intern(self, value: Any) -> int:
+        if value is None:
+            return 0
+        self._ensure_index()
+        try:
+            k = (type(value), value)
+            idx = self._index.get(k)
+            if idx is None:
+                idx = len(self._items)
+                self._items.append(value)
+                self._index[k] = idx
+            return idx
+        except TypeError:
+            # 不可雜湊的值（理論上不會出現）直接附加，不做去重
+            self._items.append(value)
+            return len(self._items) - 1
+
+    @classmethod
+    def from_items(cls, items: list) -> 'CellPool':
+        """由已序列化的值列表重建（items[0] 必須為 None）；去重索引在首次 intern 時才建立。"""
+        pool = cls()
+        pool._items = list(items) if items else [None]
+        pool._index = None
+        return pool
+
+    def _ensure_index(self) -> None:
+        if self._index is None:
+            self._index = {}
+            for i, v in enumerate(self._items):
+                if i:
+                    try:
+                        self._index.setdefault((type(v), v), i)
+                    except TypeError:
+                        pass
+
+    def __getitem__(self, idx: int) -> Any:
+        return self._items[idx]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SheetCells(Mapping):
+    """
+    單張工作表的儲存格集合：{ 'A1': {"formula", "value", "cached_value"} } 的唯讀 Mapping 介面。
+    內部以排序後的地址 key 陣列加上三個索引陣列保存；查詢時以二分搜尋即時組出 dict，
+    因此對回傳的 dict 做修改不會寫回。
+    """
+    __slots__ = ('_pool', '_keys', '_f', '_v', '_c', '_sorted')
+    __hash__ = None
+
+    def __init__(self, pool: Optional[CellPool] = None):
+        self._pool = pool if pool is not None else CellPool()
+        self._keys = array('q')
+        self._f = array('I')
+        self._v = array('I')
+        self._c = array('I')
+        self._sorted = True
+
+    # ---- 建構 ----
+    def add(self, addr: str, formula: Any, value: Any, cached_value: Any) -> None:
+        key = _encode_addr(addr)
+        if self._keys and key <= self._keys[-1]:
+            self._sorted = False
+        pool = self._pool
+        self._keys.append(key)
+        self._f.append(pool.intern(formula))
+        self._v.append(pool.intern(value))
+        self._c.append(pool.intern(cached_value))
+
+    def freeze(self) -> 'SheetCells':
+        """建構完成後呼叫：若加入順序不是逐列遞增，重新排序並去除重複地址（保留最後一筆）。"""
+        if self._sorted:
+            return self
+        last = {}
+        for i, k in enumerate(self._keys):
+            last[k] = i
+        order = [last[k] for k in sorted(last)]
+        self._keys = array('q', (self._keys[i] for i in order))
+        self._f = array('I', (self._f[i] for i in order))
+        self._v = array('I', (self._v[i] for i in order))
+        self._c = array('I', (self._c[i] for i in order))
+        self._sorted = True
+        return self
+
+    @classmethod
+    def from_arrays(cls, pool: CellPool, keys: array, formulas: array, values: array, cached: array) -> 'SheetCells':
+        """以已排序的地址 key 陣列與索引陣列直接建立（供 columnar 基準線載入使用）。"""
+        sc = cls(pool)
+        sc._keys, sc._f, sc._v, sc._c = keys, formulas, values, cached
+        return sc
+
+    def columns(self) -> tuple:
+        """返回 (pool, keys, formula_idx, value_idx, cached_idx) 內部陣列（唯讀使用）。"""
+        return self._pool, self._keys, self._f, self._v, self._c
+
+    @classmethod
+    def from_dict(cls, cells: Dict[str, dict], pool: Optional[CellPool] = None) -> 'SheetCells':
+        sc = cls(pool)
+        for addr, cell in cells.items():
+            if isinstance(cell, dict):
+                sc.add(addr, cell.get('formula'), cell.get('value'), cell.get('cached_value'))
+            else:
+                sc.add(addr, None, cell, None)
+        return sc.freeze()
+
+    # ---- Mapping 介面 ----
+    def _find(self, addr) -> int:
+        try:
+            key = _encode_addr(addr)
+        except (KeyError, TypeError):
+            return -1
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return i
+        return -1
+
+    def _cell_at(self, i: int) -> dict:
+        pool = self._pool
+        return {"formula": pool[self._f[i]], "value": pool[self._v[i]], "cached_value": pool[self._c[i]]}
+
+    def __getitem__(self, addr: str) -> dict:
+        i = self._find(addr)
+        if i < 0:
+            raise KeyError(addr)
+        return self._cell_at(i)
+
+    def __contains__(self, addr) -> bool:
+        return self._find(addr) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        for k in self._keys:
+            yield _decode_key(k)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def iter_items(self) -> Iterator[tuple]:
+        """依地址順序逐一產出 (addr, cell_dict)，不經二分搜尋。"""
+        for i, k in enumerate(self._keys):
+            yield _decode_key(k), self._cell_at(i)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        if len(self) != len(other):
+            return False
+        if isinstance(other, SheetCells) and other._pool is self._pool:
+            return self._keys == other._keys and self._f == other._f and self._v == other._v and self._c == other._c
+        for addr, cell in self.iter_items():
+            if other.get(addr) != cell:
+                return False
+        return True
+
+    def to_dict(self) -> Dict[str, dict]:
+        return dict(self.iter_items())
+
+    def __repr__(self) -> str:
+        return f"SheetCells({len(self)} cells)"
+
+
+def compact_workbook(cells: Optional[Dict[str, Any]], pool: Optional[CellPool] = None) -> Dict[str, Any]:
+    """
+    將 { sheet: { addr: cell_dict } } 轉為 { sheet: SheetCells }，整本共用一個值池。
+    已是 SheetCells 的工作表保持不變。
+    """
+    if not cells:
+        return cells
+    pool = pool if pool is not None else CellPool()
+    out = {}
+    for sheet, ws in cells.items():
+        if isinstance(ws, SheetCells) or not isinstance(ws, dict):
+            out[sheet] = ws
+        else:
+            out[sheet] = SheetCells.from_dict(ws, pool)
+    return out
+
+
+def to_plain_cells(cells: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, dict]]:
+    """
+    將 SheetCells 轉回純 dict 結構（供需要可修改資料的呼叫者使用）。
+    延遲載入的工作表（LazySheet）保持原樣，在第一次存取時才解碼，不因轉換而整本解壓。
+    """
+    if not cells:
+        return cells or {}
+    return {sheet: (ws.to_dict() if isinstance(ws, SheetCells) else ws) for sheet, ws in cells.items()}
+
+
+def cells_json_default(obj):
+    """json.dump(s) 的 default 參數：讓 SheetCells（及延遲載入的工作表）以原本的 dict 格式序列化。"""
+    if isinstance(obj, Mapping) and hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,292 @@
+"""
+Columnar 基準線格式 (.wdc) - 每張工作表一個獨立壓縮的欄式區塊，檔頭附索引
+
+檔案結構：
+  MAGIC (6 bytes) | 檔頭長度 uint32 LE | 檔頭 JSON (UTF-8，不壓縮) | 區塊 1 | 區塊 2 | ...
+檔頭：{ version, codec, meta: {基準線中 cells 以外的欄位}, sheets: [{name, offset, length, raw_size, cells, digest}] }
+  offset 為相對於資料區（檔頭之後）的位移；digest 為未壓縮區塊的 md5。
+區塊（以 codec 壓縮前）：
+  n_cells uint64 | pool_len uint32 | keys int64[n] | formula_idx uint32[n] | value_idx uint32[n] | cached_idx uint32[n] | pool JSON
+  keys / 索引陣列的語意同 utils.cell_store.SheetCells；pool 為該表自己的值池（索引 0 = None），
+  因此每張表都可單獨解碼。
+"""
+import os
+import sys
+import json
+import struct
+import hashlib
+from array import array
+from collections.abc import Mapping
+from typing import Dict, List, Optional
+
+import config.settings as settings
+from utils.cell_store import CellPool, SheetCells
+from utils.compression import CompressionFormat, compress_data, decompress_bytes
+
+COLUMNAR_EXTENSION = '.wdc'
+COLUMNAR_FORMAT = 'columnar'
+
+_MAGIC = b'WDCB1\n'
+_HEADER_LEN = struct.Struct('<I')
+_BLOCK_HEAD = struct.Struct('<QI')
+_VERSION = 1
+
+# 陣列以 little-endian 寫入；大端機器讀寫時需 byteswap
+_NEED_SWAP = sys.byteorder != 'little'
+
+
+def _to_bytes(arr: array) -> bytes:
+    if _NEED_SWAP:
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_bytes(typecode: str, raw) -> array:
+    arr = array(typecode)
+    arr.frombytes(raw)
+    if _NEED_SWAP:
+        arr.byteswap()
+    return arr
+
+
+def _encode_sheet(ws) -> tuple:
+    """SheetCells 或 dict -> (未壓縮區塊 bytes, 儲存格數)；值池重新編號為該表專用。"""
+    if not isinstance(ws, SheetCells):
+        ws = SheetCells.from_dict(ws or {})
+    pool, keys, f_idx, v_idx, c_idx = ws.columns()
+    remap = {0: 0}
+    items = [None]
+
+    def _remap(src: array) -> array:
+        out = array('I')
+        for i in src:
+            j = remap.get(i)
+            if j is None:
+                j = len(items)
+                remap[i] = j
+                items.append(pool[i])
+            out.append(j)
+        return out
+
+    f2, v2, c2 = _remap(f_idx), _remap(v_idx), _remap(c_idx)
+    pool_json = json.dumps(items, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    n = len(keys)
+    block = b''.join((_BLOCK_HEAD.pack(n, len(pool_json)), _to_bytes(keys), _to_bytes(f2), _to_bytes(v2), _to_bytes(c2), pool_json))
+    return block, n
+
+
+def _decode_sheet(block: bytes) -> SheetCells:
+    n, pool_len = _BLOCK_HEAD.unpack_from(block, 0)
+    mv = memoryview(block)
+    pos = _BLOCK_HEAD.size
+    keys = _from_bytes('q', mv[pos:pos + 8 * n])
+    pos += 8 * n
+    cols = []
+    for _ in range(3):
+        cols.append(_from_bytes('I', mv[pos:pos + 4 * n]))
+        pos += 4 * n
+    items = json.loads(bytes(mv[pos:pos + pool_len]).decode('utf-8'))
+    return SheetCells.from_arrays(CellPool.from_items(items), keys, cols[0], cols[1], cols[2])
+
+
+class _ColumnarSource:
+    """一個 .wdc 檔案的讀取資訊；以 (size, mtime_ns) 偵測檔案是否已被改寫。"""
+    __slots__ = ('path', 'data_start', 'codec', 'signature')
+
+    def __init__(self, path: str, data_start: int, codec: str):
+        self.path = path
+        self.data_start = data_start
+        self.codec = codec
+        self.signature = self._stat_signature()
+
+    def _stat_signature(self) -> tuple:
+        st = os.stat(self.path)
+        return st.st_size, st.st_mtime_ns
+
+    def read_block(self, entry: dict) -> bytes:
+        with open(self.path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if (st.st_size, st.st_mtime_ns) != self.signature:
+                raise OSError(f"基準線檔案已被改寫，無法延遲載入工作表: {self.path}")
+            f.seek(self.data_start + entry['offset'])
+            return f.read(entry['length'])
+
+
+class LazySheet(Mapping):
+    """
+    延遲解碼的工作表：工作表名稱、儲存格數與 digest 立即可用，儲存格內容在第一次存取時才解壓與解碼。
+    壓縮格式相同時，重新保存基準線會直接沿用原壓縮區塊，不需重新編碼。
+    """
+    __slots__ = ('_source', '_entry', '_cells')
+    __hash__ = None
+
+    def __init__(self, source: _ColumnarSource, entry: dict):
+        self._source = source
+        self._entry = entry
+        self._cells: Optional[SheetCells] = None
+
+    @property
+    def digest(self) -> Optional[str]:
+        return self._entry.get('digest')
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._cells is not None
+
+    def load(self) -> SheetCells:
+        if self._cells is None:
+            raw = decompress_bytes(self._source.read_block(self._entry), self._source.codec)
+            self._cells = _decode_sheet(raw)
+        return self._cells
+
+    def __getitem__(self, addr):
+        return self.load()[addr]
+
+    def __contains__(self, addr) -> bool:
+        return addr in self.load()
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self) -> int:
+        if self._cells is None:
+            return int(self._entry.get('cells', 0))
+        return len(self._cells)
+
+    def __eq__(self, other) -> bool:
+        if other is self:
+            return True
+        if isinstance(other, LazySheet) and self.digest and self.digest == other.digest:
+            return True
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        if len(self) != len(other):
+            return False
+        return self.load() == other
+
+    def to_dict(self) -> Dict[str, dict]:
+        return self.load().to_dict()
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self._cells is not None else 'lazy'
+        return f"LazySheet({len(self)} cells, {state})"
+
+
+def is_columnar_file(filepath: str) -> bool:
+    return bool(filepath) and filepath.endswith(COLUMNAR_EXTENSION)
+
+
+def save_columnar_baseline(filepath: str, data: dict, codec: Optional[str] = None) -> str:
+    """
+    寫入 columnar 基準線；filepath 為不含副檔名的路徑（例如 <key>.baseline.json），返回實際檔案路徑。
+    先寫暫存檔再原子替換，避免讀取端看到半寫入的檔案。
+    """
+    codec = CompressionFormat.validate_format(codec or settings.DEFAULT_COMPRESSION_FORMAT)
+    from datetime import datetime
+    meta = {k: v for k, v in (data or {}).items() if k != 'cells'}
+    meta['timestamp'] = datetime.now().isoformat()
+    meta['compression_format'] = COLUMNAR_FORMAT
+
+    blocks: List[bytes] = []
+    sheets_index = []
+    passthrough = []  # (LazySheet, 新 entry)：沿用原壓縮區塊，保存後需改指向新檔案
+    offset = 0
+    for name, ws in ((data or {}).get('cells') or {}).items():
+        comp = None
+        if isinstance(ws, LazySheet) and ws._source.codec == codec:
+            # 工作表內容不可變：同壓縮格式直接沿用原區塊（來源檔已被改寫時改為重新編碼）
+            try:
+                comp = ws._source.read_block(ws._entry)
+                entry = dict(ws._entry, name=name, offset=offset)
+                passthrough.append((ws, entry))
+            except OSError:
+                comp = None
+        if comp is None:
+            raw, n = _encode_sheet(ws.load() if isinstance(ws, LazySheet) else ws)
+            comp = compress_data(raw, codec)
+            entry = {
+                'name': name,
+                'offset': offset,
+                'length': len(comp),
+                'raw_size': len(raw),
+                'cells': n,
+                'digest': hashlib.md5(raw).hexdigest(),
+            }
+        sheets_index.append(entry)
+        blocks.append(comp)
+        offset += len(comp)
+
+    header = json.dumps({'version': _VERSION, 'codec': codec, 'meta': meta, 'sheets': sheets_index},
+                        ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    final_path = filepath + COLUMNAR_EXTENSION
+    tmp_path = final_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(_HEADER_LEN.pack(len(header)))
+        f.write(header)
+        for b in blocks:
+            f.write(b)
+    os.replace(tmp_path, final_path)
+    if passthrough:
+        source = _ColumnarSource(final_path, len(_MAGIC) + _HEADER_LEN.size + len(header), codec)
+        for ws, entry in passthrough:
+            ws._source, ws._entry = source, entry
+    return final_path
+
+
+def _read_header(f) -> tuple:
+    magic = f.read(len(_MAGIC))
+    if magic != _MAGIC:
+        raise ValueError("不是 columnar 基準線檔案")
+    (hlen,) = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+    header = json.loads(f.read(hlen).decode('utf-8'))
+    data_start = len(_MAGIC) + _HEADER_LEN.size + hlen
+    return header, data_start
+
+
+def read_columnar_header(filepath: str) -> dict:
+    """只讀取檔頭（meta 與各表索引），不解壓任何區塊。"""
+    with open(filepath, 'rb') as f:
+        header, data_start = _read_header(f)
+    header['data_start'] = data_start
+    return header
+
+
+def load_columnar_baseline(filepath: str, sheets: Optional[set] = None, lazy: bool = False) -> dict:
+    """
+    載入 columnar 基準線，返回與 JSON 基準線相同結構的 dict（cells 的每張表為 SheetCells）。
+    sheets：只解碼指定名稱的工作表。
+    lazy：只讀檔頭，cells 的每張表為 LazySheet，存取時才解碼。
+    """
+    with open(filepath, 'rb') as f:
+        header, data_start = _read_header(f)
+        codec = header.get('codec', CompressionFormat.GZIP)
+        cells: Dict[str, Mapping] = {}
+        source = _ColumnarSource(filepath, data_start, codec) if lazy else None
+        for entry in header.get('sheets', []):
+            if sheets is not None and entry['name'] not in sheets:
+                continue
+            if lazy:
+                cells[entry['name']] = LazySheet(source, entry)
+                continue
+            f.seek(data_start + entry['offset'])
+            raw = decompress_bytes(f.read(entry['length']), codec)
+            cells[entry['name']] = _decode_sheet(raw)
+    data = dict(header.get('meta') or {})
+    data['cells'] = cells
+    return data
+
+
+def get_columnar_stats(filepath: str) -> dict:
+    """與 compression.get_compression_stats 相同欄位的統計（原始大小以未壓縮區塊 + 檔頭計算）。"""
+    header = read_columnar_header(filepath)
+    file_size = os.path.getsize(filepath)
+    original_size = header['data_start'] + sum(e.get('raw_size', 0) for e in header.get('sheets', []))
+    return {
+        'format': f"{COLUMNAR_FORMAT}+{header.get('codec')}",
+        'compressed_size': file_size,
+        'original_size': original_size,
+        'compression_ratio': (1 - file_size / original_size) * 100 if original_size > 0 else 0,
+        'savings_bytes': original_size - file_size,
+    }
@@ -5,6 +5,7 @@ import os
 import json
 import gzip
 import time
+import struct
 from datetime import datetime
 import logging
 
@@ -28,6 +29,7 @@ except ImportError as e:
     print("[WARNING] 請執行: pip install zstandard")
 
 import config.settings as settings
+from utils.cell_store import cells_json_default
 
 class CompressionFormat:
     """壓縮格式枚舉"""
@@ -115,6 +117,20 @@ def compress_data(data, format_type=None, level=None):
         # print(f"[DEBUG] 使用 gzip 壓縮，級別: {compression_level}")
         return gzip.compress(data, compresslevel=compression_level)
         
+def decompress_bytes(compressed_data, format_type):
+    """
+    以指定格式解壓縮為 bytes（格式必須已知，例如 columnar 基準線的區塊）
+    """
+    if format_type == CompressionFormat.LZ4:
+        if not HAS_LZ4:
+            raise ValueError("LZ4 模組不可用，無法解壓縮")
+        return lz4.frame.decompress(compressed_data)
+    if format_type == CompressionFormat.ZSTD:
+        if not HAS_ZSTD:
+            raise ValueError("Zstandard 模組不可用，無法解壓縮")
+        return zstd.ZstdDecompressor().decompress(compressed_data)
+    return gzip.decompress(compressed_data)
+
 def decompress_data(compressed_data, format_type=None):
     """
     解壓縮數據
@@ -169,7 +185,7 @@ def save_compressed_file(filepath, data, format_type=None, level=None):
     
     # 準備數據
     if isinstance(data, dict):
-        json_data = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        json_data = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=cells_json_default)
     else:
         json_data = str(data)
     
@@ -178,7 +194,7 @@ def save_compressed_file(filepath, data, format_type=None, level=None):
         data_with_timestamp = data.copy()
         data_with_timestamp['timestamp'] = datetime.now().isoformat()
         data_with_timestamp['compression_format'] = format_type
-        json_data = json.dumps(data_with_timestamp, ensure_ascii=False, separators=(',', ':'))
+        json_data = json.dumps(data_with_timestamp, ensure_ascii=False, separators=(',', ':'), default=cells_json_default)
     
     # 壓縮數據
     compressed_data = compress_data(json_data, format_type, level)
@@ -190,22 +206,33 @@ def save_compressed_file(filepath, data, format_type=None, level=None):
     # 🔥 移除這行 - 過於詳細的調試訊息
     # print(f"[DEBUG] 保存壓縮檔案: {final_filepath}")
     
-    # 寫入檔案
-    with open(final_filepath, 'wb') as f:
+    # 寫入暫存檔再原子替換，讀取端不會看到半寫入的基準線
+    tmp_filepath = final_filepath + '.tmp'
+    with open(tmp_filepath, 'wb') as f:
         f.write(compressed_data)
+    os.replace(tmp_filepath, final_filepath)
     
     return final_filepath
 
 def load_compressed_file(filepath):
     """
     載入壓縮檔案 - 優先選擇設定的格式
+    filepath 已帶有基準線副檔名（例如由基準線清單取得的實際路徑）時直接載入，不探測其他格式。
     """
+    from utils.columnar_baseline import COLUMNAR_EXTENSION, is_columnar_file, load_columnar_baseline
+    if filepath.endswith(('.gz', '.lz4', '.zst', COLUMNAR_EXTENSION)):
+        return _load_exact_file(filepath)
+
     # 嘗試不同的檔案路徑
     possible_paths = []
     
     if os.path.exists(filepath):
         possible_paths.append(filepath)
     
+    # columnar 基準線（.wdc）
+    if not is_columnar_file(filepath) and os.path.exists(filepath + COLUMNAR_EXTENSION):
+        possible_paths.append(filepath + COLUMNAR_EXTENSION)
+    
     # 按優先順序添加副檔名 - 優先使用設定的格式
     preferred_format = settings.DEFAULT_COMPRESSION_FORMAT
     available_formats = CompressionFormat.get_available_formats()
@@ -223,7 +250,10 @@ def load_compressed_file(filepath):
         return None
     
     # 優先選擇設定的格式，而不是最新的檔案
-    preferred_ext = CompressionFormat.get_extension(preferred_format)
+    if getattr(settings, 'BASELINE_STORAGE_FORMAT', 'json') == 'columnar':
+        preferred_ext = COLUMNAR_EXTENSION
+    else:
+        preferred_ext = CompressionFormat.get_extension(preferred_format)
     preferred_file = filepath + preferred_ext
     
     if preferred_file in possible_paths:
@@ -236,6 +266,18 @@ def load_compressed_file(filepath):
         # 🔥 移除這行 - 過於詳細的調試訊息
         # print(f"[DEBUG] 首選格式不存在，使用最新檔案: {latest_file}")
     
+    return _load_exact_file(latest_file)
+
+
+def _load_exact_file(latest_file):
+    from utils.columnar_baseline import is_columnar_file, load_columnar_baseline
+    if is_columnar_file(latest_file):
+        try:
+            return load_columnar_baseline(latest_file, lazy=bool(getattr(settings, 'LAZY_BASELINE_LOADING', True)))
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            logging.error(f"載入 columnar 基準線失敗 {latest_file}: {e}")
+            return None
+    
     # 檢測格式
     format_type = CompressionFormat.detect_format(latest_file)
     # 🔥 移除這行 - 過於詳細的調試訊息
@@ -264,6 +306,14 @@ def get_compression_stats(filepath):
     if not os.path.exists(filepath):
         return None
     
+    from utils.columnar_baseline import is_columnar_file, get_columnar_stats
+    if is_columnar_file(filepath):
+        try:
+            return get_columnar_stats(filepath)
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"獲取 columnar 統計資訊失敗: {filepath}, 錯誤: {e}")
+            return None
+    
     format_type = CompressionFormat.detect_format(filepath)
     file_size = os.path.getsize(filepath)
     
@@ -300,7 +350,7 @@ def migrate_baseline_format(old_filepath, new_format):
     
     Args:
         old_filepath: 舊檔案路徑
-        new_format: 新的壓縮格式
+        new_format: 新的壓縮格式；'columnar' 代表轉為 columnar 基準線（區塊以 DEFAULT_COMPRESSION_FORMAT 壓縮）
     
     Returns:
         新檔案路徑
@@ -316,19 +366,24 @@ def migrate_baseline_format(old_filepath, new_format):
     
     # 生成新檔案路徑
     base_path = old_filepath
-    for ext in ['.gz', '.lz4', '.zst']:
+    for ext in ['.gz', '.lz4', '.zst', '.wdc']:
         if base_path.endswith(ext):
             base_path = base_path[:-len(ext)]
             break
     
-    new_filepath = save_compressed_file(base_path, data, new_format)
+    if new_format == 'columnar':
+        from utils.columnar_baseline import save_columnar_baseline
+        new_filepath = save_columnar_baseline(base_path, data)
+    else:
+        new_filepath = save_compressed_file(base_path, data, new_format)
     
     # 刪除舊檔案
-    try:
-        os.remove(old_filepath)
-    except OSError as e:
-        logging.error(f"刪除舊檔案失敗: {old_filepath}, 錯誤: {e}")
-        pass
+    if os.path.abspath(new_filepath) != os.path.abspath(old_filepath):
+        try:
+            os.remove(old_filepath)
+        except OSError as e:
+            logging.error(f"刪除舊檔案失敗: {old_filepath}, 錯誤: {e}")
+            pass
     
     return new_filepath
 
@@ -0,0 +1,183 @@
+"""
+階層式內容雜湊（Merkle）- 列區塊 → 工作表 → 活頁簿
+
+每張工作表依列號切成固定列數的區塊（block = row // block_rows），每個區塊以儲存格的正規化字串計算一個雜湊；
+工作表雜湊由各區塊雜湊組成，活頁簿雜湊由各工作表雜湊組成。
+比較兩棵樹即可知道哪些工作表、哪些列區塊有變動，不需對整本做 dict 相等比較。
+
+樹的結構（可直接存入基準線 JSON / columnar 檔頭）：
+  { version, algo, block_rows, hash, sheets: { 名稱: { hash, cells, blocks: { "區塊編號": hash } } } }
+"""
+import hashlib
+from array import array
+from bisect import bisect_left
+from typing import Dict, Mapping, Optional, Set
+
+try:
+    import xxhash
+    HAS_XXHASH = True
+except ImportError:
+    xxhash = None
+    HAS_XXHASH = False
+
+from utils.cell_store import SheetCells, _encode_addr, _COL_SPAN
+
+TREE_VERSION = 1
+DEFAULT_BLOCK_ROWS = 256
+HASH_ALGO = 'xxh3_64' if HAS_XXHASH else 'blake2b64'
+
+
+def _digest(data: bytes) -> str:
+    if HAS_XXHASH:
+        return xxhash.xxh3_64_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def _cell_lines(ws: Mapping):
+    """依地址順序產出 (key, 正規化字串)；無法編碼的地址 key 為 -1，排在最前面。"""
+    if isinstance(ws, SheetCells):
+        pool, keys, f_idx, v_idx, c_idx = ws.columns()
+        memo = {}
+
+        def r(i):
+            s = memo.get(i)
+            if s is None:
+                s = memo[i] = repr(pool[i])
+            return s
+
+        for j, k in enumerate(keys):
+            yield k, f"{k}\x1f{r(f_idx[j])}\x1f{r(v_idx[j])}\x1f{r(c_idx[j])}\x1e"
+        return
+
+    items = []
+    for addr, cell in ws.items():
+        try:
+            key = _encode_addr(addr)
+            tag = key
+        except (KeyError, TypeError, ValueError):
+            key, tag = -1, addr
+        if isinstance(cell, dict):
+            f, v, c = cell.get('formula'), cell.get('value'), cell.get('cached_value')
+        else:
+            f, v, c = None, cell, None
+        items.append((key, str(tag), f"{tag}\x1f{f!r}\x1f{v!r}\x1f{c!r}\x1e"))
+    items.sort(key=lambda t: (t[0], t[1]))
+    for key, _, line in items:
+        yield key, line
+
+
+def hash_sheet(ws: Mapping, block_rows: int = DEFAULT_BLOCK_ROWS) -> dict:
+    """計算單張工作表的節點 { hash, cells, blocks }；一次只保留一個區塊的字串。"""
+    if not isinstance(ws, SheetCells) and hasattr(ws, 'load'):
+        ws = ws.load()  # 延遲載入的工作表
+    span = block_rows * _COL_SPAN
+    blocks: Dict[str, str] = {}
+    parts = []
+    current = None
+    n = 0
+    for key, line in _cell_lines(ws or {}):
+        b = key // span if key >= 0 else -1
+        if b != current:
+            if parts:
+                blocks[str(current)] = _digest(''.join(parts).encode('utf-8'))
+                parts = []
+            current = b
+        parts.append(line)
+        n += 1
+    if parts:
+        blocks[str(current)] = _digest(''.join(parts).encode('utf-8'))
+    sheet_hash = _digest(''.join(f"{b}:{h};" for b, h in blocks.items()).encode('ascii'))
+    return {'hash': sheet_hash, 'cells': n, 'blocks': blocks}
+
+
+def build_content_tree(cells: Optional[Mapping], known: Optional[Dict[str, dict]] = None,
+                       block_rows: int = DEFAULT_BLOCK_ROWS) -> Optional[dict]:
+    """
+    計算整本活頁簿的雜湊樹。
+    known：{ 工作表: 既有節點 }，內容確定未變的工作表（例如沿用基準線的表）直接沿用，不重新計算。
+    """
+    if cells is None:
+        return None
+    sheets = {}
+    for name, ws in cells.items():
+        node = (known or {}).get(name)
+        sheets[name] = node if node is not None else hash_sheet(ws, block_rows)
+    root = _digest(''.join(f"{name}\x1f{sheets[name]['hash']}\x1e" for name in sorted(sheets)).encode('utf-8'))
+    return {'version': TREE_VERSION, 'algo': HASH_ALGO, 'block_rows': block_rows, 'hash': root, 'sheets': sheets}
+
+
+def reusable_nodes(tree: Optional[dict], names) -> Optional[Dict[str, dict]]:
+    """既有樹中可直接沿用的工作表節點；樹必須以目前的版本、演算法與區塊大小計算。"""
+    if not isinstance(tree, dict):
+        return None
+    if (tree.get('version'), tree.get('algo'), tree.get('block_rows')) != (TREE_VERSION, HASH_ALGO, DEFAULT_BLOCK_ROWS):
+        return None
+    sheets = tree.get('sheets') or {}
+    return {name: sheets[name] for name in names if name in sheets}
+
+
+def trees_compatible(a: Optional[dict], b: Optional[dict]) -> bool:
+    """兩棵樹以相同版本、演算法與區塊大小計算時才可互相比較。"""
+    if not isinstance(a, dict) or not isinstance(b, dict):
+        return False
+    return all(a.get(k) == b.get(k) for k in ('version', 'algo', 'block_rows')) and 'sheets' in a and 'sheets' in b
+
+
+def diff_content_trees(old_tree: Optional[dict], new_tree: Optional[dict]) -> Optional[Dict[str, Optional[Set[int]]]]:
+    """
+    比較兩棵樹，返回 { 有變動的工作表: 變動的區塊編號集合 }；只存在於一邊的工作表對應 None（整張表）。
+    兩棵樹無法比較時返回 None。
+    """
+    if not trees_compatible(old_tree, new_tree):
+        return None
+    if old_tree.get('hash') == new_tree.get('hash'):
+        return {}
+    old_sheets, new_sheets = old_tree['sheets'], new_tree['sheets']
+    scope: Dict[str, Optional[Set[int]]] = {}
+    for name in list(new_sheets) + [s for s in old_sheets if s not in new_sheets]:
+        old_node, new_node = old_sheets.get(name), new_sheets.get(name)
+        if old_node is None or new_node is None:
+            scope[name] = None
+        elif old_node.get('hash') != new_node.get('hash'):
+            ob, nb = old_node.get('blocks', {}), new_node.get('blocks', {})
+            scope[name] = {int(b) for b in set(ob) | set(nb) if ob.get(b) != nb.get(b)}
+    return scope
+
+
+def restrict_to_blocks(ws: Mapping, blocks: Optional[Set[int]], block_rows: int = DEFAULT_BLOCK_ROWS) -> Mapping:
+    """只保留指定列區塊內的儲存格（blocks 為 None 時返回原工作表）。"""
+    if blocks is None or not ws:
+        return ws
+    if not isinstance(ws, SheetCells) and hasattr(ws, 'load'):
+        ws = ws.load()
+    span = block_rows * _COL_SPAN
+    if isinstance(ws, SheetCells):
+        pool, keys, f_idx, v_idx, c_idx = ws.columns()
+        k2, f2, v2, c2 = array('q'), array('I'), array('I'), array('I')
+        for b in sorted(blocks):
+            if b < 0:
+                continue
+            i = bisect_left(keys, b * span)
+            j = bisect_left(keys, (b + 1) * span)
+            k2.extend(keys[i:j])
+            f2.extend(f_idx[i:j])
+            v2.extend(v_idx[i:j])
+            c2.extend(c_idx[i:j])
+        return SheetCells.from_arrays(pool, k2, f2, v2, c2)
+    out = {}
+    for addr, cell in ws.items():
+        try:
+            b = _encode_addr(addr) // span
+        except (KeyError, TypeError, ValueError):
+            b = -1
+        if b in blocks:
+            out[addr] = cell
+    return out
+
+
+def scoped_cells(cells: Optional[Mapping], scope: Dict[str, Optional[Set[int]]],
+                 block_rows: int = DEFAULT_BLOCK_ROWS) -> Dict[str, Mapping]:
+    """依 diff_content_trees 的結果，只取出有變動的工作表與列區塊（保持活頁簿順序）。"""
+    return {name: restrict_to_blocks(ws, scope[name], block_rows)
+            for name, ws in (cells or {}).items() if name in scope}
+
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+複製排程器 - 所有「網路來源 → 本地快取」的複製集中由固定大小的執行緒池處理。
+
+- 同一來源路徑同時只複製一次：複製中再要求同一檔案的呼叫端共用同一個結果（Future）。
+- 每個伺服器/共享根目錄（\\\\server\\share、磁碟代號、POSIX 前兩層目錄）同時最多 COPY_MAX_PER_SHARE 個傳輸，
+  一次大量建立基準線或事件暴增時不會同時打爆同一台檔案伺服器。
+- 優先順序：最近修改（5 分鐘內，通常是使用者剛存檔、正在等結果）優先，其次小檔優先。
+- 失敗或來源仍在變動時不在工作執行緒內睡眠等待，而是以指數退避（或 CopyDeferred.delay 指定的秒數）重新排入佇列，不佔用傳輸名額。
+- 統計：完成/失敗/重試/延後/合併次數、傳輸量與吞吐量（MB/s）。
+"""
+import os
+import time
+import ntpath
+import logging
+import threading
+from concurrent.futures import Future
+
+import config.settings as settings
+
+_RECENT_SEC = 300.0      # 幾秒內修改過的檔案視為「最近修改」而優先複製
+_MAX_BACKOFF_SEC = 10.0  # 重試退避上限（秒）
+
+
+class CopyDeferred(Exception):
+    """
+    本次不複製、稍後重試（例如來源仍在寫入中）。
+    delay 不為 None 時表示「delay 秒後再檢查一次」：不計入重試次數、不佔用傳輸名額，由排程器到期後重新排入。
+    """
+
+    def __init__(self, message='', delay=None):
+        super().__init__(message)
+        self.delay = delay
+
+
+def share_key(path):
+    """來源所在的伺服器/共享根目錄，用於限制同一台伺服器的同時傳輸數"""
+    s = str(path)
+    if s.startswith(('\\\\', '//')) or (len(s) > 1 and s[1] == ':'):
+        return ntpath.splitdrive(s)[0].replace('/', '\\').lower()
+    parts = [p for p in os.path.abspath(s).split(os.sep) if p]
+    return os.sep + os.sep.join(parts[:2 if len(parts) > 2 else 1])
+
+
+def _backoff(base, attempt):
+    return min(_MAX_BACKOFF_SEC, base * (2 ** (attempt - 1)))
+
+
+def run_inline(attempt_fn, on_fail, retry, backoff):
+    """不經排程器、在呼叫端執行緒內直接複製（COPY_WORKERS = 0）；重試語意與排程器相同"""
+    last_err = None
+    attempt = 1
+    while attempt <= retry:
+        if getattr(settings, 'force_stop', False):
+            last_err = OSError('Operation cancelled: stopping')
+            break
+        try:
+            return attempt_fn(attempt)[0]
+        except CopyDeferred as e:
+            last_err = e
+            if e.delay is not None:
+                time.sleep(max(0.0, e.delay))
+                continue
+        except OSError as e:
+            last_err = e
+        if attempt < retry:
+            time.sleep(_backoff(backoff, attempt))
+        attempt += 1
+    return on_fail(last_err, min(attempt, retry))
+
+
+class _CopyJob:
+    __slots__ = ('key', 'share', 'attempt_fn', 'on_fail', 'retry', 'backoff', 'priority',
+                 'due', 'attempt', 'last_err', 'future', 'joined')
+
+    def __init__(self, key, share, attempt_fn, on_fail, retry, backoff, priority):
+        self.key = key
+        self.share = share
+        self.attempt_fn = attempt_fn
+        self.on_fail = on_fail
+        self.retry = retry
+        self.backoff = backoff
+        self.priority = priority
+        self.due = 0.0
+        self.attempt = 0
+        self.last_err = None
+        self.future = Future()
+        self.joined = 0
+
+
+class CopyScheduler:
+    """
+    submit(path, attempt_fn, on_fail, size, mtime) 排入一個複製工作並返回 Future：
+    attempt_fn(attempt) 執行一次複製並返回 (結果, 傳輸位元組)，失敗拋出 OSError、需延後拋出 CopyDeferred；
+    重試用盡時以 on_fail(最後錯誤, 嘗試次數) 的返回值作為結果。
+    """
+
+    def __init__(self, workers=None, per_share=None, name='copy'):
+        self.workers = max(1, int(workers or getattr(settings, 'COPY_WORKERS', 4) or 1))
+        self.per_share = max(1, int(per_share or getattr(settings, 'COPY_MAX_PER_SHARE', 2) or 1))
+        self.name = name
+        self._cond = threading.Condition()
+        self._pending = []     # 等待中的 _CopyJob
+        self._inflight = {}    # key -> _CopyJob（等待中或複製中）
+        self._active = {}      # share -> 複製中數量
+        self._threads = []
+        self._stopped = False
+        self._seq = 0
+        self.submitted = 0
+        self.joined = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.deferred = 0
+        self.bytes = 0
+        self.busy_sec = 0.0
+        self._first_submit = None
+
+    # ---- 生命週期 ----
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            self._stopped = False
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f'{self.name}-worker-{i + 1}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, wait=False, timeout=None):
+        """停止排程；尚未開始的工作以「已取消」的 OSError 結束，呼叫端依複製失敗處理。"""
+        with self._cond:
+            self._stopped = True
+            cancelled = self._pending
+            self._pending = []
+            for job in cancelled:
+                self._inflight.pop(job.key, None)
+            self._cond.notify_all()
+        for job in cancelled:
+            job.future.set_exception(OSError('Operation cancelled: stopping'))
+        if wait:
+            for t in self._threads:
+                t.join(timeout)
+        self._threads = []
+
+    # ---- 排入 ----
+    def submit(self, path, attempt_fn, on_fail, size=None, mtime=None):
+        key = os.path.normcase(os.path.abspath(str(path)))
+        with self._cond:
+            if self._stopped:
+                fut = Future()
+                fut.set_exception(OSError('Operation cancelled: stopping'))
+                return fut
+            if not self._threads:
+                self.start()
+            self.submitted += 1
+            if self._first_submit is None:
+                self._first_submit = time.time()
+            job = self._inflight.get(key)
+            if job is not None:
+                job.joined += 1
+                self.joined += 1
+                return job.future
+            recent = mtime is not None and time.time() - mtime <= _RECENT_SEC
+            self._seq += 1
+            job = _CopyJob(
+                key, share_key(path), attempt_fn, on_fail,
+                retry=max(1, int(getattr(settings, 'COPY_RETRY_COUNT', 3))),
+                backoff=max(0.0, float(getattr(settings, 'COPY_RETRY_BACKOFF_SEC', 0.5))),
+                priority=(0 if recent else 1, size if size is not None else float('inf'), self._seq),
+            )
+            self._inflight[key] = job
+            self._pending.append(job)
+            self._cond.notify_all()
+            return job.future
+
+    # ---- 處理 ----
+    def _pick(self):
+        """挑出已到期、所屬共享仍有名額且優先順序最高的工作；沒有時返回 (None, 等待秒數)"""
+        now = time.monotonic()
+        best = None
+        wait = None
+        for job in self._pending:
+            if job.due > now:
+                wait = job.due - now if wait is None else min(wait, job.due - now)
+                continue
+            if self._active.get(job.share, 0) >= self.per_share:
+                continue
+            if best is None or job.priority < best.priority:
+                best = job
+        if best is not None:
+            self._pending.remove(best)
+        return best, wait
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    job, wait = self._pick()
+                    if job is not None:
+                        break
+                    self._cond.wait(wait)
+                self._active[job.share] = self._active.get(job.share, 0) + 1
+                job.attempt += 1
+            started = time.time()
+            outcome, value, nbytes = 'ok', None, 0
+            try:
+                value, nbytes = job.attempt_fn(job.attempt)
+            except CopyDeferred as e:
+                outcome, value = ('defer' if e.delay is not None else 'retry'), e
+            except OSError as e:
+                outcome, value = 'retry', e
+            except Exception as e:
+                outcome, value = 'error', e
+                logging.error(f"複製工作失敗: {job.key}: {e}", exc_info=True)
+            elapsed = time.time() - started
+            give_up = False
+            with self._cond:
+                self._active[job.share] -= 1
+                self.busy_sec += elapsed
+                if outcome == 'defer':
+                    # 稍後再檢查：不計入嘗試次數
+                    job.last_err = value
+                    job.attempt -= 1
+                    if not self._stopped and not getattr(settings, 'force_stop', False):
+                        self.deferred += 1
+                        job.due = time.monotonic() + max(0.0, value.delay)
+                        self._pending.append(job)
+                        self._cond.notify_all()
+                        continue
+                    job.attempt = max(1, job.attempt)
+                    give_up = True
+                elif outcome == 'retry':
+                    job.last_err = value
+                    if job.attempt < job.retry and not self._stopped and not getattr(settings, 'force_stop', False):
+                        self.retries += 1
+                        job.due = time.monotonic() + _backoff(job.backoff, job.attempt)
+                        self._pending.append(job)
+                        self._cond.notify_all()
+                        continue
+                    give_up = True
+                self._inflight.pop(job.key, None)
+                if outcome == 'ok':
+                    self.completed += 1
+                    self.bytes += int(nbytes or 0)
+                else:
+                    self.failed += 1
+                self._cond.notify_all()
+            if give_up:
+                try:
+                    job.future.set_result(job.on_fail(job.last_err, job.attempt))
+                except Exception as e:
+                    job.future.set_exception(e)
+            elif outcome == 'ok':
+                job.future.set_result(value)
+            else:
+                job.future.set_exception(value)
+
+    # ---- 統計 ----
+    def stats(self):
+        with self._cond:
+            depth = len(self._pending)
+            active = sum(self._active.values())
+            mb = self.bytes / (1024 * 1024)
+            wall = time.time() - self._first_submit if self._first_submit else 0.0
+            return {'queue_depth': depth, 'active': active, 'workers': self.workers, 'per_share': self.per_share,
+                    'submitted': self.submitted, 'joined': self.joined, 'completed': self.completed,
+                    'failed': self.failed, 'retries': self.retries, 'deferred': self.deferred, 'mb': mb,
+                    'mb_per_sec': mb / self.busy_sec if self.busy_sec > 0 else 0.0,
+                    'aggregate_mb_per_sec': mb / wall if wall > 0 else 0.0}
+
+    def format_stats(self):
+        s = self.stats()
+        return (f"佇列 {s['queue_depth']}，複製中 {s['active']}/{s['workers']}（每個共享上限 {s['per_share']}），"
+                f"完成 {s['completed']}（失敗 {s['failed']}，重試 {s['retries']}，延後 {s['deferred']}，合併 {s['joined']}），"
+                f"傳輸 {s['mb']:.1f} MB，單一傳輸 {s['mb_per_sec']:.1f} MB/s，整體 {s['aggregate_mb_per_sec']:.1f} MB/s")
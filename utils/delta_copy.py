@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+差異複製（COPY_ENGINE = 'delta'）
+- xlsx/xlsm 是 zip：每個成員（工作表、樣式、vbaProject.bin…）各自壓縮，中央目錄記錄名稱、CRC 與大小。
+- 先只讀來源尾端的中央目錄，與上一份快取副本比對；名稱/CRC/大小/壓縮方式與佔用長度都相同的成員，
+  再讀來源該成員的本地標頭確認一致後，壓縮資料直接從本地舊副本取用。
+  網路上只讀：變動的成員、各成員的本地標頭、中央目錄。
+- 組出的檔案與來源逐位元組相同；寫入暫存檔後以 os.replace 換上（舊副本可能是共用的硬連結，不原地修改）。
+- 來源不是 zip、沒有舊副本、可沿用的資料太少（整份重寫）時改用完整複製；來源在複製期間變動則拋出 OSError 交由重試。
+"""
+import os
+import shutil
+import struct
+import zipfile
+import logging
+import config.settings as settings
+
+_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+_LOCAL_SIG = b'PK\x03\x04'
+_MIN_REUSE_RATIO = 0.2  # 可沿用的位元組低於此比例視為整份重寫，直接完整複製
+
+
+class _CountingReader:
+    """包住來源檔案並累計實際讀取的位元組數（zipfile 解析中央目錄也經過這裡）"""
+
+    def __init__(self, f):
+        self._f = f
+        self.bytes_read = 0
+
+    def read(self, n=-1):
+        buf = self._f.read(n)
+        self.bytes_read += len(buf)
+        return buf
+
+    def seek(self, *args):
+        return self._f.seek(*args)
+
+    def tell(self):
+        return self._f.tell()
+
+
+def _check_stop():
+    if getattr(settings, 'force_stop', False):
+        raise OSError('Operation cancelled: stopping')
+
+
+def _read_exact(f, start, length):
+    f.seek(start)
+    parts = []
+    remaining = length
+    while remaining > 0:
+        buf = f.read(remaining)
+        if not buf:
+            raise OSError('來源檔案比預期短（複製期間被改寫？）')
+        parts.append(buf)
+        remaining -= len(buf)
+    return b''.join(parts)
+
+
+def _copy_range(fsrc, fdst, start, length, chunk):
+    fsrc.seek(start)
+    remaining = length
+    while remaining > 0:
+        _check_stop()
+        buf = fsrc.read(min(chunk, remaining))
+        if not buf:
+            raise OSError('來源檔案比預期短（複製期間被改寫？）')
+        fdst.write(buf)
+        remaining -= len(buf)
+
+
+def _layout(zf):
+    """依位置排序的成員與各自佔用的區段 [start, end)：end 為下一個成員或中央目錄的起點"""
+    start_dir = getattr(zf, 'start_dir', None)
+    if start_dir is None:
+        raise zipfile.BadZipFile('無法取得中央目錄位置')
+    infos = sorted(zf.infolist(), key=lambda i: i.header_offset)
+    spans = []
+    for idx, info in enumerate(infos):
+        end = infos[idx + 1].header_offset if idx + 1 < len(infos) else start_dir
+        if end < info.header_offset + info.compress_size:
+            raise zipfile.BadZipFile(f'成員區段重疊: {info.filename}')
+        spans.append((info, info.header_offset, end))
+    return spans
+
+
+def _same_member(new, old):
+    info, start, end = new
+    oinfo, ostart, oend = old
+    return (
+        info.CRC == oinfo.CRC
+        and info.compress_size == oinfo.compress_size
+        and info.file_size == oinfo.file_size
+        and info.compress_type == oinfo.compress_type
+        and info.flag_bits == oinfo.flag_bits
+        and end - start == oend - ostart
+    )
+
+
+def _full_copy(src, dst, chunk):
+    tmp = dst + '.delta.tmp'
+    size = 0
+    try:
+        with open(src, 'rb', buffering=0) as fsrc, open(tmp, 'wb') as fdst:
+            while True:
+                _check_stop()
+                buf = fsrc.read(chunk)
+                if not buf:
+                    break
+                fdst.write(buf)
+                size += len(buf)
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return {'mode': 'full', 'reused': 0, 'fetched': size, 'size': size}
+
+
+def delta_copy(src, dst, base=None, chunk_mb=4):
+    """
+    以 base（上一份副本，預設為 dst 本身）為底，把 src 差異複製到 dst。
+    返回 {'mode': 'delta'|'full', 'reused': 沿用位元組, 'fetched': 從來源讀取的位元組, 'size': 檔案大小}。
+    """
+    base = dst if base is None else base
+    chunk = max(1, int(chunk_mb or 4)) * 1024 * 1024
+    st0 = os.stat(src)
+    try:
+        with zipfile.ZipFile(base) as bz:
+            old = {info.filename: (info, s, e) for info, s, e in _layout(bz)}
+    except (OSError, zipfile.BadZipFile, ValueError):
+        return _full_copy(src, dst, chunk)
+
+    tmp = dst + '.delta.tmp'
+    reused = 0
+    with open(src, 'rb', buffering=0) as raw:
+        reader = _CountingReader(raw)
+        try:
+            with zipfile.ZipFile(reader) as zf:
+                spans = _layout(zf)
+        except (zipfile.BadZipFile, ValueError) as e:
+            logging.debug(f"差異複製：來源不是可解析的 zip，改用完整複製: {e}")
+            return _full_copy(src, dst, chunk)
+        planned = sum(span[0].compress_size for span in spans
+                      if span[0].filename in old and _same_member(span, old[span[0].filename]))
+        if planned < st0.st_size * _MIN_REUSE_RATIO:
+            return _full_copy(src, dst, chunk)
+
+        try:
+            with open(base, 'rb') as fbase, open(tmp, 'wb') as out:
+                pos = 0
+                for span in spans:
+                    info, start, end = span
+                    if start > pos:
+                        _copy_range(reader, out, pos, start - pos, chunk)
+                    prev = old.get(info.filename)
+                    copied = False
+                    if prev is not None and _same_member(span, prev):
+                        header = _read_exact(reader, start, _LOCAL_HEADER.size)
+                        sig, *_, name_len, extra_len = _LOCAL_HEADER.unpack(header)
+                        header_len = _LOCAL_HEADER.size + name_len + extra_len
+                        data_end = start + header_len + info.compress_size
+                        if sig == _LOCAL_SIG and data_end <= end:
+                            header += _read_exact(reader, start + _LOCAL_HEADER.size, name_len + extra_len)
+                            if header == _read_exact(fbase, prev[1], header_len):
+                                out.write(header)
+                                _copy_range(fbase, out, prev[1] + header_len, info.compress_size, chunk)
+                                # 資料描述區（data descriptor）等尾段仍從來源讀取
+                                _copy_range(reader, out, data_end, end - data_end, chunk)
+                                reused += info.compress_size
+                                copied = True
+                    if not copied:
+                        _copy_range(reader, out, start, end - start, chunk)
+                    pos = end
+                _copy_range(reader, out, pos, st0.st_size - pos, chunk)
+            st1 = os.stat(src)
+            if (st1.st_size, st1.st_mtime) != (st0.st_size, st0.st_mtime) or os.path.getsize(tmp) != st0.st_size:
+                raise OSError('來源在差異複製期間變動')
+            with zipfile.ZipFile(tmp) as check:
+                if sorted((i.filename, i.CRC) for i in check.infolist()) != sorted((i.filename, i.CRC) for i, _, _ in spans):
+                    raise OSError('差異複製結果與來源中央目錄不一致')
+            shutil.copystat(src, tmp)
+            os.replace(tmp, dst)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+    return {'mode': 'delta', 'reused': reused, 'fetched': reader.bytes_read, 'size': st0.st_size}
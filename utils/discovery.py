@@ -0,0 +1,194 @@
+"""
+啟動掃描（discovery）- 以 os.scandir 並行走訪多個根目錄，邊找邊產出 Excel 檔案
+
+- 每個資料夾一個工作，由執行緒池並行處理；子資料夾的 mtime 直接取自 DirEntry（Windows 上不需額外 stat）。
+- 排除清單（WATCH_EXCLUDE_FOLDERS，及 IGNORE_CACHE_FOLDER / IGNORE_LOG_FOLDER 對應的資料夾）在走訪時直接剪枝。
+- 資料夾 mtime 快取（LOG_FOLDER/discovery_cache.json）：資料夾的 mtime 未變時沿用上次的檔案與子資料夾清單，
+  不重新列出內容（新增/刪除/改名都會改變資料夾 mtime）。
+"""
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+
+import config.settings as settings
+
+CACHE_FILE_NAME = 'discovery_cache.json'
+_CACHE_VERSION = 1
+# mtime 距離掃描時間太近的資料夾不寫入快取（同一秒內的後續變更可能不會改變 mtime）
+_RACY_WINDOW_SEC = 2.0
+
+_DONE = object()
+
+
+def _norm(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _excluded_dirs(extra: Optional[Iterable[str]] = None) -> set:
+    dirs = list(getattr(settings, 'WATCH_EXCLUDE_FOLDERS', []) or [])
+    if getattr(settings, 'IGNORE_CACHE_FOLDER', False) and getattr(settings, 'CACHE_FOLDER', None):
+        dirs.append(settings.CACHE_FOLDER)
+    if getattr(settings, 'IGNORE_LOG_FOLDER', False) and getattr(settings, 'LOG_FOLDER', None):
+        dirs.append(settings.LOG_FOLDER)
+    dirs.extend(extra or [])
+    return {_norm(d) for d in dirs if d}
+
+
+def _under_any(path: str, dirs: set) -> bool:
+    p = _norm(path)
+    for d in dirs:
+        try:
+            if os.path.commonpath([p, d]) == d:
+                return True
+        except ValueError:
+            continue  # 不同磁碟機
+    return False
+
+
+def _is_excel_name(name: str, exts: tuple) -> bool:
+    return name.lower().endswith(exts) and not name.startswith('~$')
+
+
+def _cache_path() -> str:
+    return os.path.join(settings.LOG_FOLDER, CACHE_FILE_NAME)
+
+
+def _load_dir_cache(exts: tuple) -> dict:
+    try:
+        with open(_cache_path(), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != _CACHE_VERSION or tuple(data.get('exts') or ()) != exts:
+            return {}
+        return data.get('dirs') or {}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"讀取資料夾快取失敗: {e}")
+        return {}
+
+
+def _save_dir_cache(exts: tuple, dirs: dict) -> None:
+    path = _cache_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': _CACHE_VERSION, 'exts': list(exts), 'dirs': dirs}, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, path)
+    except OSError as e:
+        logging.warning(f"保存資料夾快取失敗: {e}")
+
+
+def iter_excel_files(roots: Iterable[str], exclude: Optional[Iterable[str]] = None,
+                     workers: Optional[int] = None, use_cache: Optional[bool] = None) -> Iterator[str]:
+    """
+    並行走訪 roots，找到 Excel 檔案就立即產出（順序不固定）。
+    roots 可包含單一檔案；exclude 為額外的排除資料夾。
+    """
+    exts = tuple(e.lower() for e in settings.SUPPORTED_EXTS)
+    workers = max(1, int(workers or getattr(settings, 'DISCOVERY_WORKERS', 8) or 1))
+    if use_cache is None:
+        use_cache = bool(getattr(settings, 'DISCOVERY_DIR_CACHE', True))
+    excluded = _excluded_dirs(exclude)
+    cache = _load_dir_cache(exts) if use_cache else {}
+    new_cache = {}
+
+    out = queue.Queue()
+    lock = threading.Lock()
+    state = {'pending': 0, 'dirs': 0, 'cached': 0, 'files': 0, 'stopped': False}
+    seen_dirs = set()
+    started = time.time()
+    executor = ThreadPoolExecutor(workers, thread_name_prefix='discovery')
+
+    def submit(path, mtime_ns):
+        key = _norm(path)
+        with lock:
+            if key in seen_dirs:
+                return
+            seen_dirs.add(key)
+            state['pending'] += 1
+        executor.submit(scan_dir, path, key, mtime_ns)
+
+    def scan_dir(path, key, mtime_ns):
+        try:
+            if getattr(settings, 'force_stop', False):
+                state['stopped'] = True
+                return
+            if mtime_ns is None:
+                mtime_ns = os.stat(path).st_mtime_ns
+            entry = cache.get(key)
+            if entry and entry.get('mtime_ns') == mtime_ns:
+                files = entry.get('files', [])
+                subdirs = [(name, None) for name in entry.get('dirs', [])]
+                with lock:
+                    state['cached'] += 1
+            else:
+                files, subdirs = [], []
+                with os.scandir(path) as it:
+                    for de in it:
+                        try:
+                            if de.is_dir(follow_symlinks=False):
+                                subdirs.append((de.name, de.stat(follow_symlinks=False).st_mtime_ns))
+                            elif _is_excel_name(de.name, exts) and de.is_file():
+                                files.append(de.name)
+                        except OSError:
+                            continue
+            if use_cache and time.time() - mtime_ns / 1e9 > _RACY_WINDOW_SEC:
+                with lock:
+                    new_cache[key] = {'mtime_ns': mtime_ns, 'files': files, 'dirs': [name for name, _ in subdirs]}
+            with lock:
+                state['dirs'] += 1
+                state['files'] += len(files)
+            for name in files:
+                out.put(os.path.join(path, name))
+            for name, sub_mtime in subdirs:
+                sub = os.path.join(path, name)
+                if _norm(sub) in excluded:
+                    continue
+                submit(sub, sub_mtime)
+        except OSError as e:
+            logging.warning(f"掃描資料夾失敗: {path}: {e}")
+        finally:
+            release()
+
+    def release():
+        # pending 歸零只會發生一次（走訪中的資料夾先排入子資料夾才釋放自己），_DONE 只放入一次
+        with lock:
+            state['pending'] -= 1
+            done = state['pending'] == 0
+        if done:
+            out.put(_DONE)
+
+    try:
+        any_dir = False
+        # 排入根目錄期間持有一個名額，避免前面的根目錄掃完時就提早送出 _DONE
+        state['pending'] = 1
+        for root in roots or []:
+            if not root:
+                continue
+            if os.path.isfile(root):
+                if _is_excel_name(os.path.basename(root), exts):
+                    with lock:
+                        state['files'] += 1
+                    yield root
+            elif os.path.isdir(root) and not _under_any(root, excluded):
+                any_dir = True
+                submit(root, None)
+        release()
+        if any_dir:
+            while True:
+                item = out.get()
+                if item is _DONE:
+                    break
+                yield item
+            if use_cache and not state['stopped']:
+                _save_dir_cache(exts, new_cache)
+        print(f"🔍 掃描完成: 找到 {state['files']} 個 Excel 檔案（資料夾 {state['dirs']} 個，"
+              f"其中 {state['cached']} 個沿用快取，耗時 {time.time() - started:.1f} 秒）")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -2,7 +2,6 @@
 通用輔助函數
 """
 import os
-import time
 import json
 import threading
 from datetime import datetime
@@ -119,19 +118,10 @@ def map_path_for_display(path: str) -> str:
 
 def get_all_excel_files(folders):
     """
-    獲取所有Excel檔案
+    獲取所有Excel檔案（並行掃描，見 utils.discovery.iter_excel_files）
     """
-    all_files = []
-    for folder in folders:
-        if os.path.isfile(folder):
-            if folder.lower().endswith(settings.SUPPORTED_EXTS) and not os.path.basename(folder).startswith('~$'):
-                all_files.append(folder)
-        elif os.path.isdir(folder):
-            for dirpath, _, filenames in os.walk(folder):
-                for f in filenames:
-                    if f.lower().endswith(settings.SUPPORTED_EXTS) and not f.startswith('~$'):
-                        all_files.append(os.path.join(dirpath, f))
-    return all_files
+    from utils.discovery import iter_excel_files
+    return list(iter_excel_files(folders))
 
 def is_force_baseline_file(filepath):
     """
@@ -146,6 +136,22 @@ def is_force_baseline_file(filepath):
         logging.error(f"檢查強制基準線檔案時發生類型錯誤: {e}")
         return False
 
+def _resume_file_path():
+    """
+    進度檔實際路徑：若 RESUME_LOG_FILE 指向資料夾或為空，回退到 LOG_FOLDER/resume_log/baseline_progress.log
+    """
+    resume_path = getattr(settings, 'RESUME_LOG_FILE', None)
+    try:
+        if not resume_path or os.path.isdir(resume_path) or os.path.basename(resume_path) == '':
+            resume_path = None
+    except Exception:
+        resume_path = None
+    if resume_path is None:
+        base_dir = os.path.join(settings.LOG_FOLDER, 'resume_log')
+        os.makedirs(base_dir, exist_ok=True)
+        resume_path = os.path.join(base_dir, 'baseline_progress.log')
+    return resume_path
+
 def save_progress(completed_files, total_files):
     """
     保存進度（具容錯）：若 RESUME_LOG_FILE 指向資料夾或為空，將回退到 LOG_FOLDER/resume_log/baseline_progress.log
@@ -159,16 +165,7 @@ def save_progress(completed_files, total_files):
             "total": total_files,
         }
         # 決定實際路徑
-        resume_path = getattr(settings, 'RESUME_LOG_FILE', None)
-        try:
-            if not resume_path or os.path.isdir(resume_path) or os.path.basename(resume_path) == '':
-                base_dir = os.path.join(settings.LOG_FOLDER, 'resume_log')
-                os.makedirs(base_dir, exist_ok=True)
-                resume_path = os.path.join(base_dir, 'baseline_progress.log')
-        except Exception:
-            base_dir = os.path.join(settings.LOG_FOLDER, 'resume_log')
-            os.makedirs(base_dir, exist_ok=True)
-            resume_path = os.path.join(base_dir, 'baseline_progress.log')
+        resume_path = _resume_file_path()
         # 確保目錄存在
         os.makedirs(os.path.dirname(resume_path), exist_ok=True)
         with open(resume_path, 'w', encoding='utf-8') as f:
@@ -190,15 +187,42 @@ def load_progress():
         logging.error(f"無法載入進度: {e}")
         return None
 
-def timeout_handler():
+def _completed_journal_path():
+    # 並行建立基準線的逐檔進度：與進度檔同目錄，每完成一個檔案附加一行路徑
+    return _resume_file_path() + '.done'
+
+def load_completed_files():
     """
-    超時處理器
+    載入並行建立基準線時已完成的檔案集合
     """
-    while not settings.force_stop and not settings.baseline_completed:
-        time.sleep(10)
-        if settings.current_processing_file and settings.processing_start_time:
-            elapsed = time.time() - settings.processing_start_time
-            if elapsed > settings.FILE_TIMEOUT_SECONDS:
-                print(f"\n超時：檔案處理超過 {settings.FILE_TIMEOUT_SECONDS}s (檔案: {settings.current_processing_file}, 已處理: {elapsed:.1f}s)")
-                settings.current_processing_file = None
-                settings.processing_start_time = None
\ No newline at end of file
+    if not settings.ENABLE_RESUME:
+        return set()
+    try:
+        path = _completed_journal_path()
+        if not os.path.exists(path):
+            return set()
+        with open(path, 'r', encoding='utf-8') as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+    except OSError as e:
+        logging.error(f"無法載入逐檔進度: {e}")
+        return set()
+
+def mark_file_completed(file_path):
+    """
+    記錄單一檔案已完成（附加寫入，不重寫整份清單）
+    """
+    if not settings.ENABLE_RESUME:
+        return
+    try:
+        with open(_completed_journal_path(), 'a', encoding='utf-8') as f:
+            f.write(file_path + '\n')
+    except OSError as e:
+        logging.error(f"無法儲存逐檔進度: {e}")
+
+def clear_completed_files():
+    try:
+        path = _completed_journal_path()
+        if os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        logging.error(f"清理逐檔進度失敗: {e}")
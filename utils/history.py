@@ -10,6 +10,7 @@ import json
 from datetime import datetime
 from typing import Dict, Any, Optional
 import config.settings as settings
+from utils.cell_store import cells_json_default
 
 try:
     from utils.helpers import _baseline_key_for_path
@@ -80,33 +81,8 @@ def compute_change_counters(old_cells: Dict[str, Dict[str, Any]], new_cells: Dic
     計算事件統計計數：dvc/fci/xrlc/xru/addc/delc/total_changes
     與 Compare_Logic 定義一致。
     """
-    from core.comparison import classify_change_type
-    counters = {k: 0 for k in ['dvc','fci','xrlc','xru','addc','delc']}
-    total = 0
-    sheets = set((old_cells or {}).keys()) | set((new_cells or {}).keys())
-    for s in sheets:
-        a = (old_cells or {}).get(s, {})
-        b = (new_cells or {}).get(s, {})
-        addrs = set(a.keys()) | set(b.keys())
-        for addr in addrs:
-            oa = a.get(addr, {})
-            nb = b.get(addr, {})
-            if oa == nb:
-                continue
-            total += 1
-            t = classify_change_type(oa, nb,
-                                     show_external_refresh=True,
-                                     suppress_internal_same_value=False,
-                                     formula_only_mode=False)
-            if t == 'CELL_ADDED': counters['addc'] += 1
-            elif t == 'CELL_DELETED': counters['delc'] += 1
-            elif t == 'DIRECT_VALUE_CHANGE': counters['dvc'] += 1
-            elif t == 'FORMULA_CHANGE_INTERNAL': counters['fci'] += 1
-            elif t == 'EXTERNAL_REF_LINK_CHANGE': counters['xrlc'] += 1
-            elif t == 'EXTERNAL_REFRESH_UPDATE': counters['xru'] += 1
-            # 其他（INDIRECT/NO_CHANGE）不計入上述細項，但 total 仍計
-    counters['total_changes'] = total
-    return counters
+    from core.comparison import DiffResult
+    return DiffResult.compute(old_cells or {}, new_cells or {}).counters
 
 
 def insert_event_index(file_path: str,
@@ -118,16 +94,19 @@ def insert_event_index(file_path: str,
                         snapshot_path: Optional[str] = None,
                         summary_path: Optional[str] = None,
                         git_commit_sha: Optional[str] = None,
-                        db_path: Optional[str] = None) -> None:
+                        db_path: Optional[str] = None,
+                        counters: Optional[Dict[str, int]] = None) -> None:
     """
     根據 counters 與路徑資訊，插入一筆事件索引到 SQLite。
+    counters：已由同一次比對（core.comparison.DiffResult）算好的統計；未提供時才重新計算。
     """
     try:
         from utils.helpers import _baseline_key_for_path
         from utils.events_db import insert_event as _insert, ensure_db
         base_key = _baseline_key_for_path(file_path)
         ensure_db(db_path)
-        counters = compute_change_counters(old_cells or {}, new_cells or {})
+        if counters is None:
+            counters = compute_change_counters(old_cells or {}, new_cells or {})
         # 檔案 stat
         try:
             excel_mtime = os.path.getmtime(file_path)
@@ -185,7 +164,7 @@ def sync_history_to_git_repo(file_path: str,
         out_name = f"{_now_stamp()}.cells.json"
         out_path = os.path.join(target_dir, out_name)
         with open(out_path, 'w', encoding='utf-8') as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
+            json.dump(payload, f, ensure_ascii=False, indent=2, default=cells_json_default)
         # Commit via GitPython if available
         try:
             import git
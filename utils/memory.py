@@ -7,12 +7,21 @@ import gc
 import logging
 import config.settings as settings
 
-def get_memory_usage():
+def get_memory_usage(include_children=False):
     """
     獲取當前記憶體使用量 (MB)
+    include_children=True 時加上所有子程序（隔離解析的工作程序）的 RSS
     """
     try:
-        return psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024
+        proc = psutil.Process(os.getpid())
+        rss = proc.memory_info().rss
+        if include_children:
+            for child in proc.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+        return rss / 1024 / 1024
     except psutil.NoSuchProcess as e:
         logging.error(f"進程不存在，無法獲取內存使用量: {e}")
         return 0
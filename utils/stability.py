@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+檔案穩定度追蹤 - 輪詢的穩定窗口與複製前的穩定性預檢共用同一份觀察紀錄。
+
+- watchdog 事件（note_event）表示檔案剛被寫入：之前的觀察作廢，穩定窗口從事件時間重新起算。
+- 任何地方取得的 stat（輪詢排程的批次 stat、複製前預檢）都以 observe 記錄；
+  同一個 (mtime, size) 自事件後連續觀察到 checks 次且跨越 (checks - 1) × interval 秒才算穩定。
+- 輪詢判定穩定後以 mark_stable 記錄：之後的複製只需一次 stat 確認未再變動即可開始，不必再等一次預檢窗口。
+"""
+import os
+import time
+import threading
+
+import config.settings as settings
+
+
+class _FileState:
+    __slots__ = ('sig', 'since', 'count', 'event_at', 'stable_sig')
+
+    def __init__(self):
+        self.sig = None
+        self.since = 0.0
+        self.count = 0
+        self.event_at = 0.0
+        self.stable_sig = None
+
+
+class StabilityTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {}
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(str(path)))
+
+    def _state(self, path):
+        key = self._key(path)
+        st = self._files.get(key)
+        if st is None:
+            st = self._files[key] = _FileState()
+        return st
+
+    def note_event(self, path, when=None):
+        """檔案剛被寫入（watchdog 事件、比較發現仍有變更）：穩定窗口重新起算"""
+        with self._lock:
+            st = self._state(path)
+            st.event_at = time.time() if when is None else when
+            st.count = 0
+            st.stable_sig = None
+
+    def observe(self, path, sig, when=None):
+        """記錄一次 (mtime, size)；返回此簽章自最近一次事件後連續觀察到的次數"""
+        when = time.time() if when is None else when
+        with self._lock:
+            st = self._state(path)
+            if sig != st.sig:
+                st.sig = sig
+                st.since = when
+                st.count = 1
+                st.stable_sig = None
+            else:
+                st.count += 1
+            return st.count
+
+    def mark_stable(self, path, sig):
+        with self._lock:
+            st = self._state(path)
+            if st.sig == sig:
+                st.stable_sig = sig
+
+    def is_stable(self, path, sig, checks, interval, now=None):
+        """sig 是否為已知穩定的版本（已標記穩定，或連續觀察 checks 次且跨越足夠時間）"""
+        if checks <= 1:
+            return True
+        now = time.time() if now is None else now
+        with self._lock:
+            st = self._files.get(self._key(path))
+            if st is None or st.sig != sig:
+                return False
+            if st.stable_sig == sig:
+                return True
+            return st.count >= checks and now - max(st.since, st.event_at) >= (checks - 1) * interval
+
+    def forget(self, path):
+        with self._lock:
+            self._files.pop(self._key(path), None)
+
+    def wait_until_stable(self, path, checks, interval, max_wait):
+        """
+        等到檔案穩定（複製前預檢）：已知穩定時只 stat 一次就返回；
+        否則每 interval 秒 stat 一次，期間輪詢或其他呼叫端的觀察一併計入。超過 max_wait 或停止中返回 False。
+        """
+        if checks <= 1:
+            return True
+        start = time.time()
+        while True:
+            if getattr(settings, 'force_stop', False):
+                return False
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            sig = (st.st_mtime, st.st_size)
+            self.observe(path, sig)
+            if self.is_stable(path, sig, checks, interval):
+                return True
+            if max_wait is not None and (time.time() - start) >= max_wait:
+                return False
+            time.sleep(max(0.0, interval))
+
+
+# 全域穩定度追蹤（watcher 與快取複製共用）
+stability_tracker = StabilityTracker()
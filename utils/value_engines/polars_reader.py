@@ -1,17 +1,46 @@
-from typing import Dict, Optional
-from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+from io import BytesIO, StringIO
 import subprocess
 import sys
 import os
 
+from utils.value_engines.stream_reader import col_letters
+
 # Polars-based value reader via xlsx2csv -> CSV in-memory
 
+def _xlsx2csv_in_process(xlsx_path: str) -> Dict[str, bytes]:
+    """
+    Convert each worksheet to CSV bytes with the xlsx2csv library in this process.
+    The workbook zip and shared strings are opened once and reused for every sheet.
+    Raises ImportError if xlsx2csv is not importable.
+    """
+    from xlsx2csv import Xlsx2csv
+    sheets: Dict[str, bytes] = {}
+    conv = Xlsx2csv(xlsx_path)
+    for i, sh in enumerate(conv.workbook.sheets, start=1):
+        name = sh.get('name') or f"sheet{i}"
+        buf = StringIO()
+        try:
+            conv.convert(buf, sheetid=sh.get('index', i))
+        except Exception as e:
+            print(f"   [polars-xlsx2csv] convert sheet#{i} name='{name}' err={str(e)[:200]}")
+            continue
+        sheets[name] = buf.getvalue().encode('utf-8')
+    return sheets
+
+
 def _xlsx2csv_to_bytes(xlsx_path: str, sheet_count: int | None = None) -> Dict[str, bytes]:
     """
     Convert each worksheet to CSV bytes via xlsx2csv.
     Returns: { sheet_name: csv_bytes }
+    Uses the library in-process; falls back to one `python -m xlsx2csv` per sheet
+    only when the in-process conversion is unavailable or fails.
     Prints diagnostic info (rc/stdout/stderr) for troubleshooting.
     """
+    try:
+        return _xlsx2csv_in_process(xlsx_path)
+    except Exception as e:
+        print(f"   [polars-xlsx2csv] in-process unavailable ({type(e).__name__}: {str(e)[:200]}), using subprocess")
     sheets: Dict[str, bytes] = {}
     # List sheets
     try:
@@ -53,6 +82,42 @@ def _xlsx2csv_to_bytes(xlsx_path: str, sheet_count: int | None = None) -> Dict[s
     return sheets
 
 
+def _frame_to_cells(df) -> Tuple[List[str], list]:
+    """
+    Wide -> long for one sheet: returns (addresses, values) in row-major order (A1, B1, ..., A2, ...),
+    the same order as the former per-row loop.
+    Row numbers, blank filtering and 'A1' address strings are built as Polars
+    expressions per column, so each column keeps its inferred dtype (int/float/str)
+    instead of being coerced to a common supertype by a full unpivot; the columns
+    are then interleaved back into row order with one arg_sort on the cell index.
+    """
+    import polars as pl
+    addrs: List[str] = []
+    values: list = []
+    orders = []
+    row_idx = pl.int_range(0, df.height, eager=False)
+    row_no = (row_idx + 1).cast(pl.Utf8)
+    for c, name in enumerate(df.columns):
+        keep = pl.col('value').is_not_null()
+        if df.schema[name] == pl.Utf8:
+            keep = keep & (pl.col('value') != '')  # skip blanks to align with openpyxl behaviour
+        part = df.lazy().select(
+            (row_idx * df.width + c).alias('order'),
+            pl.concat_str([pl.lit(col_letters(c + 1)), row_no]).alias('address'),
+            pl.col(name).alias('value'),
+        ).filter(keep).collect()
+        if part.height == 0:
+            continue
+        orders.append(part.get_column('order'))
+        addrs.extend(part.get_column('address').to_list())
+        values.extend(part.get_column('value').to_list())
+    if len(orders) > 1:
+        order = pl.concat(orders).arg_sort().to_list()
+        addrs = [addrs[i] for i in order]
+        values = [values[i] for i in order]
+    return addrs, values
+
+
 def read_values_from_xlsx_via_polars(xlsx_path: str, persist_csv: bool=False, persist_dir: Optional[str]=None, sheet_count: int | None = None) -> Dict[str, Dict[str, Optional[str]]]:
     """
     Read display values using xlsx2csv + polars.
@@ -69,7 +134,7 @@ def read_values_from_xlsx_via_polars(xlsx_path: str, persist_csv: bool=False, pe
 
     out: Dict[str, Dict[str, Optional[str]]] = {}
     sheets = _xlsx2csv_to_bytes(xlsx_path, sheet_count=sheet_count)
-    combined_rows = []  # (sheet, address, value)
+    combined_parts = []  # (sheet, addresses, values)
     for name, csv_bytes in (sheets or {}).items():
         try:
             # Read CSV into Polars (in-memory)
@@ -77,33 +142,15 @@ def read_values_from_xlsx_via_polars(xlsx_path: str, persist_csv: bool=False, pe
             if df.height == 0 or df.width == 0:
                 out[name] = {}
                 continue
-            # wide -> long with addresses
-            # rows: 1..N ; cols: 1..M -> address like A1, B2
-            def col_to_letters(n: int) -> str:
-                s = ''
-                while n > 0:
-                    n, r = divmod(n-1, 26)
-                    s = chr(65 + r) + s
-                return s
-            long_rows = []
-            for r in range(df.height):
-                row = df.row(r)
-                for c in range(len(row)):
-                    v = row[c]
-                    if v is None or (isinstance(v, str) and v == ''):
-                        continue  # skip blanks to align with openpyxl behaviour
-                    addr = f"{col_to_letters(c+1)}{r+1}"
-                    # 保留原型別避免假差異
-                    sval = v
-                    long_rows.append((addr, sval))
-                    # 合併 CSV 需字串化
-                    csv_v = '' if v is None else str(v).replace('"','""')
-                    combined_rows.append((name, addr, csv_v))
-            out[name] = {addr: val for addr, val in long_rows}
+            # 保留原型別避免假差異
+            addrs, values = _frame_to_cells(df)
+            out[name] = dict(zip(addrs, values))
+            if persist_csv:
+                combined_parts.append((name, addrs, values))
         except Exception:
             out[name] = {}
     # Persist ONE combined CSV if requested
-    if persist_csv and persist_dir and combined_rows:
+    if persist_csv and persist_dir and combined_parts:
         try:
             base_key = _baseline_key_for_path(xlsx_path)
             values_dir = os.path.join(persist_dir, 'values')
@@ -111,10 +158,11 @@ def read_values_from_xlsx_via_polars(xlsx_path: str, persist_csv: bool=False, pe
             out_path = os.path.join(values_dir, f"{base_key}.values.csv")
             with open(out_path, 'w', encoding='utf-8', newline='') as f:
                 f.write('sheet,address,value\n')
-                for sheet, addr, val in combined_rows:
-                    # escape quotes and commas if necessary (basic CSV)
-                    v = '' if val is None else str(val).replace('"','""')
-                    f.write(f'"{sheet}","{addr}","{v}"\n')
+                for sheet, addrs, values in combined_parts:
+                    for addr, val in zip(addrs, values):
+                        # escape quotes and commas if necessary (basic CSV)
+                        v = '' if val is None else str(val).replace('"','""')
+                        f.write(f'"{sheet}","{addr}","{v}"\n')
         except Exception:
             pass
     return out
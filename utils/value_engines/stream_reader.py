@@ -0,0 +1,374 @@
+import logging
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# 單次串流解析 .xlsx：每張 worksheet XML 只解壓與解析一次，同時取得公式與 cached 值
+# 返回結構：{ sheet_name: { 'A1': {'formula': ..., 'value': ..., 'cached_value': ...}, ... } }
+# 值的表示與 polars_xml 引擎一致（數值保留原始字串、shared string 展開、布林轉 True/False），
+# 公式的表示與 openpyxl 一致（以 '=' 開頭，shared formula 已展開到各儲存格）。
+
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_DOC_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+NS_PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+_TAG_SI = f'{{{NS_MAIN}}}si'
+_TAG_T = f'{{{NS_MAIN}}}t'
+_TAG_ROW = f'{{{NS_MAIN}}}row'
+_TAG_C = f'{{{NS_MAIN}}}c'
+_TAG_F = f'{{{NS_MAIN}}}f'
+_TAG_V = f'{{{NS_MAIN}}}v'
+_TAG_IS = f'{{{NS_MAIN}}}is'
+_TAG_SHEET_DATA = f'{{{NS_MAIN}}}sheetData'
+
+
+def _col_to_letters(n: int) -> str:
+    s = ''
+    while n > 0:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+
+# Excel 最多 16384 欄（XFD）；預先算好欄號 -> 字母，避免每格重算
+MAX_EXCEL_COLUMNS = 16384
+_COL_LETTERS: List[str] = [''] + [_col_to_letters(i) for i in range(1, MAX_EXCEL_COLUMNS + 1)]
+
+
+def col_letters(n: int) -> str:
+    """欄號轉字母（1 -> 'A'），超出 Excel 範圍時退回即時計算。"""
+    if 0 < n <= MAX_EXCEL_COLUMNS:
+        return _COL_LETTERS[n]
+    return _col_to_letters(n)
+
+
+def _split_addr(addr: str) -> Tuple[int, int]:
+    # 'AB12' -> (12, 28)
+    col = 0
+    i = 0
+    for i, ch in enumerate(addr):
+        if 'A' <= ch <= 'Z':
+            col = col * 26 + (ord(ch) - 64)
+        elif 'a' <= ch <= 'z':
+            col = col * 26 + (ord(ch) - 96)
+        else:
+            break
+    try:
+        row = int(addr[i:])
+    except ValueError:
+        row = 0
+    return row, col
+
+
+def load_shared_strings(z: zipfile.ZipFile) -> List[str]:
+    """
+    以 iterparse 串流載入 sharedStrings，不建立整棵 XML 樹。
+    每個 <si> 的所有 <t> 文字串接（與 polars_xml 引擎一致）。
+    """
+    sst: List[str] = []
+    if 'xl/sharedStrings.xml' not in z.namelist():
+        return sst
+    try:
+        with z.open('xl/sharedStrings.xml') as f:
+            parts: List[str] = []
+            for event, elem in ET.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    if elem.tag == _TAG_SI:
+                        parts = []
+                    continue
+                if elem.tag == _TAG_T:
+                    parts.append(elem.text or '')
+                elif elem.tag == _TAG_SI:
+                    sst.append(''.join(parts))
+                    elem.clear()
+    except (KeyError, ET.ParseError):
+        pass
+    return sst
+
+
+def workbook_sheet_members(z: zipfile.ZipFile) -> List[Tuple[str, str]]:
+    """
+    依 workbook.xml 的順序返回 [(sheet_name, 'xl/worksheets/sheetN.xml'), ...]。
+    透過 workbook.xml.rels 解析 r:id，只保留一般 worksheet（略過 chartsheet 等）；
+    rels 不可用時退回 sheet{i}.xml 的索引對應。
+    """
+    names = z.namelist()
+    sheets: List[Tuple[str, Optional[str]]] = []
+    try:
+        root = ET.fromstring(z.read('xl/workbook.xml'))
+        for s in root.findall(f'.//{{{NS_MAIN}}}sheet'):
+            nm = s.attrib.get('name')
+            rid = s.attrib.get(f'{{{NS_DOC_REL}}}id')
+            if nm:
+                sheets.append((nm, rid))
+    except (KeyError, ET.ParseError):
+        return []
+
+    targets: Dict[str, str] = {}
+    try:
+        rels = ET.fromstring(z.read('xl/_rels/workbook.xml.rels'))
+        for rel in rels.findall(f'{{{NS_PKG_REL}}}Relationship'):
+            target = rel.attrib.get('Target', '')
+            if target.startswith('/'):
+                member = target.lstrip('/')
+            else:
+                member = posixpath.normpath(posixpath.join('xl', target))
+            targets[rel.attrib.get('Id', '')] = member
+    except (KeyError, ET.ParseError):
+        targets = {}
+
+    out: List[Tuple[str, str]] = []
+    for i, (nm, rid) in enumerate(sheets, start=1):
+        member = targets.get(rid or '') if targets else None
+        if member is None:
+            member = f'xl/worksheets/sheet{i}.xml'
+        if '/worksheets/' not in member or member not in names:
+            continue
+        out.append((nm, member))
+    return out
+
+
+# 任何一個變動都可能影響所有工作表的內容（共用字串、外部連結、工作表名稱/對應）
+_GLOBAL_MEMBERS = ('xl/sharedStrings.xml', 'xl/workbook.xml', 'xl/_rels/workbook.xml.rels')
+_GLOBAL_PREFIXES = ('xl/externalLinks/',)
+
+
+def read_zip_fingerprints(xlsx_path, extra_global: Tuple[str, ...] = ()) -> Dict[str, dict]:
+    """
+    由 zip central directory 取得各 member 的 CRC32 與大小（不需解壓任何內容）。
+    xlsx_path 可為路徑或已開啟的 ZipFile（例如快取租約共用的 handle，不會被關閉）。
+    返回：{ 'members': { member: [crc, size] }, 'sheets': { sheet_name: member } }
+    只記錄 worksheet 與會影響全部工作表的共用 member（sharedStrings、externalLinks 等）。
+    """
+    if not isinstance(xlsx_path, zipfile.ZipFile):
+        with zipfile.ZipFile(xlsx_path, 'r') as z:
+            return read_zip_fingerprints(z, extra_global)
+    z = xlsx_path
+    members: Dict[str, list] = {}
+    for info in z.infolist():
+        name = info.filename
+        if name.startswith('xl/worksheets/') or name in _GLOBAL_MEMBERS or name in extra_global \
+                or name.startswith(_GLOBAL_PREFIXES):
+            members[name] = [info.CRC, info.file_size]
+    sheets = {nm: member for nm, member in workbook_sheet_members(z)}
+    return {'members': members, 'sheets': sheets}
+
+
+def sheets_needing_parse(old_fp: Optional[dict], new_fp: Optional[dict]) -> Optional[set]:
+    """
+    比較兩份 fingerprint，返回需要重新解析的工作表名稱集合。
+    返回 None 代表必須整本重新解析（缺少舊資料，或共用 member 有變動）。
+    """
+    if not old_fp or not new_fp:
+        return None
+    old_members = old_fp.get('members') or {}
+    new_members = new_fp.get('members') or {}
+    old_sheets = old_fp.get('sheets') or {}
+    new_sheets = new_fp.get('sheets') or {}
+    if not old_sheets or not new_sheets:
+        return None
+    global_names = {m for m in set(old_members) | set(new_members)
+                    if not m.startswith('xl/worksheets/')}
+    for m in global_names:
+        if old_members.get(m) != new_members.get(m):
+            return None
+    changed = set()
+    for name, member in new_sheets.items():
+        if old_sheets.get(name) != member or old_members.get(member) != new_members.get(member):
+            changed.add(name)
+    return changed
+
+
+def iter_sheet_cells(z: zipfile.ZipFile, member: str, sst: List[str]) -> Iterator[Tuple[str, Optional[str], object]]:
+    """
+    串流走訪單一 worksheet，逐格產出 (address, formula, value)。
+    - formula：'=' 開頭字串（shared formula 以 openpyxl Translator 展開），無公式為 None
+    - value：cached 值；無 <v>/<is> 的儲存格不產出
+    """
+    translators: Dict[str, object] = {}
+    try:
+        from openpyxl.formula.translate import Translator
+    except Exception:
+        Translator = None
+
+    row_idx = 0
+    col_idx = 0
+    sheet_data = None
+    with z.open(member) as f:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            tag = elem.tag
+            if event == 'start':
+                if tag == _TAG_ROW:
+                    r = elem.attrib.get('r')
+                    row_idx = int(r) if r else row_idx + 1
+                    col_idx = 0
+                elif tag == _TAG_SHEET_DATA:
+                    sheet_data = elem
+                continue
+            if tag == _TAG_ROW:
+                # 每列處理完即釋放，保持記憶體平穩
+                if sheet_data is not None:
+                    sheet_data.clear()
+                else:
+                    elem.clear()
+                continue
+            if tag != _TAG_C:
+                continue
+
+            addr = elem.attrib.get('r')
+            if addr:
+                _, col_idx = _split_addr(addr)
+            else:
+                col_idx += 1
+                addr = f'{col_letters(col_idx)}{row_idx}'
+
+            formula = None
+            f_node = elem.find(_TAG_F)
+            if f_node is not None:
+                formula = '=' + (f_node.text or '')
+                if f_node.attrib.get('t') == 'shared':
+                    si = f_node.attrib.get('si')
+                    if si in translators:
+                        try:
+                            formula = translators[si].translate_formula(addr)
+                        except Exception:
+                            pass
+                    elif formula != '=' and Translator is not None:
+                        try:
+                            translators[si] = Translator(formula, addr)
+                        except Exception:
+                            pass
+
+            has_value = True
+            value = None
+            t = elem.attrib.get('t')
+            v_node = elem.find(_TAG_V)
+            if v_node is None:
+                is_node = elem.find(_TAG_IS)
+                if is_node is not None:
+                    t_node = is_node.find(f'.//{_TAG_T}')
+                    value = t_node.text if t_node is not None else ''
+                else:
+                    has_value = False
+            else:
+                raw = v_node.text
+                if raw is None:
+                    value = None
+                elif t == 's':
+                    try:
+                        i = int(raw)
+                        value = sst[i] if 0 <= i < len(sst) else ''
+                    except ValueError:
+                        value = ''
+                elif t == 'b':
+                    value = raw in ('1', 'true', 'TRUE')
+                else:
+                    value = raw
+
+            if formula is not None or (has_value and value is not None):
+                yield addr, formula, value
+
+
+# --- 多行程逐表解析 ---
+# 每個 worker 行程各自開啟快取 zip 並載入一次 sharedStrings（由 initializer 完成），
+# 之後只接收 worksheet member 名稱，返回精簡的平行串列，避免傳送大量 dict。
+_worker_state: Dict[str, object] = {}
+
+
+def _init_sheet_worker(xlsx_path: str) -> None:
+    z = zipfile.ZipFile(xlsx_path, 'r')
+    _worker_state['zip'] = z
+    _worker_state['sst'] = load_shared_strings(z)
+
+
+def _parse_sheet_worker(member: str) -> Tuple[str, List[str], List[Optional[str]], List[object]]:
+    z = _worker_state['zip']
+    sst = _worker_state['sst']
+    addrs: List[str] = []
+    formulas: List[Optional[str]] = []
+    values: List[object] = []
+    try:
+        for addr, formula, value in iter_sheet_cells(z, member, sst):
+            addrs.append(addr)
+            formulas.append(formula)
+            values.append(value)
+    except (KeyError, ET.ParseError):
+        return member, [], [], []
+    return member, addrs, formulas, values
+
+
+def _parse_sheets_in_pool(xlsx_path: str, members: List[Tuple[str, str]], sizes: Dict[str, int], workers: int) -> Dict[str, tuple]:
+    # 大表先送出，讓各 worker 的負載較平均；結果以 member 為 key，由呼叫方依活頁簿順序合併
+    order = sorted((m for _, m in members), key=lambda m: sizes.get(m, 0), reverse=True)
+    parsed: Dict[str, tuple] = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_sheet_worker, initargs=(xlsx_path,)) as pool:
+        for member, addrs, formulas, values in pool.map(_parse_sheet_worker, order):
+            parsed[member] = (addrs, formulas, values)
+    return parsed
+
+
+def read_cells_from_xlsx_via_stream(xlsx_path: str,
+                                    formula_transform: Optional[Callable[[str], str]] = None,
+                                    on_sheet: Optional[Callable[[int, int, str, int], None]] = None,
+                                    workers: int = 1,
+                                    only_sheets: Optional[set] = None,
+                                    compact: bool = False) -> Dict[str, Dict[str, dict]]:
+    """
+    一次走訪整本活頁簿，直接產生 { sheet: { addr: {formula, value, cached_value} } }。
+    formula_transform：對每個公式做後處理（例如外部參照正規化）。
+    on_sheet(idx, total, name, cell_count)：每張表完成後回呼（供進度輸出）。
+    workers > 1 且多於一張表時，以行程池逐表平行解析，結果依活頁簿順序合併；
+    行程池不可用時自動退回單行程。
+    only_sheets：只解析指定名稱的工作表（其餘工作表不出現在結果中）。
+    compact：每張表直接建成 utils.cell_store.SheetCells（整本共用值池），不產生每格一個 dict。
+    """
+    out: Dict[str, Dict[str, dict]] = {}
+    pool = None
+    if compact:
+        from utils.cell_store import CellPool, SheetCells
+        pool = CellPool()
+    with zipfile.ZipFile(xlsx_path, 'r') as z:
+        members = workbook_sheet_members(z)
+        if only_sheets is not None:
+            members = [(nm, m) for nm, m in members if nm in only_sheets]
+        total = len(members)
+        parsed: Optional[Dict[str, tuple]] = None
+        if workers > 1 and total > 1:
+            sizes = {m: z.getinfo(m).file_size for _, m in members}
+            try:
+                parsed = _parse_sheets_in_pool(xlsx_path, members, sizes, min(workers, total))
+            except Exception as e:
+                logging.warning(f"逐表平行解析失敗，改為單行程解析: {xlsx_path}, {e}")
+                parsed = None
+        sst = load_shared_strings(z) if parsed is None else []
+
+        for idx, (name, member) in enumerate(members, start=1):
+            ws_data = SheetCells(pool) if pool is not None else {}
+            if parsed is not None:
+                addrs, formulas, values = parsed.get(member, ([], [], []))
+                cells = zip(addrs, formulas, values)
+            else:
+                cells = iter_sheet_cells(z, member, sst)
+            try:
+                for addr, formula, value in cells:
+                    if formula and formula_transform is not None:
+                        try:
+                            formula = formula_transform(formula)
+                        except Exception:
+                            pass
+                    if pool is not None:
+                        ws_data.add(addr, formula, value, value)
+                    else:
+                        ws_data[addr] = {"formula": formula, "value": value, "cached_value": value}
+                if pool is not None:
+                    ws_data.freeze()
+            except (KeyError, ET.ParseError):
+                # 單張表失敗不影響其他表
+                ws_data = {}
+            if on_sheet is not None:
+                on_sheet(idx, total, name, len(ws_data))
+            if ws_data:
+                out[name] = ws_data
+    return out